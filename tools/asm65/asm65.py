@@ -2,53 +2,118 @@ import sys
 import os
 import argparse
 
-from lib.asm import Assembler
-
-def write_hex_output(asm, output_file):
-    with open(output_file, "w") as f:
-        # Iterate bytes and print
-        # Assumption: asm.bytes corresponds to [asm.origin ... asm.origin + len]
-        # We print 16 bytes per line
-        start_addr = asm.origin
-        data = asm.bytes
-        
-        for i in range(0, len(data), 16):
-            chunk = data[i:i+16]
-            # Format: 'ADDRESS: B1 B2 ...'
-            # Address is 16-bit hex
-            # Bytes are 2-char hex
-            addr = start_addr + i
-            hex_bytes = " ".join(f"{b:02X}" for b in chunk)
-            f.write(f"{addr:04X}: {hex_bytes}\n")
+from lib.asm import Assembler, parse_define
+from lib.output import write_hex_output, write_output as write_file
 
-if __name__ == "__main__":
+def build_arg_parser():
   parser = argparse.ArgumentParser(description="asm65 - 6502 Assembler")
-  parser.add_argument("input_files", nargs="+", help="Input assembly files")
-  parser.add_argument("output_file", help="Output binary file")
+  parser.add_argument("files", nargs="*", metavar="input_files... output_file", help="Input assembly files followed by the output file")
+  parser.add_argument("-o", "--output", help="Output file, instead of giving it after the input files")
   parser.add_argument("-f", "--format", choices=["bin", "hex"], default="bin", help="Output format (bin is default)")
+  parser.add_argument("-c", "--compile-only", action="store_true", help="Write a relocatable object file for link65 instead of a program")
+  parser.add_argument("-C", "--config", metavar="FILE", help="Place the .segment sections by a link65 memory config instead of .org")
+  parser.add_argument("--map", action="store_true", help="With -C, print where each segment went and the free memory left")
   parser.add_argument("-D", "--define", action="append", help="Define symbol (e.g. -DDEBUG or -DMAX_LINES=10)")
-  
-  args = parser.parse_args()
+  parser.add_argument("-P", "--preprocess", action="store_true", help="Resolve conditionals against the -D defines while parsing, skipping dead blocks")
+  parser.add_argument("-O", "--optimize", action="store_true", help="Run the peephole optimizer (all rules unless --opt picks some)")
+  parser.add_argument("--opt", metavar="RULE", action="append", help="Enable one optimizer rule (implies -O); repeatable")
+  parser.add_argument("--no-opt", metavar="RULE", action="append", help="Disable one optimizer rule; repeatable")
+  parser.add_argument("--cycles", action="store_true", help="Report min/max cycles per instruction, basic block, routine and loop")
+  parser.add_argument("--page-check", action="store_true", help="Warn about branches and indexed table accesses that cross page boundaries")
+  parser.add_argument("--strip-unreferenced", action="store_true", help="Drop routines that cannot be reached from the entry labels and .export'ed symbols")
+  parser.add_argument("--entry", metavar="LABEL", action="append", help="Entry label for --strip-unreferenced (default: the first label); repeatable")
+  parser.add_argument("--zp-map", action="store_true", help="Print where each .zpvar was placed")
+  parser.add_argument("--stats", action="store_true", help="Report per-phase timing and throughput")
+  parser.add_argument("--stats-memory", action="store_true", help="Also trace peak memory for --stats (the phases are then timed under tracemalloc)")
+  parser.add_argument("--stats-json", metavar="FILE", help="Write the build statistics as JSON to FILE")
+  parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of the assembly to FILE")
+  parser.add_argument("--batch", metavar="MANIFEST", help="Build every job in a JSON manifest, each in isolation")
+  parser.add_argument("--matrix", metavar="NAME:DEFS", action="append", help="Build a variant per define set (e.g. release: or debug:DEBUG,MAX_LINES=10), parsing the source once")
+  parser.add_argument("-j", "--jobs", type=int, help="Worker processes for --batch and --matrix (default: CPU count)")
+  return parser
+
+def parse_args(argv=None):
+  parser = build_arg_parser()
+  args = parser.parse_args(argv)
+  if args.batch:
+      if args.files:
+          parser.error("--batch does not take input or output files")
+      return args
+  if args.output is not None:
+      if not args.files:
+          parser.error("expected one or more input files")
+      args.input_files = args.files
+      args.output_file = args.output
+  elif args.compile_only and len(args.files) == 1:
+      # module.asm -> module.o65
+      args.input_files = args.files
+      args.output_file = os.path.splitext(args.files[0])[0] + ".o65"
+  elif len(args.files) < 2:
+      parser.error("expected one or more input files followed by an output file")
+  else:
+      args.input_files = args.files[:-1]
+      args.output_file = args.files[-1]
+  if args.compile_only:
+      if args.config:
+          parser.error("-C links the program and cannot be combined with -c")
+      args.format = "o65"
+  return args
+
+def run_batch(args):
+  import time
+  from lib.batch import load_manifest, run_batch as run_jobs, format_summary
+
+  try:
+      jobs = load_manifest(args.batch, include_paths=[default_include_dir()])
+  except (OSError, ValueError, KeyError) as e:
+      print(f"Error: could not load manifest {args.batch}: {e}", file=sys.stderr)
+      sys.exit(1)
+
+  start = time.perf_counter()
+  results = run_jobs(jobs, args.jobs)
+  print(format_summary(results, time.perf_counter() - start))
+  if any(r.error is not None for r in results):
+      sys.exit(1)
 
+def default_include_dir():
   script_dir = os.path.dirname(os.path.abspath(__file__))
-  global_include = os.path.join(script_dir, "include")
-  
-  asm = Assembler(include_paths=[global_include])
-  
+  # When run from the zipapp, __file__ is inside the archive and the
+  # include directory ships next to the .pyz file instead
+  if os.path.isfile(script_dir):
+      script_dir = os.path.dirname(script_dir)
+  return os.path.join(script_dir, "include")
+
+def optimizer_rules(args):
+  """The peephole rules selected by -O/--opt/--no-opt, or None if the optimizer is off."""
+  from lib.peephole import RULES
+  if not (args.optimize or args.opt):
+      return None
+  rules = args.opt or list(RULES)
+  unknown = [rule for rule in rules + (args.no_opt or []) if rule not in RULES]
+  if unknown:
+      print(f"Error: unknown optimizer rule(s) {', '.join(unknown)}; known: {', '.join(RULES)}", file=sys.stderr)
+      sys.exit(1)
+  return [rule for rule in rules if rule not in (args.no_opt or [])]
+
+def assemble(args, stats=None):
+  global_include = default_include_dir()
+
+  asm = Assembler(include_paths=[global_include], stats=stats, preprocess=args.preprocess,
+                  listing=args.cycles or args.page_check, optimize=optimizer_rules(args),
+                  strip=args.strip_unreferenced, entries=args.entry, objects=args.compile_only or bool(args.config))
+
   # Inject definitions
   if args.define:
       for define in args.define:
-          parts = define.split('=')
-          name = parts[0]
-          val = 1
-          if len(parts) > 1:
-              try:
-                  val = int(parts[1], 0) # Handle 0x prefix
-              except ValueError:
-                  print(f"Invalid value for definition {name}: {parts[1]}")
-                  sys.exit(1)
-          asm.symbols.set(name, val)
+          try:
+              name, val = parse_define(define)
+          except ValueError as e:
+              print(e)
+              sys.exit(1)
+          asm.define(name, val)
 
+  # Stripping needs every reference, so then all files are compiled together
+  statements = []
   for input_file in args.input_files:
     if not os.path.exists(input_file):
       print(f"Error: {input_file} does not exist")
@@ -58,16 +123,124 @@ if __name__ == "__main__":
       print(f"Assembling {input_file}")
       try:
           asm.assemble_stream(f, input_file)
-          asm.parse()
-      except Exception as e:
-          # Check for our known errors
-          # We import them locally to avoid top-level import issues or just use name check
-          name = type(e).__name__
-          if name in ['AssemblyError', 'CompilerError', 'ParserError']:
-              print(f"Error: {e}", file=sys.stderr)
-              sys.exit(1)
+          if args.strip_unreferenced:
+              statements.extend(asm.parse_program().statements)
           else:
-              raise
+              asm.parse()
+      except Exception as e:
+          report_error(e)
+  if args.strip_unreferenced:
+      from lib.ast import Program
+      try:
+          asm.compile(Program(statements))
+      except Exception as e:
+          report_error(e)
+  return asm
+
+def report_error(e):
+  # Check for our known errors
+  # We import them locally to avoid top-level import issues or just use name check
+  name = type(e).__name__
+  if name in ['AssemblyError', 'CompilerError', 'ParserError']:
+      print(f"Error: {e}", file=sys.stderr)
+      sys.exit(1)
+  raise e
+
+def write_output(asm, args):
+  if args.config:
+      link_output(asm, args)
+      return
+  write_file(asm, args.output_file, args.format)
+  if args.format == "o65":
+      obj = asm.compiler.object_file()
+      print(f"Written {obj.size} bytes in {len(obj.sections)} section(s) to {args.output_file} (object)")
+      return
+  kind = "binary" if args.format == "bin" else args.format
+  print(f"Written {len(asm.compiler.bytes)} bytes to {args.output_file} ({kind})")
+
+def link_output(asm, args):
+  # -C: the program is one object, linked in memory
+  from lib.linker import LinkError, link, load_config
+  from lib.output import write_chunks
+
+  obj = asm.compiler.object_file()
+  obj.filename = args.input_files[0]
+  try:
+      result = link([obj], load_config(args.config))
+  except (OSError, LinkError) as e:
+      print(f"Error: {e}", file=sys.stderr)
+      sys.exit(1)
+  kind = "binary" if args.format == "bin" else args.format
+  for path, start, size in write_chunks(result.chunks, args.output_file, args.format):
+      print(f"Written {size} bytes at ${start:04X} to {path} ({kind})")
+  if args.map:
+      print(result.format_map())
+
+def run_matrix(args):
+  import time
+  from lib.asm import AssemblyError
+  from lib.ast import Program
+  from lib.batch import parse_variant, run_matrix as run_variants, format_summary
+  from lib.parser import ParserError
+
+  try:
+      variants = [parse_variant(spec) for spec in args.matrix]
+      base_defines = dict(parse_define(d) for d in args.define or [])
+  except ValueError as e:
+      print(f"Error: {e}", file=sys.stderr)
+      sys.exit(1)
+  for variant in variants:
+      variant.defines = {**base_defines, **variant.defines}
+
+  # Parse once; conditionals stay in the AST and are chosen per variant
+  start = time.perf_counter()
+  asm = Assembler(include_paths=[default_include_dir()])
+  statements = []
+  for input_file in args.input_files:
+      try:
+          with open(input_file, "r") as f:
+              asm.assemble_stream(f, input_file)
+              statements.extend(asm.parse_program().statements)
+      except (OSError, AssemblyError, ParserError) as e:
+          print(f"Error: {e}", file=sys.stderr)
+          sys.exit(1)
+  print(f"Parsed {', '.join(args.input_files)} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+  start = time.perf_counter()
+  results = run_variants(Program(statements), variants, output=args.output_file,
+                         format=args.format, workers=args.jobs)
+  print(format_summary(results, time.perf_counter() - start))
+  if any(r.error is not None for r in results):
+      sys.exit(1)
+
+def main(argv=None):
+  args = parse_args(argv)
+  if args.batch:
+      run_batch(args)
+      return
+  if args.matrix:
+      run_matrix(args)
+      return
+
+  stats = None
+  if args.stats or args.stats_json or args.stats_memory:
+      from lib.stats import BuildStats
+      # tracemalloc slows the tokenizer and parser a lot, so it is opt-in
+      stats = BuildStats(trace_memory=args.stats_memory)
+      stats.start_memory()
+
+  profiler = None
+  if args.profile:
+      import cProfile
+      profiler = cProfile.Profile()
+      profiler.enable()
+
+  asm = assemble(args, stats)
+
+  if profiler is not None:
+      profiler.disable()
+  if stats is not None:
+      stats.stop_memory()
 
   # dump symbol table to stdout (optional, maybe suppress?)
   # Keeping it as is helpful for debugging
@@ -83,11 +256,55 @@ if __name__ == "__main__":
   print()
 
   # Write output
-  if args.format == "bin":
-      with open(args.output_file, "wb") as f:
-          f.write(bytearray(asm.bytes))
-      print(f"Written {len(asm.bytes)} bytes to {args.output_file} (binary)")
-  elif args.format == "hex":
-      write_hex_output(asm, args.output_file)
-      print(f"Written {len(asm.bytes)} bytes to {args.output_file} (hex)")
+  if stats is not None:
+      with stats.phase('output'):
+          write_output(asm, args)
+  else:
+      write_output(asm, args)
+
+  if asm.optimization is not None:
+      print(asm.optimization.format(details=True))
+
+  for warning in asm.compiler.warnings:
+      print(f"Warning: {warning}", file=sys.stderr)
+
+  if asm.stripped is not None:
+      print(asm.stripped.format())
+
+  for report in asm.compiler.dispatches + asm.compiler.unrolled:
+      print(report.format())
+
+  if args.zp_map:
+      print(asm.compiler.zero_page.format())
 
+  if args.cycles:
+      from lib.cycles import analyze, format_report
+      print(format_report(analyze(asm.compiler.listing, asm.compiler.listing_labels)))
+
+  if args.page_check:
+      from lib.cycles import page_diagnostics
+      messages = page_diagnostics(asm.compiler.listing, asm.compiler.listing_labels, asm.compiler.listing_data)
+      for message in messages:
+          print(f"Page crossing: {message}")
+      print(f"{len(messages)} page crossing(s) found")
+
+  if profiler is not None:
+      from lib.stats import profile_summary
+      profiler.dump_stats(args.profile)
+      hotspots = profile_summary(profiler)
+      print(f"Profile written to {args.profile}; hottest lib/ functions:")
+      for entry in hotspots[:10]:
+          print(f"  {entry['tottime'] * 1000:8.2f} ms {entry['calls']:>8}  {entry['file']}:{entry['line']}({entry['function']})")
+      if stats is not None:
+          stats.hotspots = hotspots
+
+  if stats is not None:
+      if args.stats or (args.stats_memory and not args.stats_json):
+          print(stats.format())
+      if args.stats_json:
+          import json
+          with open(args.stats_json, "w") as f:
+              json.dump(stats.as_dict(), f, indent=2)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from lib.asm import Assembler
+from lib.stats import BuildStats, PHASES
+from benchmarks.generate import SourceConfig, write_source
+
+ASM_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GLOBAL_INCLUDE = os.path.join(ASM_DIR, "include")
+MINIED = os.path.join(ASM_DIR, "examples", "minied", "minied.asm")
+
+# Synthetic cases, each stressing one knob of the generator
+CASES = {
+    "small": SourceConfig(lines=500),
+    "large": SourceConfig(lines=8000),
+    "labels": SourceConfig(lines=4000, label_density=0.5),
+    "locals": SourceConfig(lines=4000, local_reuse=12),
+    "includes": SourceConfig(lines=4000, include_depth=8),
+    "table": SourceConfig(lines=500, table_size=16384),
+    "forward": SourceConfig(lines=4000, forward_ratio=1.0),
+}
+
+# Phases shorter than this are too noisy to flag as regressions
+MIN_SECONDS = 0.002
+
+def measure(path: str, repeat: int) -> dict:
+    """Assembles path `repeat` times and keeps the fastest time of each phase."""
+    best = None
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_path = os.path.join(out_dir, "out.bin")
+        for _ in range(repeat):
+            stats = BuildStats()
+            asm = Assembler(include_paths=[GLOBAL_INCLUDE], stats=stats)
+            with open(path, "r") as f:
+                asm.assemble_stream(f, path)
+            asm.parse()
+            with stats.phase('output'):
+                with open(out_path, "wb") as f:
+                    f.write(bytes(asm.compiler.bytes))
+            data = stats.as_dict()
+            if best is None:
+                best = data
+                continue
+            for phase in PHASES:
+                best['phases'][phase] = min(best['phases'][phase], data['phases'][phase])
+    best['total'] = sum(best['phases'].values())
+    return {'phases': best['phases'], 'total': best['total'], 'counts': best['counts']}
+
+def run(cases: list, repeat: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as src_dir:
+        for name in cases:
+            if name == "minied":
+                path = MINIED
+            else:
+                path = write_source(CASES[name], os.path.join(src_dir, name), name)
+            results[name] = measure(path, repeat)
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns a list of regression messages (empty if none)."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        checks = [('total', result['total'], base['total'])]
+        checks += [(p, result['phases'].get(p, 0.0), base['phases'].get(p, 0.0)) for p in PHASES]
+        for label, current, previous in checks:
+            if previous < MIN_SECONDS:
+                continue
+            change = (current - previous) / previous
+            if change > threshold:
+                regressions.append(f"{name}/{label}: {previous * 1000:.2f} ms -> {current * 1000:.2f} ms (+{change * 100:.0f}%)")
+    return regressions
+
+def format_results(results: dict, baseline: dict = None) -> str:
+    header = f"{'case':<10}" + "".join(f"{p:>11}" for p in PHASES) + f"{'total':>11}{'vs base':>9}"
+    lines = [header]
+    for name, result in results.items():
+        row = f"{name:<10}" + "".join(f"{result['phases'][p] * 1000:9.2f}ms" for p in PHASES)
+        row += f"{result['total'] * 1000:9.2f}ms"
+        if baseline and name in baseline and baseline[name]['total'] > 0:
+            row += f"{(result['total'] / baseline[name]['total'] - 1) * 100:+8.0f}%"
+        lines.append(row)
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="asm65 benchmark suite")
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all of minied, {', '.join(CASES)})")
+    parser.add_argument("--baseline", metavar="FILE", help="Baseline JSON to compare against (created if missing)")
+    parser.add_argument("--save", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case; the fastest is kept")
+    parser.add_argument("--json", metavar="FILE", help="Write this run's results to FILE")
+    args = parser.parse_args(argv)
+
+    cases = args.cases or ["minied"] + list(CASES)
+    unknown = [c for c in cases if c != "minied" and c not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+
+    results = run(cases, args.repeat)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(format_results(results, baseline))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline and baseline is None:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold * 100:.0f}%:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"No regressions beyond {args.threshold * 100:.0f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
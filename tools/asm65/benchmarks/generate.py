@@ -0,0 +1,93 @@
+import os
+import random
+from dataclasses import dataclass
+
+@dataclass
+class SourceConfig:
+    """Knobs for a synthetic 6502 program."""
+    lines: int = 2000            # approximate number of source lines
+    label_density: float = 0.1   # fraction of body lines preceded by a named label
+    local_reuse: int = 2         # numeric local-label loops per routine (reusing `1:`)
+    include_depth: int = 0       # depth of the nested .include chain
+    table_size: int = 256        # entries in the trailing .byte table
+    forward_ratio: float = 0.5   # fraction of JSR/JMP/LDA operands that are forward references
+    routine_lines: int = 40      # body lines per routine
+    seed: int = 6502
+
+class SourceGenerator:
+    def __init__(self, config: SourceConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.labels = 0
+
+    def generate(self) -> list:
+        """Returns the program as a list of chunks, one per source file."""
+        cfg = self.config
+        routines = max(1, cfg.lines // (cfg.routine_lines + 2))
+        names = [f"r{i}" for i in range(routines)]
+        chunks = [[] for _ in range(cfg.include_depth + 1)]
+        per_chunk = -(-routines // len(chunks))
+
+        for index, name in enumerate(names):
+            chunk = chunks[min(index // per_chunk, len(chunks) - 1)]
+            chunk.extend(self.routine(index, names))
+
+        chunks[-1].append("table:")
+        for i in range(0, cfg.table_size, 16):
+            row = ", ".join(f"${self.rng.randrange(256):02X}" for _ in range(min(16, cfg.table_size - i)))
+            chunks[-1].append(f"    .byte {row}")
+        return chunks
+
+    def target(self, index: int, names: list) -> str:
+        ahead = names[index + 1:]
+        behind = names[:index + 1]
+        if ahead and self.rng.random() < self.config.forward_ratio:
+            return self.rng.choice(ahead)
+        return self.rng.choice(behind)
+
+    def routine(self, index: int, names: list) -> list:
+        cfg = self.config
+        rng = self.rng
+        lines = [f"{names[index]}:"]
+        loops = set(rng.sample(range(cfg.routine_lines), min(cfg.local_reuse, cfg.routine_lines)))
+        for i in range(cfg.routine_lines):
+            if rng.random() < cfg.label_density:
+                self.labels += 1
+                lines.append(f"l{self.labels}:")
+            if i in loops:
+                lines.extend(["    ldx #$10", "1:", "    dex", "    bne 1b"])
+                continue
+            kind = rng.randrange(6)
+            if kind == 0:
+                lines.append(f"    lda #${rng.randrange(256):02X}")
+            elif kind == 1:
+                lines.append(f"    sta ${rng.randrange(0x400, 0x800):04X}")
+            elif kind == 2:
+                lines.append(f"    ldy ${rng.randrange(6, 10):02X}")
+            elif kind == 3:
+                lines.append(f"    jsr {self.target(index, names)}")
+            elif kind == 4:
+                lines.append(f"    lda table,x")
+            else:
+                lines.append(f"    lda #<{self.target(index, names)}")
+        lines.append("    rts")
+        return lines
+
+def write_source(config: SourceConfig, directory: str, name: str = "bench") -> str:
+    """
+    Writes a synthetic program to directory and returns the path of the main
+    file. With include_depth > 0 each file includes the next one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    chunks = SourceGenerator(config).generate()
+    paths = [os.path.join(directory, f"{name}.asm")]
+    paths += [os.path.join(directory, f"{name}_inc{i}.inc") for i in range(1, len(chunks))]
+
+    for i, (path, chunk) in enumerate(zip(paths, chunks)):
+        lines = [".org $0800"] if i == 0 else []
+        lines.extend(chunk)
+        if i + 1 < len(paths):
+            lines.append(f'.include "{os.path.basename(paths[i + 1])}"')
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return paths[0]
@@ -2,11 +2,10 @@ import os
 
 from .tokenizer import Token, TokenType, Tokenizer
 from .symtab import SymbolTable
-from .bytes import ByteConverter
 from .string import str_compare
-from .opcodes import OPCODES
 from .compiler import Compiler
-from .ast import Unresolved
+from .parser import Parser
+from .ast import Program, Unresolved
 
 class AssemblyError(Exception):
   def __init__(self, msg: str, token: Token):
@@ -31,10 +30,35 @@ class Unresolved:
   def __repr__(self):
     return f"Unresolved({self.name}, {self.type})"
 
+def parse_define(define: str) -> tuple:
+  """Parses a -D style definition ('NAME' or 'NAME=value') into (name, value)."""
+  parts = define.split('=')
+  name = parts[0]
+  val = 1
+  if len(parts) > 1:
+    try:
+      val = int(parts[1], 0) # Handle 0x prefix
+    except ValueError:
+      raise ValueError(f"Invalid value for definition {name}: {parts[1]}")
+  return name, val
+
 class Assembler:
-  def __init__(self, include_paths=None):
+  def __init__(self, include_paths=None, stats=None, cpu: str = "6502", preprocess: bool = False,
+               listing: bool = False, optimize=None, strip: bool = False, entries=None, objects: bool = False):
     self.lex = None
-    self.compiler = Compiler()
+    self.stats = stats
+    # Decide conditionals while parsing, against the defines given so far
+    self.preprocess = preprocess
+    self.defines = {}
+    # objects: build a relocatable object for the linker (see objfile.py)
+    self.compiler = Compiler(stats=stats, cpu=cpu, listing=listing, objects=objects)
+    # Peephole rules to apply before layout (see peephole.py); None turns the pass off
+    self.optimize = optimize
+    self.optimization = None
+    # Drop routines unreachable from the entry labels (see reachability.py)
+    self.strip = strip
+    self.entries = entries or []
+    self.stripped = None
     self.include_paths = include_paths or []
     self._bytes = []
     
@@ -77,17 +101,57 @@ class Assembler:
     return self.compiler.symbols
 
   def assemble_stream(self, stream, filename: str = None):
-    self.lex = Tokenizer(stream, filename)
+    if self.stats is None:
+      self.lex = Tokenizer(stream, filename)
+      return
+    with self.stats.phase('tokenize'):
+      self.lex = Tokenizer(stream, filename)
+
+  def define(self, name: str, value: int = 1):
+    self.defines[name] = value
+    self.symbols.set(name, value)
 
   def parse(self):
-    from .parser import Parser
-    
-    parser = Parser(self.lex, self.include_paths)
-    program = parser.parse_program()
-    
+    self.compile(self.parse_program())
+
+  def compile(self, program: Program):
+    if self.strip:
+      from .reachability import strip_unreferenced
+      program, self.stripped = strip_unreferenced(program, self.compiler, self.entries)
+    if self.optimize is not None:
+      program = self.run_optimizer(program)
     self.compiler.compile(program)
     # self._bytes = self.compiler.bytes # Virtual property handles this
 
+  def run_optimizer(self, program: Program) -> Program:
+    from .peephole import OptimizationReport, optimize
+    if self.optimization is None:
+      self.optimization = OptimizationReport()
+    if self.stats is None:
+      program, report = optimize(program, self.compiler, self.optimize)
+    else:
+      with self.stats.phase('optimize'):
+        program, report = optimize(program, self.compiler, self.optimize)
+      self.stats.count('optimizations', len(report.changes))
+    self.optimization.changes.extend(report.changes)
+    return program
+
+  def parse_program(self) -> Program:
+    # Parse the current stream without compiling it
+    defines = self.defines if self.preprocess else None
+    parser = Parser(self.lex, self.include_paths, stats=self.stats, defines=defines)
+    if self.stats is None:
+      program = parser.parse_program()
+    else:
+      from .stats import count_statements
+      # Parser accounts token time itself; keep it out of the parse phase
+      tokenize_before = self.stats.times['tokenize']
+      with self.stats.phase('parse'):
+        program = parser.parse_program()
+      self.stats.times['parse'] -= self.stats.times['tokenize'] - tokenize_before
+      self.stats.count('statements', count_statements(program.statements))
+    return program
+
   def parse_expr(self, required_type: type = None) -> 'int | str | Unresolved | None':
     if tok := self.expect(TokenType.OP, "<"):
       # low byte
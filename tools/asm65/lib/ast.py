@@ -1,4 +1,4 @@
-from typing import List, Union, Optional
+from typing import List, Tuple, Union, Optional
 from dataclasses import dataclass
 
 @dataclass
@@ -34,8 +34,9 @@ class Assignment(Statement):
 @dataclass
 class Directive(Statement):
     name: str
-    args: List[Union[int, str, Unresolved]]
+    args: List[Union[int, str, bytes, Unresolved]]
     line: int = 0
+    size: Optional[int] = None # Bytes emitted, when known at parse time
 
 @dataclass
 class Instruction(Statement):
@@ -43,6 +44,7 @@ class Instruction(Statement):
     mode: str
     operand: Union[int, str, Unresolved, None]
     line: int = 0
+    operand_label: Optional[str] = None # Names the operand field, for self-modifying code
 
 @dataclass
 class BinaryExpr(Node):
@@ -56,6 +58,27 @@ class IfDef(Statement):
     then_block: List[Statement]
     else_block: List[Statement]
     line: int = 0
+    negate: bool = False # .ifndef
+
+@dataclass
+class StringPool(Statement):
+    data: bytes # Pooled strings, already deduplicated
+    labels: List[Tuple[str, int]] # Label name and offset into data
+    saved: int = 0 # Bytes saved compared to emitting every string
+    line: int = 0
+
+@dataclass
+class PageBlock(Statement):
+    kind: str # 'hot' (.hot, padded with NOPs) or 'table' (.table_aligned, padded with 0)
+    statements: List[Statement]
+    line: int = 0
+
+@dataclass
+class If(Statement):
+    condition: Union[int, Unresolved, BinaryExpr]
+    then_block: List[Statement]
+    else_block: List[Statement]
+    line: int = 0
 
 @dataclass
 class EnumDef(Statement):
@@ -64,3 +87,49 @@ class EnumDef(Statement):
     members: List[tuple] # (name, value_expr|None)
     line: int = 0
 
+
+@dataclass
+class Table(Statement):
+    name: str
+    count: Union[int, Unresolved, BinaryExpr]
+    kind: str # 'byte', 'word' or 'split' (see tables.py)
+    expression: object # tables.TableExpression
+    data: Optional[bytes] = None # Generated at parse time when nothing depends on symbols
+    line: int = 0
+
+@dataclass
+class StructDef(Statement):
+    name: str
+    fields: List[tuple] # (name, size_expr)
+    line: int = 0
+
+@dataclass
+class StructInstance(Statement):
+    name: str
+    struct: str
+    count: Union[int, Unresolved, BinaryExpr]
+    layout: str # 'aos' or 'soa' (see structs.py)
+    page: bool = False # .soa: start every array on a page
+    line: int = 0
+
+@dataclass
+class Dispatch(Statement):
+    name: str
+    entries: List[tuple] # (key_expr, handler_expr)
+    default: Union[int, Unresolved, BinaryExpr, None] = None # Handler for keys with no entry
+    line: int = 0
+
+@dataclass
+class Repeat(Statement):
+    count: Union[int, Unresolved, BinaryExpr]
+    statements: List[Statement] # Parsed once and assembled count times
+    locals: List[str] # .local names, renamed on every iteration
+    var: Optional[str] = None # Symbol set to the iteration number (0..count-1)
+    line: int = 0
+
+@dataclass
+class MacroCall(Statement):
+    name: str
+    statements: List[Statement] # Shared by every call with the same arguments
+    locals: List[str] # .local names, renamed on every call
+    line: int = 0
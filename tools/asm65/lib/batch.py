@@ -0,0 +1,205 @@
+import os
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .asm import Assembler, AssemblyError, parse_define
+from .ast import Program
+from .compiler import CompilerError
+from .parser import ParserError
+from .output import write_output
+
+# Errors reported per job instead of aborting the whole batch
+BUILD_ERRORS = (AssemblyError, CompilerError, ParserError, OSError, ValueError)
+
+@dataclass
+class BuildJob:
+    """One independent program in a batch manifest."""
+    name: str
+    sources: List[str]
+    output: Optional[str] = None
+    defines: Dict[str, int] = field(default_factory=dict)
+    cpu: str = "6502"
+    format: str = "bin"
+    include_paths: List[str] = field(default_factory=list)
+    preprocess: bool = False
+
+@dataclass
+class JobResult:
+    name: str
+    output: Optional[str]
+    size: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+def _parse_defines(defines) -> Dict[str, int]:
+    # Manifests may give defines as {"NAME": value} or ["NAME", "NAME=value"]
+    if isinstance(defines, dict):
+        return {name: (1 if value is None else int(value)) for name, value in defines.items()}
+    return dict(parse_define(d) for d in defines)
+
+def load_manifest(path: str, include_paths: List[str] = None) -> List[BuildJob]:
+    """
+    Reads a batch manifest. Source, output and include paths are relative to
+    the manifest; an optional top-level "output_dir" prefixes relative outputs.
+
+        {"output_dir": "build",
+         "jobs": [{"name": "minied", "sources": ["minied.asm"],
+                   "defines": {"DEBUG": 1}, "cpu": "6502",
+                   "output": "minied.bin", "format": "bin",
+                   "preprocess": true}]}
+
+    A job with format "o65" writes a relocatable object for link65.
+    """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    output_dir = os.path.join(base_dir, manifest.get("output_dir", ""))
+    shared_includes = [os.path.join(base_dir, p) for p in manifest.get("include_paths", [])]
+    shared_includes += include_paths or []
+
+    jobs = []
+    for index, entry in enumerate(manifest.get("jobs", [])):
+        sources = entry.get("sources") or ([entry["source"]] if "source" in entry else [])
+        if not sources:
+            raise ValueError(f"Job {index} in {path} has no sources")
+        name = entry.get("name") or os.path.splitext(os.path.basename(sources[0]))[0]
+        output = entry.get("output")
+        if output is not None:
+            output = os.path.join(output_dir, output)
+        jobs.append(BuildJob(
+            name=name,
+            sources=[os.path.join(base_dir, s) for s in sources],
+            output=output,
+            defines=_parse_defines(entry.get("defines", {})),
+            cpu=entry.get("cpu", "6502").lower(),
+            format=entry.get("format", "bin"),
+            include_paths=[os.path.join(base_dir, p) for p in entry.get("include_paths", [])] + shared_includes,
+            preprocess=bool(entry.get("preprocess", False)),
+        ))
+    return jobs
+
+def build_job(job: BuildJob) -> JobResult:
+    """Assembles one job with a fresh Assembler, so no state leaks between jobs."""
+    start = time.perf_counter()
+    result = JobResult(job.name, job.output)
+    try:
+        asm = Assembler(include_paths=job.include_paths, cpu=job.cpu, preprocess=job.preprocess,
+                        objects=job.format == "o65")
+        for name, value in job.defines.items():
+            asm.define(name, value)
+
+        # All sources of a job form one program
+        statements = []
+        for source in job.sources:
+            with open(source, "r") as f:
+                asm.assemble_stream(f, source)
+            statements.extend(asm.parse_program().statements)
+        asm.compile(Program(statements))
+
+        if job.output:
+            out_dir = os.path.dirname(job.output)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            write_output(asm, job.output, job.format)
+        result.size = asm.compiler.object_file().size if job.format == "o65" else len(asm.compiler.bytes)
+    except BUILD_ERRORS as e:
+        result.error = str(e)
+    result.seconds = time.perf_counter() - start
+    return result
+
+@dataclass
+class Variant:
+    """One define set of a --matrix build."""
+    name: str
+    defines: Dict[str, int] = field(default_factory=dict)
+
+def parse_variant(spec: str) -> Variant:
+    """Parses 'name:DEF,DEF=value' (the define list may be empty)."""
+    name, sep, defines = spec.partition(':')
+    if not sep or not name:
+        raise ValueError(f"Invalid matrix variant '{spec}', expected name:DEF[,DEF=value...]")
+    return Variant(name, dict(parse_define(d) for d in defines.split(',') if d))
+
+def variant_output(output: str, name: str) -> str:
+    # out.bin -> out-debug.bin
+    root, ext = os.path.splitext(output)
+    return f"{root}-{name}{ext}"
+
+# Set once per worker process by the pool initializer, so the parsed
+# program is pickled once per worker rather than once per variant
+_matrix_program = None
+
+def _init_matrix_worker(program: Program):
+    global _matrix_program
+    _matrix_program = program
+
+def compile_variant(program: Program, variant: Variant, cpu: str = "6502",
+                    output: str = None, format: str = "bin") -> JobResult:
+    """Runs only the compile stage of an already parsed program for one define set."""
+    start = time.perf_counter()
+    result = JobResult(variant.name, output)
+    try:
+        asm = Assembler(cpu=cpu)
+        for name, value in variant.defines.items():
+            asm.define(name, value)
+        asm.compile(program)
+        if output:
+            out_dir = os.path.dirname(output)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            write_output(asm, output, format)
+        result.size = len(asm.compiler.bytes)
+    except BUILD_ERRORS as e:
+        result.error = str(e)
+    result.seconds = time.perf_counter() - start
+    return result
+
+def _compile_matrix_job(args) -> JobResult:
+    return compile_variant(_matrix_program, *args)
+
+def run_matrix(program: Program, variants: List[Variant], cpu: str = "6502",
+               output: str = None, format: str = "bin", workers: int = None) -> List[JobResult]:
+    """Compiles one parsed program per variant, in parallel across processes."""
+    jobs = [(v, cpu, variant_output(output, v.name) if output else None, format) for v in variants]
+    workers = min(workers or default_workers(), len(jobs))
+    if workers <= 1:
+        return [compile_variant(program, *job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_matrix_worker, initargs=(program,)) as pool:
+        return list(pool.map(_compile_matrix_job, jobs))
+
+def default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def run_batch(jobs: List[BuildJob], workers: int = None) -> List[JobResult]:
+    """Builds jobs in a process pool; results are returned in job order."""
+    workers = workers or default_workers()
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        return [build_job(job) for job in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(build_job, jobs))
+
+def format_summary(results: List[JobResult], wall_seconds: float = None) -> str:
+    width = max([len(r.name) for r in results] + [3])
+    lines = [f"{'job':<{width}}  {'time':>10}  {'bytes':>7}  status"]
+    for r in results:
+        status = "ok" if r.error is None else f"FAILED: {r.error}"
+        lines.append(f"{r.name:<{width}}  {r.seconds * 1000:8.1f}ms  {r.size:>7}  {status}")
+    failed = sum(1 for r in results if r.error is not None)
+    total = f"{len(results)} job(s), {failed} failed, {sum(r.size for r in results)} bytes"
+    if wall_seconds is not None:
+        cpu = sum(r.seconds for r in results)
+        total += f", {wall_seconds * 1000:.1f}ms wall ({cpu * 1000:.1f}ms summed)"
+    lines.append(total)
+    return "\n".join(lines)
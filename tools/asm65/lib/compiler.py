@@ -1,7 +1,20 @@
-from .ast import Program, Statement, Instruction, Directive, Label, Assignment, Unresolved, BinaryExpr, IfDef, EnumDef
-from .opcodes import OPCODES, OPCODES_6502, OPCODES_65C02
-from .bytes import ByteConverter
+import os
+import math
+import mmap
+import copy
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .ast import Program, Statement, Instruction, Directive, Label, Assignment, Unresolved, BinaryExpr, IfDef, If, EnumDef, StringPool, PageBlock, Table, StructDef, StructInstance, Dispatch, Repeat, MacroCall
+from .opcodes import OPCODES_6502, ACCUMULATOR_IMMEDIATES, INDEX_IMMEDIATES, opcode_table, cpu_names, width_cycles
 from .symtab import SymbolTable
+from .objfile import DEFAULT_SECTION, Export, ObjectFile, Relocation, Section
+from .dispatch import DispatchError, DispatchReport, check_keys, choose_layout, expand, slot_map
+from .string import STRING_DIRECTIVES
+from .structs import StructError, StructLayout, aos_labels, soa_labels
+from .unroll import UNROLL_DIRECTIVES, UnrollError, UnrollReport, check_operands, cycles, index_start, instructions, plan
+from .tables import TableError, entry_size, generate, table_labels
+from .zpalloc import AllocationError, ZeroPageAllocator, ZpVar, count_accesses
 
 class CompilerError(Exception):
     def __init__(self, msg: str, node: Statement = None):
@@ -16,16 +29,79 @@ class CompilerError(Exception):
                  loc += f"{self.node.line}: "
         return f"{loc}{self.msg}"
 
+@dataclass
+class ListingEntry:
+    """One instruction as laid out in pass 2, kept for analysis (see cycles.py)."""
+    pc: int
+    size: int
+    mnemonic: str
+    mode: str # Final mode, after ZP promotion
+    operand: Optional[int] # Resolved operand; the target address for branches
+    cpu: str
+    node: Instruction
+    wide: int = 0 # Extra cycles from 16-bit registers (65816)
+
+# Register widths for immediates on the 65816 (the assembler does not follow REP/SEP)
+WIDTH_DIRECTIVES = ('.a8', '.a16', '.i8', '.i16')
+
 class Compiler:
-    def __init__(self):
+    def __init__(self, stats=None, cpu: str = "6502", listing: bool = False, objects: bool = False):
+        if cpu not in cpu_names():
+            raise CompilerError(f"Unknown CPU mode: {cpu}")
+        self.stats = stats
         self.symbols = SymbolTable()
         self.local_labels = {} # Map name -> List[int]
         self.bytes = bytearray()
         self.origin = 0
         self.pc = 0 # Program Counter
         self.pass_num = 1
-        self.cpu_mode = "6502"
-        self.opcodes = OPCODES_6502
+        self.default_cpu = cpu # CPU in effect at the start of each pass
+        self.cpu_mode = cpu
+        self.opcodes = opcode_table(cpu)
+        # Pass 2 instruction listing and label addresses, when requested.
+        # Like bytes, they accumulate over several compile() calls.
+        self.listing: Optional[List[ListingEntry]] = [] if listing else None
+        self.listing_labels: Dict[int, List[str]] = {}
+        # (start, end) of every data directive in pass 2, with the listing
+        self.listing_data: List[Tuple[int, int]] = []
+        self.warnings: List[str] = []
+        # Padding chosen in pass 1 for each .hot/.table_aligned block, in the
+        # order they are visited: .rept and shared macro expansions visit the
+        # same node several times, each at its own address
+        self.block_padding: List[int] = []
+        self.block_index = 0
+        # Off only for trial layouts, which check branch ranges themselves
+        self.check_branches = True
+        # .zpvar addresses, kept across compile() calls
+        self.zero_page = ZeroPageAllocator()
+        # .struct layouts by name, also kept across compile() calls
+        self.structs: Dict[str, StructLayout] = {}
+        # Pass 2 report of every .dispatch and .unroll_fill/.unroll_copy
+        self.dispatches: List[DispatchReport] = []
+        self.unrolled: List[UnrollReport] = []
+        # .local renames of the .rept iterations and macro calls being
+        # assembled, innermost last. Each gets a serial number that is the
+        # same in both passes and unique across compile() calls
+        self.scopes: List[Dict[str, str]] = []
+        self.scope_base = 0
+        self.scope_serial = 0
+        # 65816 register widths set by .a8/.a16/.i8/.i16, which size immediates
+        self.a16 = False
+        self.i16 = False
+        # Instructions whose operand was a forward reference in pass 1, by id
+        self.forward_refs = set()
+        # Relocatable object build (asm65 -c): code goes to .segment sections
+        # that each start at 0, and every field holding an address in one of
+        # them, or an .import'ed symbol, gets a relocation for the linker
+        self.objects = objects
+        self.sections: Dict[str, Section] = {}
+        self.section: Optional[str] = None
+        self.section_pcs: Dict[str, int] = {}
+        self.section_locals: Dict[str, dict] = {}
+        # What each label or assignment is relative to (see relocation())
+        self.symbol_bases: Dict[str, Tuple[str, str]] = {}
+        self.imports: List[str] = []
+        self.exports: Dict[str, Export] = {}
 
     def compile(self, program: Program) -> bytearray:
         # Pass 1: Calculate addresses and define labels
@@ -34,21 +110,182 @@ class Compiler:
         self.local_labels = {} # reset
         self.origin = 0 # reset
         self.start_origin = None # Track first .org
-        self.cpu_mode = "6502"
-        self.opcodes = OPCODES_6502
-        self.visit_program(program)
+        self.cpu_mode = self.default_cpu
+        self.opcodes = opcode_table(self.default_cpu)
+        self.a16 = self.i16 = False
+        # Variables get their addresses up front, so pass 1 already sizes
+        # every instruction that uses them correctly
+        self.allocate_zero_page(program)
+        self.forward_refs = set()
+        self.block_padding = []
+        self.scope_base = self.scope_serial
+        self.section_locals = {}
+        self.start_sections()
+        self._run_pass('pass1', program)
         
         # Pass 2: Generate code
         self.pass_num = 2
         self.pc = 0
         self.origin = 0 # reset (though mostly unused in pass 2 logic except if referenced)
         # origin should ideally be preserved from pass 1 for reporting 
-        self.cpu_mode = "6502"
-        self.opcodes = OPCODES_6502
-        self.visit_program(program)
+        self.cpu_mode = self.default_cpu
+        self.opcodes = opcode_table(self.default_cpu)
+        self.a16 = self.i16 = False
+        self.scope_serial = self.scope_base
+        self.block_index = 0
+        self.start_sections()
+        self._run_pass('pass2', program)
+
+        if self.stats is not None:
+            self.stats.counts['bytes'] = sum(len(s.data) for s in self.sections.values()) if self.objects else len(self.bytes)
+            self.stats.counts['symbols'] = len(self.symbols.symbols)
         
         return self.bytes
 
+    def layout(self, program: Program) -> 'Compiler':
+        """
+        Compiles program on a scratch compiler with the same CPU and symbols
+        and returns it, with a listing and without branch range errors.
+        Optimization passes use it to see addresses before the real compile.
+        """
+        scratch = Compiler(cpu=self.default_cpu, listing=True, objects=self.objects)
+        scratch.symbols.symbols = dict(self.symbols.symbols)
+        scratch.symbol_bases = dict(self.symbol_bases)
+        scratch.zero_page = copy.deepcopy(self.zero_page)
+        scratch.structs = dict(self.structs)
+        scratch.check_branches = False
+        scratch.compile(program)
+        return scratch
+
+    def measure(self, program: Program) -> List[int]:
+        """
+        Bytes taken by each top-level statement of program, from a pass 1
+        over symbols that are already known (use it on a layout() result).
+        .org counts as 0.
+        """
+        self.pass_num = 1
+        self.pc = 0
+        self.local_labels = {}
+        self.cpu_mode = self.default_cpu
+        self.opcodes = opcode_table(self.default_cpu)
+        self.a16 = self.i16 = False
+        self.start_sections(resume=False)
+        sizes = []
+        for stmt in program.statements:
+            start = self.pc
+            self.visit_statement(stmt)
+            org = isinstance(stmt, Directive) and stmt.name == '.org'
+            sizes.append(0 if org else self.pc - start)
+        return sizes
+
+    def start_sections(self, resume: bool = True):
+        # Object builds: each pass starts in the default section, and every
+        # section carries on where the previous compile() left it
+        if not self.objects:
+            return
+        self.section = None
+        self.section_pcs = {name: len(section.data) if resume else 0 for name, section in self.sections.items()}
+        self.switch_section(DEFAULT_SECTION)
+
+    def switch_section(self, name: str):
+        if self.section is not None:
+            self.section_pcs[self.section] = self.pc
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(name)
+        self.section = name
+        self.bytes = section.data
+        self.pc = self.section_pcs.get(name, len(section.data))
+        # Numbered local labels are found by address, so each section keeps its own
+        self.local_labels = self.section_locals.setdefault(name, {})
+
+    def object_file(self) -> ObjectFile:
+        """The sections, exports and imports of an object build, for the linker."""
+        # Empty sections are left out unless a label is in one
+        labelled = {base[1] for base in self.symbol_bases.values() if base[0] == 'section'}
+        sections = {name: section for name, section in self.sections.items() if section.data or name in labelled}
+        return ObjectFile(sections, list(self.exports.values()), list(self.imports))
+
+    def allocate_zero_page(self, program: Program):
+        """Applies .zprange/.zpoverflow and places every .zpvar of program."""
+        variables = {}
+        defined = set()
+        for stmt in self._live_statements(program.statements):
+            if isinstance(stmt, (Label, Assignment)):
+                defined.add(stmt.name)
+            if not isinstance(stmt, Directive) or stmt.name not in ('.zpvar', '.zprange', '.zpoverflow'):
+                continue
+            if stmt.name == '.zpvar':
+                name = stmt.args[0]
+                size = self.resolve_expr(stmt.args[1]) if len(stmt.args) > 1 else 1
+                if size is None or size < 1:
+                    raise CompilerError(f"Invalid size for .zpvar {name}", stmt)
+                if name in self.symbols or name in variables:
+                    raise CompilerError(f"Symbol '{name}' is already defined", stmt)
+                variables[name] = ZpVar(name, size, stmt)
+                continue
+            start, end = (self.resolve_expr(arg) for arg in stmt.args)
+            if start is None or end is None:
+                raise CompilerError(f"Could not resolve {stmt.name} addresses", stmt)
+            try:
+                if stmt.name == '.zprange':
+                    self.zero_page.add_range(start, end)
+                else:
+                    self.zero_page.set_overflow(start, end)
+            except AllocationError as e:
+                raise CompilerError(str(e), stmt)
+        if not variables:
+            return
+        for name in defined & set(variables):
+            raise CompilerError(f"Symbol '{name}' is already defined", variables[name].node)
+
+        count_accesses(self._live_blocks(program.statements), variables)
+        try:
+            self.zero_page.allocate(list(variables.values()))
+        except AllocationError as e:
+            raise CompilerError(str(e), None)
+        for var in variables.values():
+            self.symbols.set(var.name, var.address)
+            if not var.in_zero_page:
+                self.warn(f"Zero page full: '{var.name}' placed at ${var.address:04X}", var.node)
+        if self.stats is not None:
+            self.stats.count('zp_vars', len(variables))
+
+    def _live_children(self, stmt: Statement) -> List[List[Statement]]:
+        # The nested statement lists that will be assembled, as far as can be
+        # told before pass 1; an .if that cannot be resolved yet gives both
+        if isinstance(stmt, IfDef):
+            taken = (stmt.condition in self.symbols) != stmt.negate
+            return [stmt.then_block if taken else stmt.else_block]
+        if isinstance(stmt, If):
+            value = self.resolve_expr(stmt.condition)
+            if value is None:
+                return [stmt.then_block, stmt.else_block]
+            return [stmt.then_block if value != 0 else stmt.else_block]
+        if isinstance(stmt, (PageBlock, Repeat, MacroCall)):
+            return [stmt.statements]
+        return []
+
+    def _live_blocks(self, statements: List[Statement]):
+        yield statements
+        for stmt in statements:
+            for block in self._live_children(stmt):
+                yield from self._live_blocks(block)
+
+    def _live_statements(self, statements: List[Statement]):
+        # In source order
+        for stmt in statements:
+            yield stmt
+            for block in self._live_children(stmt):
+                yield from self._live_statements(block)
+
+    def _run_pass(self, phase: str, program: Program):
+        if self.stats is None:
+            self.visit_program(program)
+            return
+        with self.stats.phase(phase):
+            self.visit_program(program)
+
     def visit_program(self, program: Program):
         for stmt in program.statements:
             self.visit_statement(stmt)
@@ -61,7 +298,9 @@ class Compiler:
                         self.local_labels[stmt.name] = []
                     self.local_labels[stmt.name].append(self.pc)
                 else:
-                    self.symbols.set(stmt.name, self.pc)
+                    self.define_address(self.scoped(stmt.name) if self.scopes else stmt.name, self.pc)
+            elif self.listing is not None:
+                self.listing_labels.setdefault(self.pc, []).append(self.scoped(stmt.name) if self.scopes else stmt.name)
         elif isinstance(stmt, Assignment):
             # Resolve value immediately if possible
             val = stmt.value
@@ -72,26 +311,328 @@ class Compiler:
                  resolved = self.resolve_expr(val)
                  if resolved is not None:
                       self.symbols.set(stmt.name, resolved)
+            if self.objects:
+                 # label + 2 is still an address in the label's section
+                 self.set_base(stmt.name, self.relocation(val, stmt))
         elif isinstance(stmt, Directive):
-            self.visit_directive(stmt)
+            if self.listing is not None and self.pass_num == 2 and stmt.name not in ('.org', '.cpu', '.segment') + UNROLL_DIRECTIVES:
+                start = self.pc
+                self.visit_directive(stmt)
+                if self.pc > start:
+                    self.listing_data.append((start, self.pc))
+            else:
+                self.visit_directive(stmt)
         elif isinstance(stmt, Instruction):
             self.visit_instruction(stmt)
         elif isinstance(stmt, IfDef):
             self.visit_ifdef(stmt)
+        elif isinstance(stmt, If):
+            self.visit_if(stmt)
         elif isinstance(stmt, EnumDef):
             self.visit_enum_def(stmt)
+        elif isinstance(stmt, StringPool):
+            if self.listing is not None and self.pass_num == 2:
+                self.listing_data.append((self.pc, self.pc + len(stmt.data)))
+            self.visit_string_pool(stmt)
+        elif isinstance(stmt, PageBlock):
+            self.visit_page_block(stmt)
+        elif isinstance(stmt, Table):
+            self.visit_table(stmt)
+        elif isinstance(stmt, StructDef):
+            self.visit_struct_def(stmt)
+        elif isinstance(stmt, StructInstance):
+            self.visit_struct_instance(stmt)
+        elif isinstance(stmt, Dispatch):
+            self.visit_dispatch(stmt)
+        elif isinstance(stmt, Repeat):
+            self.visit_repeat(stmt)
+        elif isinstance(stmt, MacroCall):
+            self.visit_scoped(stmt.statements, stmt.locals)
 
     def visit_ifdef(self, node: IfDef):
         # Check if symbol is defined
         is_defined = node.condition in self.symbols
         
-        if is_defined:
+        if is_defined != node.negate:
             for stmt in node.then_block:
                 self.visit_statement(stmt)
         else:
             for stmt in node.else_block:
                 self.visit_statement(stmt)
 
+    def visit_if(self, node: If):
+        # The condition picks the layout, so it must resolve in both passes
+        value = self.resolve_expr(node.condition)
+        if value is None:
+            raise CompilerError("Could not resolve .if condition", node)
+        block = node.then_block if value != 0 else node.else_block
+        for stmt in block:
+            self.visit_statement(stmt)
+
+    def visit_string_pool(self, node: StringPool):
+        if self.pass_num == 1:
+            for name, offset in node.labels:
+                self.define_address(name, self.pc + offset)
+            if self.stats is not None:
+                self.stats.count('strpool_saved', node.saved)
+        self.emit_bytes(node.data)
+
+    def visit_table(self, node: Table):
+        count = self.resolve_expr(node.count)
+        if count is None or count < 0:
+            raise CompilerError(f"Could not resolve the count of table '{node.name}'", node)
+        start = self.pc
+        if self.pass_num == 1:
+            for name, offset in table_labels(node.name, count, node.kind):
+                self.define_address(name, start + offset)
+            self.pc += count * entry_size(node.kind)
+            return
+
+        data = node.data
+        if data is None:
+            for name in node.expression.symbols:
+                self.require_absolute(Unresolved(name, 'ADDRESS'), f"Symbol '{name}' in table '{node.name}'", node)
+            try:
+                data = generate(node.expression, count, node.kind, self.symbols.symbols)
+            except TableError as e:
+                raise CompilerError(str(e), node)
+        if self.listing is not None:
+            for name, offset in table_labels(node.name, count, node.kind)[1:]:
+                self.listing_labels.setdefault(start + offset, []).append(name)
+            self.listing_data.append((start, start + len(data)))
+        self.emit_bytes(data)
+
+    def visit_struct_def(self, node: StructDef):
+        # Like enums, layouts are fixed in pass 1
+        if self.pass_num != 1:
+            return
+        layout = StructLayout(node.name)
+        for name, size_expr in node.fields:
+            size = self.resolve_expr(size_expr)
+            if size is None:
+                raise CompilerError(f"Could not resolve the size of field '{name}' in struct '{node.name}'", node)
+            try:
+                layout.add(name, size)
+            except StructError as e:
+                raise CompilerError(str(e), node)
+        for name, value in layout.symbols():
+            self.symbols.set(name, value)
+        self.structs[node.name] = layout
+
+    def visit_struct_instance(self, node: StructInstance):
+        layout = self.structs.get(node.struct)
+        if layout is None:
+            raise CompilerError(f"Unknown struct '{node.struct}'", node)
+        count = self.resolve_expr(node.count)
+        if count is None or count < 0:
+            raise CompilerError(f"Could not resolve the count of '{node.name}'", node)
+        if node.layout == 'soa':
+            self.require_alignment(256)
+        start = self.pc
+        try:
+            if node.layout == 'soa':
+                labels, end = soa_labels(node.name, layout, count, start, node.page)
+            else:
+                labels, end = aos_labels(node.name, layout, count, start)
+        except StructError as e:
+            raise CompilerError(str(e), node)
+
+        if self.pass_num == 1:
+            for name, address in labels:
+                self.define_address(name, address)
+            self.pc = end
+            return
+        if self.listing is not None:
+            for name, address in labels:
+                self.listing_labels.setdefault(address, []).append(name)
+            self.listing_data.append((start, end))
+        self.emit_bytes(bytes(end - start))
+
+    def scoped(self, name: str) -> str:
+        # The name a label or symbol reference stands for in the current .local scopes;
+        # local.field follows local
+        head, dot, rest = name.partition('.')
+        for scope in reversed(self.scopes):
+            if head in scope:
+                return scope[head] + dot + rest
+        return name
+
+    def visit_scoped(self, statements: List[Statement], local_names: List[str]):
+        if not local_names:
+            for stmt in statements:
+                self.visit_statement(stmt)
+            return
+        self.scope_serial += 1
+        self.scopes.append({name: f"{name}@{self.scope_serial}" for name in local_names})
+        try:
+            for stmt in statements:
+                self.visit_statement(stmt)
+        finally:
+            self.scopes.pop()
+
+    def visit_repeat(self, node: Repeat):
+        # The body is visited count times rather than copied count times
+        count = self.resolve_expr(node.count)
+        if count is None or count < 0:
+            raise CompilerError("Could not resolve .rept count", node)
+        for i in range(count):
+            if node.var is not None:
+                self.symbols.set(node.var, i)
+            self.visit_scoped(node.statements, node.locals)
+        if self.pass_num == 2 and self.stats is not None:
+            self.stats.count('rept_iterations', count)
+
+    def visit_dispatch(self, node: Dispatch):
+        # The layout only depends on the keys, so both passes expand the same code
+        if self.objects:
+            raise CompilerError(f".dispatch '{node.name}' stores handler addresses the linker cannot relocate; "
+                                "not supported in object builds", node)
+        keys = []
+        for key_expr, _ in node.entries:
+            key = self.resolve_expr(key_expr)
+            if key is None:
+                raise CompilerError(f"Dispatch keys must be known before '{node.name}'", node)
+            keys.append(key)
+        try:
+            check_keys(keys)
+        except DispatchError as e:
+            raise CompilerError(str(e), node)
+        layout = choose_layout(keys)
+
+        targets = [0] * (len(keys) + 1)
+        if self.pass_num == 2:
+            exprs = [node.default] + [handler for _, handler in node.entries]
+            for i, expr in enumerate(exprs):
+                value = self.symbols.get(f"{node.name}.end") if expr is None else self.resolve_expr(expr)
+                if value is None:
+                    raise CompilerError(f"Could not resolve dispatch handler for '{node.name}'", node)
+                targets[i] = value
+        start = self.pc
+        for stmt in expand(node.name, layout, slot_map(layout, keys), targets, node.default is not None):
+            stmt.filename, stmt.line = node.filename, node.line
+            self.visit_statement(stmt)
+
+        if self.pass_num == 2:
+            cycles = layout.cycles
+            tables = ('index', 'hi', 'lo') if layout.kind == 'sparse' else ('hi', 'lo')
+            for table in tables:
+                # Indexed reads take a cycle more when the table crosses a page
+                first = self.symbols.get(f"{node.name}.{table}")
+                size = layout.span if table == 'index' or layout.kind == 'dense' else layout.count + 1
+                if first >> 8 != (first + size - 1) >> 8:
+                    cycles += 1
+            self.dispatches.append(DispatchReport(node.name, layout, cycles, self.pc - start, node.filename, node.line))
+
+    def visit_unroll(self, d: Directive):
+        if self.objects:
+            raise CompilerError(f"{d.name} is not supported in object builds", d)
+        kind = d.name[len('.unroll_'):]
+        areas = 2 if kind == 'copy' else 1
+        shape = [self.resolve_expr(arg) for arg in d.args[areas:]]
+        if None in shape:
+            raise CompilerError(f"{d.name} count, stride and unroll factor must be known before it", d)
+        bases = [self.resolve_expr(arg) for arg in d.args[:areas]]
+        if None in bases:
+            if self.pass_num == 2:
+                raise CompilerError(f"Could not resolve {d.name} address", d)
+            # Forward reference: lay out as absolute addresses, like other instructions
+            self.forward_refs.add(id(d))
+            bases = [0x1000] * areas
+        try:
+            p = plan(kind, *shape)
+            if self.pass_num == 2:
+                check_operands(p, bases)
+        except UnrollError as e:
+            raise CompilerError(str(e), d)
+        src, dest = bases[0], bases[-1]
+
+        start = self.pc
+        body = instructions(p, src, dest)
+        if id(d) in self.forward_refs and any(inst.operand is not None and inst.operand < 0x100 for inst in body):
+            # Pass 1 sized every store as absolute; zero page would shift all later labels
+            raise CompilerError(f"{d.name} area is in zero page but defined after it; "
+                                "define it first so that pass 1 sizes the stores", d)
+        looped = (p.unroll * areas + p.stride) if p.iterations else 0
+        generated = []
+        if p.iterations:
+            generated.append(Instruction('LDX', '#', index_start(p)))
+        loop = start + (2 if p.iterations else 0)
+        for inst in generated + body[:looped]:
+            inst.filename, inst.line = d.filename, d.line
+            self.visit_statement(inst)
+        if p.iterations:
+            if self.pc + 2 - loop > 128:
+                raise CompilerError(f"{d.name} loop body is {self.pc - loop} bytes, too long for a branch; "
+                                    "use a smaller unroll factor", d)
+            branch = Instruction('BNE', 'ABS', loop, line=d.line)
+            branch.filename = d.filename
+            self.visit_statement(branch)
+        crosses = loop >> 8 != self.pc >> 8
+        for inst in body[looped:]:
+            inst.filename, inst.line = d.filename, d.line
+            self.visit_statement(inst)
+
+        if self.pass_num == 2:
+            total = cycles(p, src, dest, crosses, self.cpu_mode)
+            self.unrolled.append(UnrollReport(p, total, self.pc - start, d.filename, d.line))
+            if self.stats is not None:
+                self.stats.count('unrolled_bytes', self.pc - start)
+
+    def warn(self, msg: str, node: Statement = None):
+        self.warnings.append(str(CompilerError(msg, node)))
+
+    def visit_page_block(self, node: PageBlock):
+        # Pad (only when needed) so the block does not cross a page boundary
+        self.require_alignment(256)
+        if self.pass_num == 1:
+            pad = self._page_padding(node)
+            self.block_padding.append(pad)
+        else:
+            pad = self.block_padding[self.block_index]
+            self.block_index += 1
+        if pad:
+            self.emit_bytes(bytes([0xEA if node.kind == 'hot' else 0x00]) * pad)
+            if self.pass_num == 2 and self.stats is not None:
+                self.stats.count('page_padding', pad)
+
+        start = self.pc
+        for stmt in node.statements:
+            self.visit_statement(stmt)
+        if self.pass_num == 2 and self.pc - start > 0:
+            name = '.hot' if node.kind == 'hot' else '.table_aligned'
+            if self.pc - start > 256:
+                self.warn(f"{name} block is {self.pc - start} bytes, more than a page; not padded", node)
+            elif start >> 8 != (self.pc - 1) >> 8:
+                self.warn(f"{name} block ${start:04X}-${self.pc - 1:04X} crosses a page boundary", node)
+
+    def _page_padding(self, node: PageBlock) -> int:
+        # Pass 1: lay the block out once to measure it, then undo its effects
+        start = self.pc
+        local_counts = {name: len(locs) for name, locs in self.local_labels.items()}
+        cpu = (self.cpu_mode, self.opcodes)
+        scope_serial = self.scope_serial
+        blocks = len(self.block_padding)
+        for stmt in node.statements:
+            self.visit_statement(stmt)
+        size = self.pc - start
+
+        self.pc = start
+        # .local names of .rept/.macro bodies must get the same serials again
+        self.scope_serial = scope_serial
+        # Nested blocks are recorded again by the real layout
+        del self.block_padding[blocks:]
+        for name in list(self.local_labels):
+            if name in local_counts:
+                del self.local_labels[name][local_counts[name]:]
+            else:
+                del self.local_labels[name]
+        self.cpu_mode, self.opcodes = cpu
+
+        offset = start & 0xFF
+        if size == 0 or size > 256 or offset + size <= 256:
+            return 0
+        return 256 - offset
+
     def visit_enum_def(self, node: EnumDef):
         # Only process enums in Pass 1 to define symbols
         if self.pass_num != 1:
@@ -166,6 +707,8 @@ class Compiler:
 
     def visit_directive(self, d: Directive):
         if d.name == '.org':
+            if self.objects:
+                raise CompilerError(".org cannot be used in an object build; the linker config places sections", d)
             val = self.resolve_expr(d.args[0])
             if val is None:
                  if self.pass_num == 1: val = 0 
@@ -176,23 +719,12 @@ class Compiler:
                 self.start_origin = val
             self.origin = val # Update current origin context
             
-        elif d.name == '.byte':
-            for arg in d.args:
-                # Handle string literals specially
-                if isinstance(arg, str):
-                    for char in arg:
-                        self.emit_byte(ord(char))
-                else:
-                    val = self.resolve_expr(arg)
-                    if val is None: val = 0
-                    self.emit_byte(val)
-        elif d.name == '.word':
-            for arg in d.args:
-                val = self.resolve_expr(arg)
-                if val is None: 
-                    if self.pass_num == 2: raise CompilerError("Unresolved symbol in .word", d)
-                    val = 0
-                self.emit_word(val)
+        elif d.name in ('.byte', '.word') or d.name in STRING_DIRECTIVES:
+            if self.pass_num == 1 and d.size is not None:
+                # Layout only depends on the size the parser worked out
+                self.pc += d.size
+            else:
+                self.visit_data(d)
         elif d.name == '.fill':
              count = self.resolve_expr(d.args[0]) or 0
              val = 0
@@ -200,6 +732,10 @@ class Compiler:
                  val = self.resolve_expr(d.args[1]) or 0
              for _ in range(count):
                  self.emit_byte(val)
+        elif d.name in UNROLL_DIRECTIVES:
+             self.visit_unroll(d)
+        elif d.name == '.incbin':
+             self.visit_incbin(d)
         elif d.name == '.cpu':
              # Handle .cpu directive
              val = d.args[0]
@@ -213,17 +749,45 @@ class Compiler:
                  mode_str = val
              elif isinstance(val, Unresolved):
                  mode_str = val.name
+             elif isinstance(val, int):
+                 # .cpu 65816
+                 mode_str = str(val)
              
              mode_str = mode_str.lower().strip('"\'')
              
-             if mode_str == "6502":
-                 self.cpu_mode = "6502"
-                 self.opcodes = OPCODES_6502
-             elif mode_str == "65c02":
-                 self.cpu_mode = "65c02"
-                 self.opcodes = OPCODES_65C02
-             else:
+             if mode_str not in cpu_names():
                  raise CompilerError(f"Unknown CPU mode: {mode_str}", d)
+             # Tables other than 6502 are built on first use and cached
+             self.cpu_mode = mode_str
+             self.opcodes = opcode_table(mode_str)
+             # A 65816 starts out with 8-bit registers
+             self.a16 = self.i16 = False
+
+        elif d.name in WIDTH_DIRECTIVES:
+             if self.cpu_mode != '65816':
+                 raise CompilerError(f"{d.name} needs .cpu \"65816\"", d)
+             if d.name[1] == 'a':
+                 self.a16 = d.name == '.a16'
+             else:
+                 self.i16 = d.name == '.i16'
+
+        elif d.name in ('.segment', '.import'):
+             if not self.objects:
+                 raise CompilerError(f"{d.name} is only allowed in object builds (asm65 -c) and linked builds (-C)", d)
+             if d.name == '.segment':
+                 self.switch_section(d.args[0])
+             else:
+                 self.visit_import(d)
+
+        elif d.name == '.export' and self.objects and self.pass_num == 2:
+             for name in d.args:
+                 value = self.symbols.get(name)
+                 if value is None:
+                     raise CompilerError(f"Exported symbol '{name}' is not defined", d)
+                 base = self.symbol_bases.get(name)
+                 if base is not None and base[0] == 'import':
+                     raise CompilerError(f"'{name}' is imported and cannot be exported again", d)
+                 self.exports[name] = Export(name, value, base[1] if base else None)
 
         elif d.name == '.align':
              alignment = self.resolve_expr(d.args[0])
@@ -233,6 +797,7 @@ class Compiler:
              
              if alignment <= 0:
                  raise CompilerError("Alignment must be positive", d)
+             self.require_alignment(alignment)
 
              # Calculate padding needed to align PC
              # logical PC (self.pc) or output PC?
@@ -244,6 +809,73 @@ class Compiler:
                  for _ in range(padding):
                      self.emit_byte(0) # Pad with 0
 
+    def visit_import(self, d: Directive):
+        # Imports read as 0 until the linker fills in the fields that use them
+        for name in d.args:
+            if self.symbol_bases.get(name) != ('import', name):
+                if name in self.symbols:
+                    raise CompilerError(f"Imported symbol '{name}' is also defined here", d)
+                self.imports.append(name)
+            self.symbols.set(name, 0)
+            self.symbol_bases[name] = ('import', name)
+
+    def visit_data(self, d: Directive):
+        # Constant runs arrive from the parser already encoded as bytes
+        word = d.name == '.word'
+        for arg in d.args:
+            if isinstance(arg, bytes):
+                self.emit_bytes(arg)
+            elif isinstance(arg, str) and not word:
+                for char in arg:
+                    self.emit_byte(ord(char))
+            elif word:
+                val = self.resolve_expr(arg)
+                if val is None:
+                    if self.pass_num == 2: raise CompilerError("Unresolved symbol in .word", d)
+                    val = 0
+                if self.objects and self.pass_num == 2:
+                    self.relocate(arg, 'word', self.pc, d)
+                self.emit_word(val)
+            else:
+                val = self.resolve_expr(arg)
+                if val is None: val = 0
+                if self.objects and self.pass_num == 2:
+                    self.relocate(arg, 'byte', self.pc, d)
+                self.emit_byte(val)
+
+    def visit_incbin(self, d: Directive):
+        path = d.args[0]
+        offset = 0
+        length = None
+        if len(d.args) > 1:
+            offset = self.resolve_expr(d.args[1])
+            if offset is None:
+                raise CompilerError("Could not resolve .incbin offset", d)
+        if len(d.args) > 2:
+            length = self.resolve_expr(d.args[2])
+            if length is None:
+                raise CompilerError("Could not resolve .incbin length", d)
+
+        # Pass 1 only needs the size, so don't read the file
+        try:
+            size = os.stat(path).st_size
+        except OSError as e:
+            raise CompilerError(f"Cannot read binary include {path}: {e.strerror}", d)
+        if offset < 0 or offset > size:
+            raise CompilerError(f".incbin offset {offset} is outside {path} ({size} bytes)", d)
+        if length is None:
+            length = size - offset
+        elif length < 0 or offset + length > size:
+            raise CompilerError(f".incbin length {length} at offset {offset} exceeds {path} ({size} bytes)", d)
+
+        if self.pass_num == 1 or length == 0:
+            self.pc += length
+            return
+        # Copy straight from the mapped file into the output buffer
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            with memoryview(data)[offset:offset + length] as chunk:
+                self.emit_bytes(chunk)
+
     def visit_instruction(self, inst: Instruction):
         opcode = 0
         mode = inst.mode
@@ -257,45 +889,106 @@ class Compiler:
             supported = self.opcodes[inst.mnemonic]
             if mode == 'ABS' and 'REL' in supported and 'ABS' not in supported:
                 mode = 'REL'
+            elif mode == 'ABS' and 'RELL' in supported:
+                mode = 'RELL'
 
         # Determine mode and value
         if mode == 'IMP' or mode == 'ACC':
             size = 1
         elif mode == '#':
             size = 2
+            # 16-bit immediates on the 65816, per .a16/.i16
+            if (self.a16 and inst.mnemonic in ACCUMULATOR_IMMEDIATES) or (self.i16 and inst.mnemonic in INDEX_IMMEDIATES):
+                size = 3
             operand_val = self.resolve_expr(operand)
             if operand_val is None:
                 if self.pass_num == 2: raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
                 operand_val = 0
-        elif mode == 'REL':
-            size = 2
+            if self.objects and self.pass_num == 2:
+                self.relocate(operand, 'byte' if size == 2 else 'word', self.pc + 1, inst)
+        elif mode in ('REL', 'RELL'):
+            # RELL: 65816 BRL/PER, a 16-bit offset that wraps within the bank
+            size = 2 if mode == 'REL' else 3
             if self.pass_num == 2:
                 target = self.resolve_expr(operand)
                 if target is None:
                      raise CompilerError(f"Unresolved branch target for {inst.mnemonic}", inst)
                 
                 # internal PC is currently at instruction start
-                # offset = target - (pc + 2)
-                offset = target - (self.pc + 2)
-                if offset < -128 or offset > 127:
+                # offset = target - (pc + size)
+                offset = target - (self.pc + size)
+                if self.objects and self.relocation(operand, inst) != ('section', self.section):
+                    # The linker works out and range-checks branches out of the section
+                    if mode == 'RELL':
+                        raise CompilerError(f"{inst.mnemonic} cannot reach outside its section in an object build", inst)
+                    self.relocate(operand, 'branch', self.pc + 1, inst)
+                    offset = 0
+                if mode == 'REL' and (offset < -128 or offset > 127) and self.check_branches:
                     line_info = f" at line {inst.line}" if hasattr(inst, 'line') and inst.line else ""
                     raise CompilerError(f"Branch out of range: {offset}{line_info}", inst)
                 operand_val = offset
+        elif mode == 'ZPREL':
+            # BBRn/BBSn zp, target: the zero-page byte, then a branch offset
+            size = 3
+            if self.pass_num == 2:
+                zp, target = (self.resolve_expr(e) for e in operand)
+                if zp is None or target is None:
+                    raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
+                if self.objects:
+                    self.require_absolute(operand[0], f"The {inst.mnemonic} zero-page operand", inst)
+                    if self.relocation(operand[1], inst) != ('section', self.section):
+                        raise CompilerError(f"{inst.mnemonic} cannot reach outside its section in an object build", inst)
+                if not 0 <= zp <= 0xFF:
+                    raise CompilerError(f"{inst.mnemonic} tests a zero-page byte, not ${zp:04X}", inst)
+                offset = target - (self.pc + size)
+                if (offset < -128 or offset > 127) and self.check_branches:
+                    line_info = f" at line {inst.line}" if hasattr(inst, 'line') and inst.line else ""
+                    raise CompilerError(f"Branch out of range: {offset}{line_info}", inst)
+                operand_val = (zp, offset & 0xFF)
+        elif mode == 'BLK':
+            # MVN/MVP srcbank, destbank: encoded destination first
+            size = 3
+            if self.pass_num == 2:
+                banks = [self.resolve_expr(e) for e in operand]
+                if None in banks:
+                    raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
+                for e in operand:
+                    self.require_absolute(e, f"{inst.mnemonic} bank", inst)
+                if not all(0 <= bank <= 0xFF for bank in banks):
+                    raise CompilerError(f"{inst.mnemonic} takes two bank numbers ($00-$FF)", inst)
+                operand_val = (banks[1], banks[0])
         elif mode in ['ABS', 'ABSX', 'ABSY']:
             # Check ZP optimization
             # Only optimize if the instruction SUPPORTS ZP!
             # e.g. JMP supports ABS but not ZP.
-            supports_zp = False
-            if inst.mnemonic in self.opcodes:
-                 # Check if equivalent ZP mode exists
-                 # ABS->ZP, ABSX->ZPX, ABSY->ZPY
-                 zp_mode = mode.replace('ABS', 'ZP')
-                 if zp_mode in self.opcodes[inst.mnemonic]:
-                     supports_zp = True
+            supported = self.opcodes.get(inst.mnemonic, {})
+            # ABS->ZP, ABSX->ZPX, ABSY->ZPY
+            supports_zp = mode.replace('ABS', 'ZP') in supported
+            long_mode = mode.replace('ABS', 'LONG')
             
             val = self.resolve_expr(operand)
-            # If val is known and < 256, switch to ZP
-            if supports_zp and val is not None and val < 256:
+            if val is None and self.pass_num == 1:
+                self.forward_refs.add(id(inst))
+            # The linker places sections and imports anywhere, so their
+            # addresses always take two bytes
+            relocatable = self.objects and self.relocation(operand, inst) is not None
+            # 65816: 24-bit addresses take the long form, and so does
+            # everything for JSL/JML, which have no other
+            if long_mode in supported and (mode not in supported or (val is not None and val > 0xFFFF)):
+                if mode in supported and id(inst) in self.forward_refs:
+                    raise CompilerError(f"{inst.mnemonic} operand is a long address defined after it; "
+                                        "define it first so that pass 1 sizes the instruction", inst)
+                if relocatable:
+                    raise CompilerError(f"{inst.mnemonic} needs a long address, which an object build cannot relocate", inst)
+                mode = long_mode
+                size = 4
+                if val is None:
+                    if self.pass_num == 2: raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
+                    val = 0
+                operand_val = val
+            # If val is known and < 256, switch to ZP. A labelled operand is
+            # patched with full addresses, so it keeps its two bytes
+            elif supports_zp and val is not None and val < 256 and inst.operand_label is None and not relocatable:
                 if mode == 'ABS': mode = 'ZP'
                 if mode == 'ABSX': mode = 'ZPX'
                 if mode == 'ABSY': mode = 'ZPY'
@@ -306,12 +999,18 @@ class Compiler:
                  if val is None:
                      if self.pass_num == 2: raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
                      val = 0
+                 if val > 0xFFFF:
+                     raise CompilerError(f"{inst.mnemonic} has no long form of {mode} for ${val:06X}", inst)
+                 if relocatable and self.pass_num == 2:
+                     self.relocate(operand, 'word', self.pc + 1, inst)
                  operand_val = val
-        elif mode in ['IND', 'INDX', 'INDY']:
+        elif mode in ['IND', 'INDX', 'INDY', 'SR', 'SRIY', 'INDL', 'INDLY']:
              # IND (JMP) is 3 bytes. INDX/INDY are ZP indirects (2 bytes).
              # 65C02 adds:
              # ADC (zp) -> IND (2 bytes)
              # JMP (abs,x) -> INDX (3 bytes)
+             # 65816 adds JSR (abs,x), JML [abs] (3 bytes) and the stack
+             # relative and [dp] modes (2 bytes)
              
              if mode == 'IND':
                  if inst.mnemonic == 'JMP':
@@ -320,17 +1019,27 @@ class Compiler:
                      # 65C02 'ADC (zp)' etc.
                      size = 2
              elif mode == 'INDX':
-                 if inst.mnemonic == 'JMP':
+                 if inst.mnemonic in ('JMP', 'JSR'):
                      # 65C02 JMP (abs,x)
                      size = 3
                  else:
                      size = 2
-             else: # INDY
+             elif mode == 'INDL':
+                 size = 3 if inst.mnemonic in ('JMP', 'JML') else 2
+             else: # INDY and the other one-byte operands
                  size = 2
              operand_val = self.resolve_expr(operand)
              if operand_val is None:
                  if self.pass_num == 2: raise CompilerError(f"Unresolved symbol in {inst.mnemonic}", inst)
                  operand_val = 0
+             if self.objects and self.pass_num == 2:
+                 if size == 3:
+                     self.relocate(operand, 'word', self.pc + 1, inst)
+                 else:
+                     self.require_absolute(operand, "A zero-page pointer", inst)
+
+        if inst.operand_label is not None:
+            self.visit_operand_label(inst, mode, size)
         
         # Emit
         if self.pass_num == 1:
@@ -346,9 +1055,21 @@ class Compiler:
                  raise CompilerError(f"Mode {mode} not supported for {inst.mnemonic}", inst)
             
             opcode = modes[mode]
+            if self.listing is not None:
+                if mode in ('REL', 'RELL', 'ZPREL'):
+                    value = target
+                elif mode == 'BLK':
+                    value = operand_val[1] << 8 | operand_val[0]
+                else:
+                    value = operand_val
+                self.listing.append(ListingEntry(self.pc, size, inst.mnemonic, mode, value, self.cpu_mode, inst,
+                                                 width_cycles(inst.mnemonic, mode, self.a16, self.i16)))
             self.emit_byte(opcode)
             
-            if size == 2:
+            if mode in ('ZPREL', 'BLK'):
+                for byte in operand_val:
+                    self.emit_byte(byte)
+            elif size == 2:
                 # REL offset is signed, byte() handles 0-255. 
                 # Need to convert signed to unsigned byte.
                 if mode == 'REL':
@@ -357,13 +1078,106 @@ class Compiler:
                      self.emit_byte(operand_val)
             elif size == 3:
                 self.emit_word(operand_val)
+            elif size == 4:
+                self.emit_word(operand_val)
+                self.emit_byte(operand_val >> 16)
+
+    def visit_operand_label(self, inst: Instruction, mode: str, size: int):
+        # name is the operand's first byte; name.lo/name.hi its bytes (no .hi
+        # for one-byte fields), and name.bank the third byte of a long address
+        if mode in ('ABS', 'ABSX', 'ABSY') and mode not in self.opcodes.get(inst.mnemonic, {}):
+            raise CompilerError(f"{inst.mnemonic} has no 16-bit {mode} form for operand label "
+                                f"'{inst.operand_label}'", inst)
+        if self.pass_num == 1:
+            name = self.scoped(inst.operand_label) if self.scopes else inst.operand_label
+            self.define_address(name, self.pc + 1)
+            for suffix, offset in (('lo', 1), ('hi', 2), ('bank', 3))[:size - 1]:
+                self.define_address(f"{name}.{suffix}", self.pc + offset)
+
+    def define_address(self, name: str, value: int):
+        # A label; in an object build its value is an offset into the current section
+        self.symbols.set(name, value)
+        if self.objects:
+            self.symbol_bases[name] = ('section', self.section)
+
+    def set_base(self, name: str, base: Optional[Tuple[str, str]]):
+        if base is None:
+            self.symbol_bases.pop(name, None)
+        else:
+            self.symbol_bases[name] = base
+
+    def relocation(self, expr, node: Statement = None) -> Optional[Tuple[str, str]]:
+        """
+        What the value of expr depends on in an object build: ('section', name)
+        for an address in a section, ('import', name) for an imported symbol,
+        or None when it is absolute. The distance between two addresses in
+        the same section is absolute; other mixes cannot be relocated.
+        """
+        if isinstance(expr, Unresolved):
+            if expr.type == 'LOCAL_REL':
+                return ('section', self.section)
+            return self.symbol_bases.get(self.scoped(expr.name) if self.scopes else expr.name)
+        if isinstance(expr, BinaryExpr):
+            left = self.relocation(expr.left, node)
+            right = self.relocation(expr.right, node)
+            if expr.op == '-' and left == right:
+                return None
+            if right is None:
+                return left
+            if expr.op == '+' and left is None:
+                return right
+            what = 'sum' if expr.op == '+' else 'difference'
+            raise CompilerError(f"The {what} of these addresses cannot be relocated", node)
+        return None
+
+    def relocate(self, expr, kind: str, offset: int, node: Statement):
+        """
+        Pass 2 of an object build: records a relocation when the field at
+        offset in the current section holds an address the linker has to
+        fill in. kind is 'byte', 'word' or 'branch' (a REL offset).
+        """
+        target = self.relocation(expr, node)
+        if kind == 'branch':
+            # A branch within the section needs nothing; one out of it is
+            # relocated even to an absolute target
+            if target == ('section', self.section):
+                return
+            addend = self.resolve_expr(expr)
+            rel_type = 'REL'
+        else:
+            if target is None:
+                return
+            byte_of = expr.type if isinstance(expr, Unresolved) and expr.type in ('LOW', 'HIGH') else None
+            if kind == 'byte' and byte_of is None:
+                raise CompilerError("A relocatable address does not fit in a byte; use < or > to pick one", node)
+            rel_type = byte_of or 'ABS'
+            # < and > are applied by the linker, to the whole address
+            addend = self.resolve_expr(Unresolved(expr.name, 'ADDRESS') if byte_of else expr)
+        section, symbol = None, None
+        if target is not None:
+            if target[0] == 'section':
+                section = target[1]
+            else:
+                symbol = target[1]
+        self.sections[self.section].relocations.append(Relocation(offset, rel_type, addend, section, symbol))
+
+    def require_absolute(self, expr, what: str, node: Statement):
+        if self.objects and self.relocation(expr, node) is not None:
+            raise CompilerError(f"{what} must be absolute in an object build, not a relocatable address", node)
+
+    def require_alignment(self, alignment: int):
+        # Object builds: padding worked out from section offsets only holds
+        # when the linker starts the section on a multiple of alignment
+        if self.objects:
+            section = self.sections[self.section]
+            section.align = math.lcm(section.align, alignment)
 
     def resolve_expr(self, expr):
         if isinstance(expr, int): return expr
         if isinstance(expr, Unresolved):
 
             if expr.type == 'ADDRESS':
-                return self.symbols.get(expr.name)
+                return self.symbols.get(self.scoped(expr.name) if self.scopes else expr.name)
             if expr.type == 'LOCAL_REL':
                 # Parse "1f" or "1b"
                 direction = expr.name[-1]
@@ -423,7 +1237,7 @@ class Compiler:
 
             # Handle LOW/HIGH logic here or during emit?
             # If value is resolved, apply low/high.
-            val = self.symbols.get(expr.name)
+            val = self.symbols.get(self.scoped(expr.name) if self.scopes else expr.name)
             if val is None: return None
             if expr.type == 'LOW': return val & 0xFF
             if expr.type == 'HIGH': return (val >> 8) & 0xFF
@@ -441,6 +1255,12 @@ class Compiler:
             self.bytes.append(val & 0xFF)
         self.pc += 1
 
+    def emit_bytes(self, data):
+        # Bulk emit of a bytes-like object
+        if self.pass_num == 2:
+            self.bytes += data
+        self.pc += len(data)
+
     def emit_word(self, val):
         if self.pass_num == 2:
             self.bytes.append(val & 0xFF)
@@ -0,0 +1,269 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .compiler import ListingEntry
+from .opcodes import cycle_table
+
+# Instructions after which execution does not fall through
+_JUMPS = ('JMP', 'RTS', 'RTI', 'BRK', 'BRA', 'BRL', 'JML', 'RTL', 'STP')
+# Conditional branches: Bcc and the Rockwell BBRn/BBSn
+_BRANCH_MODES = ('REL', 'ZPREL')
+
+_OPERAND_FORMATS = {
+    'IMP': "", 'ACC': "A", '#': "#${:02X}", 'ZP': "${:02X}", 'ZPX': "${:02X},X", 'ZPY': "${:02X},Y",
+    'ABS': "${:04X}", 'ABSX': "${:04X},X", 'ABSY': "${:04X},Y", 'IND': "(${:04X})",
+    'INDX': "(${:02X},X)", 'INDY': "(${:02X}),Y", 'REL': "${:04X}",
+    'ZPREL': "${:04X}", 'RELL': "${:04X}", 'LONG': "${:06X}", 'LONGX': "${:06X},X",
+    'SR': "${:02X},S", 'SRIY': "(${:02X},S),Y", 'INDL': "[${:02X}]", 'INDLY': "[${:02X}],Y",
+}
+
+@dataclass
+class InstructionCost:
+    entry: ListingEntry
+    min: int
+    max: int
+    data_dependent: bool = False # max includes an indexed page crossing
+    crosses_page: bool = False # branch target is on another page
+
+    @property
+    def taken(self) -> int:
+        # Cost when a branch is taken (its max); the plain cost otherwise
+        return self.max
+
+    def describe(self) -> str:
+        e = self.entry
+        text = f"{e.mnemonic} {_OPERAND_FORMATS.get(e.mode, '{}').format(e.operand or 0)}".rstrip()
+        if e.mode == 'IND' and e.size == 2:
+            text = f"{e.mnemonic} (${e.operand or 0:02X})"
+        elif e.mode == 'BLK':
+            text = f"{e.mnemonic} ${(e.operand or 0) >> 8:02X},${(e.operand or 0) & 0xFF:02X}"
+        return text
+
+@dataclass
+class BasicBlock:
+    start: int
+    costs: List[InstructionCost] = field(default_factory=list)
+
+    @property
+    def end(self) -> int:
+        last = self.costs[-1].entry
+        return last.pc + last.size
+
+    @property
+    def min(self) -> int:
+        return sum(c.min for c in self.costs)
+
+    @property
+    def max(self) -> int:
+        return sum(c.max for c in self.costs)
+
+@dataclass
+class Routine:
+    name: str
+    blocks: List[BasicBlock] = field(default_factory=list)
+
+    @property
+    def start(self) -> int:
+        return self.blocks[0].start
+
+    @property
+    def end(self) -> int:
+        return self.blocks[-1].end
+
+    @property
+    def min(self) -> int:
+        return sum(b.min for b in self.blocks)
+
+    @property
+    def max(self) -> int:
+        return sum(b.max for b in self.blocks)
+
+@dataclass
+class Loop:
+    """A backward branch or jump and the instructions from its target to it."""
+    name: str
+    start: int
+    branch: InstructionCost
+    body: List[InstructionCost]
+    min: int = 0 # per iteration, with the closing branch taken
+    max: int = 0
+
+    @property
+    def data_dependent(self) -> List[InstructionCost]:
+        return [c for c in self.body if c.data_dependent]
+
+@dataclass
+class CycleReport:
+    routines: List[Routine]
+    loops: List[Loop]
+
+def instruction_cost(entry: ListingEntry) -> InstructionCost:
+    cycles = cycle_table(entry.cpu)[entry.mnemonic][entry.mode]
+    cost = InstructionCost(entry, cycles.base + entry.wide, cycles.base + entry.wide)
+    if cycles.branch:
+        taken = cycles.base + 1
+        if entry.operand is not None and (entry.pc + entry.size) >> 8 != entry.operand >> 8:
+            taken += 1
+            cost.crosses_page = True
+        cost.max = taken
+        if entry.mnemonic == 'BRA':
+            cost.min = taken
+    elif cycles.page:
+        # abs,X/abs,Y from a page-aligned base can never cross; (zp),Y
+        # depends on the pointer contents, which are unknown here
+        if entry.mode == 'INDY' or (entry.operand or 0) & 0xFF:
+            cost.max += 1
+            cost.data_dependent = True
+    return cost
+
+def _is_local(name: str) -> bool:
+    return name.isdigit()
+
+def analyze(listing: List[ListingEntry], labels: Dict[int, List[str]] = None) -> CycleReport:
+    """
+    Splits a compiler listing into label-delimited routines and basic blocks
+    and costs every instruction. Costs of blocks and routines are the sums
+    of their instructions; loops are found from backward branches and jumps.
+    """
+    labels = labels or {}
+    costs = [instruction_cost(entry) for entry in listing]
+
+    # Block leaders: labels, branch/jump targets, and whatever follows a
+    # control transfer or a gap in the code (data, .org)
+    targets = {c.entry.operand for c in costs
+               if c.entry.mode in _BRANCH_MODES or c.entry.mnemonic == 'BRL'
+               or (c.entry.mnemonic == 'JMP' and c.entry.mode == 'ABS')}
+    routines: List[Routine] = []
+    routine_of: Dict[int, int] = {}
+    block: Optional[BasicBlock] = None
+    previous: Optional[InstructionCost] = None
+    for cost in costs:
+        pc = cost.entry.pc
+        names = [name for name in labels.get(pc, []) if not _is_local(name)]
+        if names or not routines:
+            routines.append(Routine(names[0] if names else f"${pc:04X}"))
+            block = None
+        leader = (block is None or pc in targets or pc in labels
+                  or previous.entry.pc + previous.entry.size != pc
+                  or previous.entry.mode in _BRANCH_MODES or previous.entry.mnemonic in _JUMPS)
+        if leader:
+            block = BasicBlock(pc)
+            routines[-1].blocks.append(block)
+        block.costs.append(cost)
+        routine_of[pc] = len(routines) - 1
+        previous = cost
+
+    return CycleReport(routines, _find_loops(costs, labels, routine_of))
+
+def _find_loops(costs: List[InstructionCost], labels: Dict[int, List[str]],
+                routine_of: Dict[int, int]) -> List[Loop]:
+    index = {c.entry.pc: i for i, c in enumerate(costs)}
+    loops = []
+    for i, cost in enumerate(costs):
+        e = cost.entry
+        if e.mode in _BRANCH_MODES:
+            backward = True
+        else:
+            # A jump back into another routine (e.g. to a main loop) is not a loop
+            jump = (e.mnemonic == 'JMP' and e.mode == 'ABS') or e.mnemonic == 'BRL'
+            backward = jump and routine_of.get(e.operand) == routine_of[e.pc]
+        if not backward or e.operand is None or e.operand > e.pc or e.operand not in index:
+            continue
+        body = costs[index[e.operand]:i + 1]
+        names = labels.get(e.operand)
+        name = names[0] if names else f"${e.operand:04X}"
+        loop = Loop(name, e.operand, cost, body)
+        loop.min = sum(c.min for c in body[:-1]) + cost.taken
+        loop.max = sum(c.max for c in body[:-1]) + cost.taken
+        loops.append(loop)
+    return loops
+
+def format_report(report: CycleReport, instructions: bool = True) -> str:
+    lines = ["Cycle report (min-max; * = extra cycle if an indexed access crosses a page):"]
+    for routine in report.routines:
+        lines.append(f"{routine.name}  ${routine.start:04X}-${routine.end - 1:04X}  "
+                     f"{routine.min}-{routine.max} cycles straight through")
+        for block in routine.blocks:
+            lines.append(f"  block ${block.start:04X}  {len(block.costs):3} instr  {block.min}-{block.max}")
+            if not instructions:
+                continue
+            for cost in block.costs:
+                mark = "*" if cost.data_dependent else " "
+                note = ""
+                if cost.entry.mode in _BRANCH_MODES:
+                    note = f"  (taken {cost.taken}{', crosses page' if cost.crosses_page else ''})"
+                lines.append(f"    ${cost.entry.pc:04X}  {cost.min}-{cost.max}{mark} {cost.describe()}{note}")
+
+    if report.loops:
+        lines.append("Loops (cycles per iteration):")
+    for loop in report.loops:
+        flag = ""
+        if loop.data_dependent:
+            where = ", ".join(f"${c.entry.pc:04X} {c.describe()}" for c in loop.data_dependent)
+            flag = f"  VARIES with page crossings: {where}"
+        if loop.branch.crosses_page:
+            flag += "  closing branch crosses a page (+1)"
+        lines.append(f"  {loop.name}  ${loop.start:04X}-${loop.branch.entry.pc:04X}  {loop.min}-{loop.max}{flag}")
+    return "\n".join(lines)
+
+@dataclass
+class DataTable:
+    name: str
+    start: int
+    end: int # exclusive
+
+    @property
+    def straddles(self) -> bool:
+        return self.start >> 8 != (self.end - 1) >> 8
+
+def data_tables(labels: Dict[int, List[str]], data: List[Tuple[int, int]]) -> List[DataTable]:
+    """
+    Finds labelled data: each label inside emitted data starts a table that
+    runs to the next label or the end of the contiguous data around it.
+    """
+    runs = []
+    for start, end in sorted(data):
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+    addresses = sorted(labels)
+    tables = []
+    for run_start, run_end in runs:
+        inside = [a for a in addresses if run_start <= a < run_end]
+        for i, address in enumerate(inside):
+            end = inside[i + 1] if i + 1 < len(inside) else run_end
+            tables.append(DataTable(labels[address][0], address, end))
+    return tables
+
+def _location(entry: ListingEntry) -> str:
+    node = entry.node
+    loc = f"{node.filename}:" if node.filename else ""
+    return f"{loc}{node.line}: " if node.line else loc
+
+def page_diagnostics(listing: List[ListingEntry], labels: Dict[int, List[str]],
+                     data: List[Tuple[int, int]]) -> List[str]:
+    """
+    Reports the page crossings that are visible from the layout: taken
+    branches whose target is on another page, and abs,X/abs,Y accesses
+    into labelled tables that straddle a page boundary. (zp),Y accesses
+    depend on the pointer value and cannot be checked here.
+    """
+    tables = data_tables(labels, data)
+    messages = []
+    for entry in listing:
+        if entry.mode in _BRANCH_MODES:
+            cost = instruction_cost(entry)
+            if cost.crosses_page:
+                kind = "loop branch" if entry.operand <= entry.pc else "branch"
+                messages.append(f"{_location(entry)}{kind} {entry.mnemonic} at ${entry.pc:04X} to "
+                                f"${entry.operand:04X} crosses a page (+1 cycle when taken)")
+        elif entry.mode in ('ABSX', 'ABSY') and entry.operand & 0xFF:
+            for table in tables:
+                if table.straddles and table.start <= entry.operand < table.end:
+                    page = (table.end - 1) & 0xFF00
+                    messages.append(f"{_location(entry)}{entry.mnemonic} ${entry.operand:04X},{entry.mode[-1]} "
+                                    f"indexes '{table.name}' (${table.start:04X}-${table.end - 1:04X}), which "
+                                    f"straddles a page (+1 cycle from ${page:04X} on)")
+                    break
+    return messages
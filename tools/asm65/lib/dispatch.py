@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .ast import Statement, Instruction, Directive, Label, Unresolved
+
+# Cycles of the PHA/PHA/RTS jump once the table index is in X (or Y):
+# LDA hi,X 4 + PHA 3 + LDA lo,X 4 + PHA 3 + RTS 6
+_PUSH_RTS = 20
+
+class DispatchError(Exception):
+    pass
+
+@dataclass
+class DispatchLayout:
+    kind: str # 'dense': one lo/hi entry per key in low..high; 'sparse': a byte index into packed lo/hi tables
+    low: int
+    high: int
+    count: int # Number of keys
+
+    @property
+    def span(self) -> int:
+        return self.high - self.low + 1
+
+    @property
+    def table_bytes(self) -> int:
+        if self.kind == 'dense':
+            return 2 * self.span
+        return self.span + 2 * (self.count + 1)
+
+    @property
+    def cycles(self) -> int:
+        """Cycles from the first instruction to the handler, for any key (no page crossings)."""
+        cycles = _PUSH_RTS + 2 # TAX
+        if self.low:
+            cycles += 4 # SEC, SBC #low
+        if self.span < 256:
+            cycles += 4 # CMP #span, BCS not taken
+        if self.kind == 'sparse':
+            cycles += 4 # LDY index,X
+        return cycles
+
+def chain_cycles(count: int) -> int:
+    """Worst case of a CMP #key / BEQ handler chain: the last key, with every other compare falling through."""
+    return 4 * (count - 1) + 5 if count else 0
+
+def choose_layout(keys: List[int]) -> DispatchLayout:
+    """Dense unless the sparse index takes fewer bytes (its LDY costs 3 more)."""
+    low, high = min(keys), max(keys)
+    dense = DispatchLayout('dense', low, high, len(keys))
+    sparse = DispatchLayout('sparse', low, high, len(keys))
+    return sparse if sparse.table_bytes + 3 < dense.table_bytes else dense
+
+@dataclass
+class DispatchReport:
+    name: str
+    layout: DispatchLayout
+    cycles: int # Worst case, including page crossings of the tables as placed
+    size: int # Bytes of code and tables
+    filename: Optional[str] = None
+    line: int = 0
+
+    @property
+    def chain(self) -> int:
+        return chain_cycles(self.layout.count)
+
+    def format(self) -> str:
+        loc = f"{self.filename}:{self.line}" if self.filename else f"line {self.line}"
+        saved = self.chain - self.cycles
+        verdict = f"{saved} saved" if saved > 0 else f"{-saved} more than the chain"
+        return (f"Dispatch {self.name} ({loc}): {self.layout.count} keys, {self.layout.kind} "
+                f"${self.layout.low:02X}-${self.layout.high:02X}, {self.size} bytes, worst case "
+                f"{self.cycles} cycles vs {self.chain} for a compare chain ({verdict})")
+
+def _inst(mnemonic: str, mode: str, operand=None) -> Instruction:
+    return Instruction(mnemonic, mode, operand)
+
+def expand(name: str, layout: DispatchLayout, slots: List[Optional[int]],
+           targets: List[int], has_default: bool) -> List[Statement]:
+    """
+    Statements for a dispatcher with the key in A. slots maps each key
+    from low to high to its index in targets (None for no handler);
+    targets holds the handler addresses, the no-match target first.
+    Without a default, keys with no handler continue after the tables
+    (name.end); with one, they go to the default handler.
+    """
+    index = 'Y' if layout.kind == 'sparse' else 'X'
+    stmts: List[Statement] = [Label(name)]
+    if layout.low:
+        stmts += [_inst('SEC', 'IMP'), _inst('SBC', '#', layout.low)]
+    if layout.span < 256:
+        stmts += [_inst('CMP', '#', layout.span), _inst('BCS', 'ABS', Unresolved(f"{name}.nomatch", 'ADDRESS'))]
+    stmts.append(_inst('TAX', 'IMP'))
+    if layout.kind == 'sparse':
+        stmts.append(_inst('LDY', 'ABSX', Unresolved(f"{name}.index", 'ADDRESS')))
+    stmts += [
+        _inst('LDA', f'ABS{index}', Unresolved(f"{name}.hi", 'ADDRESS')),
+        _inst('PHA', 'IMP'),
+        _inst('LDA', f'ABS{index}', Unresolved(f"{name}.lo", 'ADDRESS')),
+        _inst('PHA', 'IMP'),
+        _inst('RTS', 'IMP'),
+    ]
+    if layout.span < 256:
+        target = targets[0] if has_default else Unresolved(f"{name}.end", 'ADDRESS')
+        stmts += [Label(f"{name}.nomatch"), _inst('JMP', 'ABS', target)]
+
+    # RTS adds one to the address it pulls
+    if layout.kind == 'dense':
+        entries = [targets[0 if slot is None else slot] - 1 for slot in slots]
+    else:
+        entries = [t - 1 for t in targets]
+        stmts += [Label(f"{name}.index"), Directive('.byte', [slot or 0 for slot in slots], size=len(slots))]
+    stmts += [
+        Label(f"{name}.lo"), Directive('.byte', [e & 0xFF for e in entries], size=len(entries)),
+        Label(f"{name}.hi"), Directive('.byte', [(e >> 8) & 0xFF for e in entries], size=len(entries)),
+        Label(f"{name}.end"),
+    ]
+    return stmts
+
+def slot_map(layout: DispatchLayout, keys: List[int]) -> List[Optional[int]]:
+    """Index (1-based, 0 is no match) of each key's handler, for every key from low to high."""
+    slots: List[Optional[int]] = [None] * layout.span
+    for i, key in enumerate(keys):
+        slots[key - layout.low] = i + 1
+    return slots
+
+def check_keys(keys: List[int]):
+    if not keys:
+        raise DispatchError("Dispatch has no keys")
+    seen = set()
+    for key in keys:
+        if not 0 <= key <= 0xFF:
+            raise DispatchError(f"Dispatch key {key} is not a byte")
+        if key in seen:
+            raise DispatchError(f"Dispatch key ${key:02X} appears more than once")
+        seen.add(key)
@@ -0,0 +1,297 @@
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .memmap import MemoryMap, MemoryMapError, Region, preset
+from .objfile import DEFAULT_SECTION, ObjectFile, Relocation
+
+class LinkError(Exception):
+    pass
+
+@dataclass
+class SegmentRule:
+    """
+    Where the sections named name go: one after another, in memory area
+    memory (any area when None), at a fixed start or wherever they fit.
+    """
+    name: str
+    memory: Optional[str] = None
+    start: Optional[int] = None
+    align: int = 1
+    # bss segments take up memory but are not written to the image; their
+    # sections may only hold zero bytes (.fill, .aos, .soa)
+    bss: bool = False
+
+@dataclass
+class LinkConfig:
+    memory: Dict[str, Region]
+    segments: List[SegmentRule]
+    # Never placed in, nor written over by gap filling (see memmap.py)
+    forbidden: List[Region] = field(default_factory=list)
+
+    def rule(self, name: str) -> Optional[SegmentRule]:
+        for rule in self.segments:
+            if rule.name == name:
+                return rule
+        return None
+
+# One area from above the BASIC program start up to DOS at $9600
+DEFAULT_CONFIG = {
+    "memory": {"MAIN": {"start": "$0800", "size": "$8E00"}},
+    "segments": [
+        {"name": DEFAULT_SECTION, "memory": "MAIN"},
+        {"name": "rodata", "memory": "MAIN"},
+        {"name": "data", "memory": "MAIN"},
+        {"name": "bss", "memory": "MAIN", "type": "bss"},
+    ],
+}
+
+def parse_number(value) -> int:
+    # Config numbers may be JSON integers or "$0800"/"0x0800" strings
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if text.startswith('$'):
+        return int(text[1:], 16)
+    return int(text, 0)
+
+def _region(name: str, entry: dict) -> Region:
+    # "end" is inclusive, as in $0400-$07FF
+    start = parse_number(entry["start"])
+    end = parse_number(entry["end"]) + 1 if "end" in entry else start + parse_number(entry["size"])
+    if not 0 <= start <= end <= 0x10000:
+        raise LinkError(f"Memory region {name} does not fit in 64K")
+    return Region(name, start, end)
+
+def parse_config(doc: dict) -> LinkConfig:
+    """
+    Reads a memory config: memory areas, regions to stay out of (named
+    Apple II regions or explicit ones), and the segments, placed in order.
+
+        {"memory": {"MAIN": {"start": "$0800", "end": "$95FF"}},
+         "forbid": ["hires1", {"name": "buffers", "start": "$9000", "end": "$95FF"}],
+         "segments": [{"name": "code", "memory": "MAIN"},
+                      {"name": "tables", "align": 256},
+                      {"name": "bss", "type": "bss"}]}
+    """
+    try:
+        memory = {name: _region(name, area) for name, area in doc["memory"].items()}
+        forbidden = []
+        for entry in doc.get("forbid", []):
+            if isinstance(entry, str):
+                forbidden.append(preset(entry))
+            else:
+                forbidden.append(_region(entry.get("name", "forbidden"), entry))
+        segments = []
+        for entry in doc["segments"]:
+            rule = SegmentRule(entry["name"], entry.get("memory"),
+                               parse_number(entry["start"]) if "start" in entry else None,
+                               parse_number(entry.get("align", 1)), entry.get("type", "rw") == "bss")
+            if rule.memory is not None and rule.memory not in memory:
+                raise LinkError(f"Segment '{rule.name}' is in unknown memory area {rule.memory}")
+            if rule.align < 1:
+                raise LinkError(f"Segment '{rule.name}' has alignment {rule.align}")
+            segments.append(rule)
+    except (MemoryMapError, KeyError, TypeError, ValueError) as e:
+        raise LinkError(f"Invalid memory config: {e}")
+    return LinkConfig(memory, segments, forbidden)
+
+def load_config(path: str = None) -> LinkConfig:
+    if path is None:
+        return parse_config(DEFAULT_CONFIG)
+    with open(path, "r") as f:
+        try:
+            doc = json.load(f)
+        except json.JSONDecodeError as e:
+            raise LinkError(f"Invalid memory config {path}: {e}")
+    return parse_config(doc)
+
+@dataclass
+class Placement:
+    """One object's section, at its final address."""
+    segment: str
+    filename: str
+    start: int
+    size: int
+    memory: str
+
+@dataclass
+class LinkResult:
+    # Runs of bytes to load, (address, data) by address: one unless the
+    # program has to skip a forbidden region or the space between areas
+    chunks: List[Tuple[int, bytearray]]
+    placements: List[Placement]
+    symbols: Dict[str, Tuple[int, str]] # name -> (address, defining file)
+    config: LinkConfig
+    memory: MemoryMap
+
+    @property
+    def origin(self) -> int:
+        return self._single()[0]
+
+    @property
+    def image(self) -> bytearray:
+        return self._single()[1]
+
+    def _single(self) -> Tuple[int, bytearray]:
+        if not self.chunks:
+            return 0, bytearray()
+        if len(self.chunks) > 1:
+            raise LinkError(f"The program is in {len(self.chunks)} separate pieces, not one image")
+        return self.chunks[0]
+
+    def used(self, area: str) -> int:
+        return sum(p.size for p in self.placements if p.memory == area)
+
+    def format_map(self) -> str:
+        lines = ["Segments:"]
+        for p in self.placements:
+            end = f"${p.start + p.size - 1:04X}" if p.size else "     "
+            lines.append(f"  {p.segment:<12} ${p.start:04X}-{end} {p.size:>6} bytes  {p.memory:<8} {p.filename}")
+        lines.append("Memory areas:")
+        for area in self.config.memory.values():
+            # Forbidden regions count as neither used nor free
+            free = sum(end - start for start, end in self.memory.free[area.name])
+            lines.append(f"  {area.name:<12} ${area.start:04X}-${area.end - 1:04X} {self.used(area.name):>6} used {free:>6} free")
+        if self.config.forbidden:
+            lines.append("Forbidden:")
+            lines += [f"  {f.name:<12} ${f.start:04X}-${f.end - 1:04X}" for f in self.config.forbidden]
+        lines.append(self.memory.format_free())
+        lines.append("Symbols:")
+        for name, (value, filename) in sorted(self.symbols.items(), key=lambda s: (s[1][0], s[0])):
+            lines.append(f"  {name:<24} ${value:04X}  {filename}")
+        return "\n".join(lines)
+
+def _align(address: int, alignment: int) -> int:
+    return -(-address // alignment) * alignment
+
+def place(objects: List[ObjectFile], config: LinkConfig) -> Tuple[Dict[Tuple[int, str], Placement], MemoryMap]:
+    """
+    Addresses of every (object index, section name). Segments with a fixed
+    start go first; the rest, in config order, take the lowest free address
+    where they fit (first fit), so they can fill the holes around forbidden
+    regions. Sections of one segment stay together, in command-line order.
+    """
+    for obj in objects:
+        for name in obj.sections:
+            if config.rule(name) is None:
+                raise LinkError(f"{obj.filename}: segment '{name}' is not in the memory config")
+
+    memory = MemoryMap(list(config.memory.values()), config.forbidden)
+    placements = {}
+    rules = [r for r in config.segments if r.start is not None] + [r for r in config.segments if r.start is None]
+    for rule in rules:
+        pieces = [(index, obj.sections[rule.name]) for index, obj in enumerate(objects) if rule.name in obj.sections]
+        if not pieces:
+            continue
+
+        def end_at(address: int) -> int:
+            for _, section in pieces:
+                address = _align(address, section.align) + len(section.data)
+            return address
+
+        align = math.lcm(rule.align, pieces[0][1].align)
+        start = _align(rule.start, rule.align) if rule.start is not None else None
+        try:
+            address, _, area = memory.allocate(rule.name, end_at, align, start,
+                                               [rule.memory] if rule.memory else None)
+        except MemoryMapError as e:
+            raise LinkError(str(e))
+        for index, section in pieces:
+            address = _align(address, section.align)
+            placements[(index, rule.name)] = Placement(rule.name, objects[index].filename, address,
+                                                       len(section.data), area)
+            address += len(section.data)
+    return placements, memory
+
+def _global_symbols(objects: List[ObjectFile], placements) -> Dict[str, Tuple[int, str]]:
+    # Every placed segment also gets __name_start__, __name_end__ and
+    # __name_size__, which modules can .import (say, for a buffer's limit)
+    bounds = {}
+    for p in placements.values():
+        start, end = bounds.get(p.segment, (p.start, p.start + p.size))
+        bounds[p.segment] = (min(start, p.start), max(end, p.start + p.size))
+    symbols = {}
+    for segment, (start, end) in bounds.items():
+        for suffix, value in (('start', start), ('end', end), ('size', end - start)):
+            symbols[f"__{segment}_{suffix}__"] = (value, "(linker)")
+    for index, obj in enumerate(objects):
+        for export in obj.exports:
+            if export.name in symbols:
+                raise LinkError(f"Symbol '{export.name}' is exported by both {symbols[export.name][1]} and {obj.filename}")
+            value = export.value
+            if export.section is not None:
+                value += placements[(index, export.section)].start
+            symbols[export.name] = (value, obj.filename)
+    return symbols
+
+def _patch(data: bytearray, r: Relocation, value: int, address: int, where: str):
+    if r.type == 'ABS':
+        if not 0 <= value <= 0xFFFF:
+            raise LinkError(f"{where}: address ${value:X} does not fit in 16 bits")
+        data[r.offset] = value & 0xFF
+        data[r.offset + 1] = value >> 8
+    elif r.type == 'LOW':
+        data[r.offset] = value & 0xFF
+    elif r.type == 'HIGH':
+        data[r.offset] = (value >> 8) & 0xFF
+    else:
+        # The offset counts from the instruction after the branch
+        offset = value - (address + r.offset + 1)
+        if not -128 <= offset <= 127:
+            raise LinkError(f"{where}: branch to ${value:04X} out of range ({offset})")
+        data[r.offset] = offset & 0xFF
+
+def link(objects: List[ObjectFile], config: LinkConfig = None) -> LinkResult:
+    """
+    Places the sections of objects (in command-line order within each
+    segment), resolves imports against the exports and applies every
+    relocation. Placed bytes outside bss segments are joined into chunks,
+    zero-filling the gaps that are allowed memory.
+    """
+    config = config or load_config()
+    placements, memory = place(objects, config)
+    symbols = _global_symbols(objects, placements)
+
+    pieces = []
+    for index, obj in enumerate(objects):
+        for name, section in obj.sections.items():
+            placement = placements[(index, name)]
+            data = bytearray(section.data)
+            for r in section.relocations:
+                where = f"{obj.filename}: {name}+${r.offset:04X}"
+                if r.symbol is not None:
+                    if r.symbol not in symbols:
+                        raise LinkError(f"{obj.filename}: unresolved import '{r.symbol}'")
+                    base = symbols[r.symbol][0]
+                elif r.section is not None:
+                    if (index, r.section) not in placements:
+                        raise LinkError(f"{where}: relocation against missing section '{r.section}'")
+                    base = placements[(index, r.section)].start
+                else:
+                    base = 0
+                _patch(data, r, base + r.addend, placement.start, where)
+            if config.rule(name).bss:
+                if any(data):
+                    raise LinkError(f"{obj.filename}: segment '{name}' is bss but holds data")
+                continue
+            if data:
+                pieces.append((placement.start, data))
+
+    chunks = []
+    for start, data in sorted(pieces, key=lambda piece: piece[0]):
+        if chunks:
+            last_start, last = chunks[-1]
+            gap = last_start + len(last)
+            if memory.loadable(gap, start):
+                last.extend(bytes(start - gap))
+                last.extend(data)
+                continue
+        chunks.append((start, bytearray(data)))
+    ordered = sorted(placements.values(), key=lambda p: p.start)
+    return LinkResult(chunks, ordered, symbols, config, memory)
+
+def link_files(paths: List[str], config_path: str = None) -> LinkResult:
+    objects = [ObjectFile.load(path) for path in paths]
+    return link(objects, load_config(config_path))
@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .tokenizer import Token, TokenType, CONDITIONAL_OPENERS
+
+class MacroError(Exception):
+    pass
+
+@dataclass
+class MacroDef:
+    name: str
+    params: List[str]
+    body: List[Token] # Raw tokens between .macro and .endm
+    filename: Optional[str] = None
+    line: int = 0
+    # Parsed bodies by argument tuple; every call with the same arguments shares one
+    expansions: Dict[tuple, tuple] = field(default_factory=dict)
+
+def argument_key(args: List[List[Token]]) -> tuple:
+    return tuple(tuple((t.type, t.lexeme) for t in arg) for arg in args)
+
+def split_arguments(tokens: List[Token]) -> List[List[Token]]:
+    """Splits a call's tokens at the commas outside parentheses."""
+    args: List[List[Token]] = [[]]
+    depth = 0
+    for tok in tokens:
+        if tok.type == TokenType.OP and tok.lexeme == ',' and depth == 0:
+            args.append([])
+            continue
+        if tok.type == TokenType.OP and tok.lexeme == '(':
+            depth += 1
+        elif tok.type == TokenType.OP and tok.lexeme == ')':
+            depth -= 1
+        args[-1].append(tok)
+    return [] if args == [[]] else args
+
+def substitute(macro: MacroDef, args: List[List[Token]]) -> List[Token]:
+    if len(args) != len(macro.params):
+        raise MacroError(f"Macro '{macro.name}' takes {len(macro.params)} argument(s), got {len(args)}")
+    for i, arg in enumerate(args):
+        if not arg:
+            raise MacroError(f"Argument {i + 1} of macro '{macro.name}' is empty")
+    values = dict(zip(macro.params, args))
+    tokens = []
+    for tok in macro.body:
+        if tok.type == TokenType.ID and tok.lexeme in values:
+            tokens.extend(values[tok.lexeme])
+        else:
+            tokens.append(tok)
+    return tokens
+
+class TokenStream:
+    """Replays a list of tokens with the Tokenizer interface the Parser uses."""
+    def __init__(self, tokens: List[Token], filename: str = None, line: int = 0):
+        self.tokens = tokens
+        self.pos = 0
+        self.filename = filename
+        self.line = line
+
+    def next_token(self) -> Token:
+        if self.pos < len(self.tokens):
+            tok = self.tokens[self.pos]
+            self.pos += 1
+            self.line = tok.line
+            return tok
+        return Token(TokenType.EOF, "", None, self.line, self.filename)
+
+    def skip_conditional(self) -> Tuple[Optional[str], int]:
+        # Same contract as Tokenizer.skip_conditional, over whole token lines
+        lines = 0
+        depth = 0
+        at_line_start = True
+        while self.pos < len(self.tokens):
+            tok = self.tokens[self.pos]
+            self.pos += 1
+            if tok.type == TokenType.EOL:
+                lines += 1
+                at_line_start = True
+                continue
+            if at_line_start and tok.type == TokenType.DIR:
+                if tok.lexeme in CONDITIONAL_OPENERS:
+                    depth += 1
+                elif tok.lexeme == '.endif' or (tok.lexeme == '.else' and depth == 0):
+                    if depth == 0:
+                        self._skip_line()
+                        return tok.lexeme, lines + 1
+                    depth -= 1
+            at_line_start = False
+        return None, lines
+
+    def _skip_line(self):
+        while self.pos < len(self.tokens) and self.tokens[self.pos].type != TokenType.EOL:
+            self.pos += 1
+        self.pos += 1
@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+class MemoryMapError(Exception):
+    pass
+
+@dataclass
+class Region:
+    name: str
+    start: int
+    end: int # Exclusive
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    def format(self) -> str:
+        return f"{self.name} ${self.start:04X}-${self.end - 1:04X}"
+
+# Apple II memory a program usually has to stay out of, by the names a
+# memory config can "forbid". DOS 3.3 with MAXFILES 3 starts at $9600
+APPLE2_REGIONS = {
+    "zeropage": (0x0000, 0x0100),
+    "stack": (0x0100, 0x0200),
+    "input": (0x0200, 0x0300),     # GETLN input buffer
+    "vectors": (0x03D0, 0x0400),   # DOS and monitor vectors
+    "text1": (0x0400, 0x0800),     # also lo-res page 1
+    "text2": (0x0800, 0x0C00),
+    "hires1": (0x2000, 0x4000),
+    "hires2": (0x4000, 0x6000),
+    "dos": (0x9600, 0xC000),
+    "io": (0xC000, 0xD000),
+    "rom": (0xD000, 0x10000),
+}
+
+def preset(name: str) -> Region:
+    if name not in APPLE2_REGIONS:
+        raise MemoryMapError(f"Unknown memory region '{name}' (known: {', '.join(APPLE2_REGIONS)})")
+    return Region(name, *APPLE2_REGIONS[name])
+
+def _align(address: int, alignment: int) -> int:
+    return -(-address // alignment) * alignment
+
+class MemoryMap:
+    """
+    The free memory of some allowed regions (the memory areas of a link
+    config) less the forbidden ones, handed out as segments are placed.
+    Allowed regions may not overlap each other.
+    """
+    def __init__(self, allowed: List[Region], forbidden: List[Region] = ()):
+        ordered = sorted(allowed, key=lambda r: r.start)
+        for a, b in zip(ordered, ordered[1:]):
+            if b.start < a.end:
+                raise MemoryMapError(f"Memory areas {a.format()} and {b.format()} overlap")
+        self.allowed = list(allowed)
+        self.forbidden = list(forbidden)
+        # Free intervals per allowed region, each sorted by address
+        self.free: Dict[str, List[Tuple[int, int]]] = {}
+        for region in self.allowed:
+            intervals = [(region.start, region.end)]
+            for f in self.forbidden:
+                intervals = [piece for start, end in intervals for piece in
+                             ((start, min(end, f.start)), (max(start, f.end), end)) if piece[0] < piece[1]]
+            self.free[region.name] = intervals
+
+    def region_of(self, address: int) -> Optional[Region]:
+        for region in self.allowed:
+            if region.start <= address < region.end:
+                return region
+        return None
+
+    def is_free(self, start: int, end: int) -> bool:
+        return any(s <= start and end <= e for intervals in self.free.values() for s, e in intervals)
+
+    def loadable(self, start: int, end: int) -> bool:
+        """True if start-end lies in one memory area and no forbidden region, so it may be zero-filled."""
+        if start >= end:
+            return True
+        region = self.region_of(start)
+        if region is None or end > region.end:
+            return False
+        return not any(f.start < end and start < f.end for f in self.forbidden)
+
+    def _blocker(self, start: int, end: int) -> str:
+        # Why start-end is not free, for error messages
+        for f in self.forbidden:
+            if f.start < end and start < f.end:
+                return f"forbidden region {f.format()}"
+        if self.region_of(start) is None or self.region_of(end - 1) is None:
+            return "memory outside the memory areas"
+        return "memory already used"
+
+    def _take(self, area: str, start: int, end: int):
+        intervals = self.free[area]
+        for i, (s, e) in enumerate(intervals):
+            if s <= start and end <= e:
+                intervals[i:i + 1] = [piece for piece in ((s, start), (end, e)) if piece[0] < piece[1]]
+                return
+        raise MemoryMapError(f"${start:04X}-${end - 1:04X} is not free")
+
+    def allocate(self, name: str, end_at: Callable[[int], int], align: int = 1,
+                 start: Optional[int] = None, areas: List[str] = None) -> Tuple[int, int, str]:
+        """
+        Places a block named name and returns its (start, end, area). end_at
+        gives the end for a start address (alignment inside the block makes
+        its size depend on it). Without a fixed start the block goes first
+        fit: at the lowest address of the given areas (all by default) where
+        it fits in free memory.
+        """
+        areas = areas or [region.name for region in self.allowed]
+        if start is not None:
+            end = end_at(start)
+            region = self.region_of(start)
+            if region is None or region.name not in areas or not self.is_free(start, end) or end > region.end:
+                raise MemoryMapError(f"'{name}' at ${start:04X}-${max(end, start + 1) - 1:04X} overlaps "
+                                     f"{self._blocker(start, max(end, start + 1))}")
+            self._take(region.name, start, end)
+            return start, end, region.name
+        candidates = sorted((s, e, area) for area in areas for s, e in self.free[area])
+        for s, e, area in candidates:
+            address = _align(s, align)
+            end = end_at(address)
+            if end <= e:
+                self._take(area, address, end)
+                return address, end, area
+        largest = max((e - s for s, e, _ in candidates), default=0)
+        size = end_at(0)
+        raise MemoryMapError(f"No free memory for '{name}' ({size} bytes); the largest free block "
+                             f"in {', '.join(areas)} is {largest} bytes")
+
+    def free_regions(self) -> List[Tuple[int, int, str]]:
+        return sorted((s, e, area) for area, intervals in self.free.items() for s, e in intervals)
+
+    def format_free(self) -> str:
+        blocks = self.free_regions()
+        lines = [f"Free memory: {sum(e - s for s, e, _ in blocks)} bytes in {len(blocks)} block(s)"]
+        for s, e, area in blocks:
+            lines.append(f"  ${s:04X}-${e - 1:04X} {e - s:>6} bytes  {area}")
+        return "\n".join(lines)
@@ -0,0 +1,107 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Object files are JSON rather than the binary o65 layout, so that they can
+# be read, diffed and checked in tests without a dump tool
+OBJECT_FORMAT = "asm65-object"
+OBJECT_VERSION = 1
+
+RELOCATION_TYPES = ('ABS', 'LOW', 'HIGH', 'REL')
+
+# Where code goes until the first .segment
+DEFAULT_SECTION = "code"
+
+class ObjectError(Exception):
+    pass
+
+@dataclass
+class Relocation:
+    """
+    A field at offset in its section that the linker fills with the address
+    of section (in the same object) or of an imported symbol, plus addend.
+    Neither is set for an absolute branch target. ABS is a 16-bit word,
+    LOW/HIGH one byte of the address and REL a branch offset from the byte
+    after the field.
+    """
+    offset: int
+    type: str
+    addend: int
+    section: Optional[str] = None
+    symbol: Optional[str] = None
+
+@dataclass
+class Section:
+    """Code and data of one .segment of a module, assembled from address 0."""
+    name: str
+    data: bytearray = field(default_factory=bytearray)
+    # The linker starts the section on a multiple of align; page-sensitive
+    # directives (.align, .hot, .table_aligned, .soa page) raise it
+    align: int = 1
+    relocations: List[Relocation] = field(default_factory=list)
+
+@dataclass
+class Export:
+    name: str
+    value: int
+    section: Optional[str] = None # None for a constant
+
+@dataclass
+class ObjectFile:
+    sections: Dict[str, Section] = field(default_factory=dict)
+    exports: List[Export] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    filename: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(s.data) for s in self.sections.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "format": OBJECT_FORMAT,
+            "version": OBJECT_VERSION,
+            "sections": [{
+                "name": s.name,
+                "align": s.align,
+                "data": s.data.hex(),
+                "relocations": [{k: v for k, v in vars(r).items() if v is not None} for r in s.relocations],
+            } for s in self.sections.values()],
+            "exports": [{k: v for k, v in vars(e).items() if v is not None} for e in self.exports],
+            "imports": list(self.imports),
+        }
+
+    @classmethod
+    def from_dict(cls, doc: dict, filename: str = None) -> 'ObjectFile':
+        where = filename or "object"
+        if doc.get("format") != OBJECT_FORMAT:
+            raise ObjectError(f"{where} is not an asm65 object file")
+        if doc.get("version") != OBJECT_VERSION:
+            raise ObjectError(f"{where} has object format version {doc.get('version')}, expected {OBJECT_VERSION}")
+        obj = cls(filename=filename, imports=list(doc.get("imports", [])))
+        try:
+            for s in doc.get("sections", []):
+                section = Section(s["name"], bytearray.fromhex(s["data"]), s.get("align", 1),
+                                  [Relocation(**r) for r in s.get("relocations", [])])
+                for r in section.relocations:
+                    if r.type not in RELOCATION_TYPES:
+                        raise ObjectError(f"{where}: unknown relocation type {r.type}")
+                obj.sections[section.name] = section
+            obj.exports = [Export(**e) for e in doc.get("exports", [])]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ObjectError(f"{where} is malformed: {e}")
+        return obj
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=1)
+            f.write("\n")
+
+    @classmethod
+    def load(cls, path: str) -> 'ObjectFile':
+        with open(path, "r") as f:
+            try:
+                doc = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ObjectError(f"{path} is not an asm65 object file: {e}")
+        return cls.from_dict(doc, path)
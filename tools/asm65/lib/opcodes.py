@@ -1,6 +1,37 @@
 
 # 6502 Opcodes
 # Structure: { Mnemonic: { AddressingMode: Opcode } }
+# Cycle counts use the same shape: { Mnemonic: { AddressingMode: Cycles } }
+#
+# The tables are frozen so that CPU modes can share mode dicts instead of
+# deep-copying them. Only the 6502 table is built at import; the others are
+# built on first use through opcode_table().
+
+from typing import NamedTuple
+
+class FrozenTable(dict):
+    # A dict that refuses modification once built
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("opcode tables are read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __ior__(self, other):
+        self._readonly()
+
+    def __reduce__(self):
+        return (FrozenTable, (dict(self),))
+
+def freeze(table: dict) -> FrozenTable:
+    return FrozenTable((mnemonic, FrozenTable(modes)) for mnemonic, modes in table.items())
+
+def extend(base: FrozenTable, additions: dict) -> FrozenTable:
+    # New mnemonics are added and existing ones get their modes merged
+    table = dict(base)
+    for mnemonic, modes in additions.items():
+        table[mnemonic] = FrozenTable({**base.get(mnemonic, {}), **modes})
+    return FrozenTable(table)
 
 OPCODES_6502 = {
     # Load/Store
@@ -81,42 +112,281 @@ OPCODES_6502 = {
     'TXS': { 'IMP': 0x9A },
 }
 
+OPCODES_6502 = freeze(OPCODES_6502)
+
 OPCODES = OPCODES_6502
 
-import copy
-OPCODES_65C02 = copy.deepcopy(OPCODES_6502)
-
-# Add 65C02 specific opcodes
-# BRA
-OPCODES_65C02['BRA'] = { 'REL': 0x80 }
-# Push/Pop index
-OPCODES_65C02['PHX'] = { 'IMP': 0xDA }
-OPCODES_65C02['PLX'] = { 'IMP': 0xFA }
-OPCODES_65C02['PHY'] = { 'IMP': 0x5A }
-OPCODES_65C02['PLY'] = { 'IMP': 0x7A }
-# STZ
-OPCODES_65C02['STZ'] = { 'ZP': 0x64, 'ZPX': 0x74, 'ABS': 0x9C, 'ABSX': 0x9E }
-# TRB/TSB
-OPCODES_65C02['TRB'] = { 'ZP': 0x14, 'ABS': 0x1C }
-OPCODES_65C02['TSB'] = { 'ZP': 0x04, 'ABS': 0x0C }
-# BIT (immediate, ZPX, ABSX)
-OPCODES_65C02['BIT']['#'] = 0x89
-OPCODES_65C02['BIT']['ZPX'] = 0x34
-OPCODES_65C02['BIT']['ABSX'] = 0x3C
-# INC/DEC Accumulator
-OPCODES_65C02['INC']['ACC'] = 0x1A
-OPCODES_65C02['DEC']['ACC'] = 0x3A
-
-# Indirect (zp) support for ADC, AND, CMP, EOR, LDA, ORA, SBC, STA
-OPCODES_65C02['ADC']['IND'] = 0x72
-OPCODES_65C02['AND']['IND'] = 0x32
-OPCODES_65C02['CMP']['IND'] = 0xD2
-OPCODES_65C02['EOR']['IND'] = 0x52
-OPCODES_65C02['LDA']['IND'] = 0xB2
-OPCODES_65C02['ORA']['IND'] = 0x12
-OPCODES_65C02['SBC']['IND'] = 0xF2
-OPCODES_65C02['STA']['IND'] = 0x92
-
-# JMP (abs,X)
-# We will use 'INDX' mode logic but force 2-byte operand in compiler
-OPCODES_65C02['JMP']['INDX'] = 0x7C
+# 65C02 additions, merged over the 6502 table
+_ADDITIONS_65C02 = {
+    # BRA
+    'BRA': { 'REL': 0x80 },
+    # Push/Pop index
+    'PHX': { 'IMP': 0xDA },
+    'PLX': { 'IMP': 0xFA },
+    'PHY': { 'IMP': 0x5A },
+    'PLY': { 'IMP': 0x7A },
+    # STZ
+    'STZ': { 'ZP': 0x64, 'ZPX': 0x74, 'ABS': 0x9C, 'ABSX': 0x9E },
+    # TRB/TSB
+    'TRB': { 'ZP': 0x14, 'ABS': 0x1C },
+    'TSB': { 'ZP': 0x04, 'ABS': 0x0C },
+    # BIT (immediate, ZPX, ABSX)
+    'BIT': { '#': 0x89, 'ZPX': 0x34, 'ABSX': 0x3C },
+    # INC/DEC Accumulator
+    'INC': { 'ACC': 0x1A },
+    'DEC': { 'ACC': 0x3A },
+    # Indirect (zp) support for ADC, AND, CMP, EOR, LDA, ORA, SBC, STA
+    'ADC': { 'IND': 0x72 },
+    'AND': { 'IND': 0x32 },
+    'CMP': { 'IND': 0xD2 },
+    'EOR': { 'IND': 0x52 },
+    'LDA': { 'IND': 0xB2 },
+    'ORA': { 'IND': 0x12 },
+    'SBC': { 'IND': 0xF2 },
+    'STA': { 'IND': 0x92 },
+    # JMP (abs,X)
+    # We will use 'INDX' mode logic but force 2-byte operand in compiler
+    'JMP': { 'INDX': 0x7C },
+}
+
+def _build_65c02() -> FrozenTable:
+    return extend(OPCODES_6502, _ADDITIONS_65C02)
+
+# Stable undocumented NMOS 6502 instructions, merged over the 6502 table.
+# The unstable ones (XAA, LAX #, SHA, SHX, SHY, TAS, LAS) are left out
+_ADDITIONS_6502X = {
+    # Load A and X / store A AND X
+    'LAX': { 'ZP': 0xA7, 'ZPY': 0xB7, 'ABS': 0xAF, 'ABSY': 0xBF, 'INDX': 0xA3, 'INDY': 0xB3 },
+    'SAX': { 'ZP': 0x87, 'ZPY': 0x97, 'ABS': 0x8F, 'INDX': 0x83 },
+    # Read-modify-write, then an ALU operation with the result
+    'SLO': { 'ZP': 0x07, 'ZPX': 0x17, 'ABS': 0x0F, 'ABSX': 0x1F, 'ABSY': 0x1B, 'INDX': 0x03, 'INDY': 0x13 },
+    'RLA': { 'ZP': 0x27, 'ZPX': 0x37, 'ABS': 0x2F, 'ABSX': 0x3F, 'ABSY': 0x3B, 'INDX': 0x23, 'INDY': 0x33 },
+    'SRE': { 'ZP': 0x47, 'ZPX': 0x57, 'ABS': 0x4F, 'ABSX': 0x5F, 'ABSY': 0x5B, 'INDX': 0x43, 'INDY': 0x53 },
+    'RRA': { 'ZP': 0x67, 'ZPX': 0x77, 'ABS': 0x6F, 'ABSX': 0x7F, 'ABSY': 0x7B, 'INDX': 0x63, 'INDY': 0x73 },
+    'DCP': { 'ZP': 0xC7, 'ZPX': 0xD7, 'ABS': 0xCF, 'ABSX': 0xDF, 'ABSY': 0xDB, 'INDX': 0xC3, 'INDY': 0xD3 },
+    'ISC': { 'ZP': 0xE7, 'ZPX': 0xF7, 'ABS': 0xEF, 'ABSX': 0xFF, 'ABSY': 0xFB, 'INDX': 0xE3, 'INDY': 0xF3 },
+    # Immediate AND combined with a shift or carry
+    'ANC': { '#': 0x0B },
+    'ALR': { '#': 0x4B },
+    'ARR': { '#': 0x6B },
+}
+
+def _build_6502x() -> FrozenTable:
+    return extend(OPCODES_6502, _ADDITIONS_6502X)
+
+# Rockwell bit instructions, merged over the 65C02 table: RMBn/SMBn zp
+# clear or set bit n; BBRn/BBSn zp, target branch if it is clear or set
+_ADDITIONS_R65C02 = {}
+for _bit in range(8):
+    _ADDITIONS_R65C02[f'RMB{_bit}'] = { 'ZP': 0x07 + 0x10 * _bit }
+    _ADDITIONS_R65C02[f'SMB{_bit}'] = { 'ZP': 0x87 + 0x10 * _bit }
+    _ADDITIONS_R65C02[f'BBR{_bit}'] = { 'ZPREL': 0x0F + 0x10 * _bit }
+    _ADDITIONS_R65C02[f'BBS{_bit}'] = { 'ZPREL': 0x8F + 0x10 * _bit }
+
+# WDC parts also stop the clock until an interrupt, or for good
+_ADDITIONS_WDC = {
+    'WAI': { 'IMP': 0xCB },
+    'STP': { 'IMP': 0xDB },
+}
+
+# 65816 additions, merged over the 65C02 table (the Rockwell bit
+# instructions' opcodes are the long modes here). LONG is a 24-bit
+# address, SR d,S and SRIY (d,S),Y are stack relative, INDL [d] and
+# INDLY [d],Y go through a 24-bit pointer, RELL is a 16-bit branch
+# offset and BLK the two banks of a block move
+_ADDITIONS_65816 = {
+    'ORA': { 'LONG': 0x0F, 'LONGX': 0x1F, 'SR': 0x03, 'SRIY': 0x13, 'INDL': 0x07, 'INDLY': 0x17 },
+    'AND': { 'LONG': 0x2F, 'LONGX': 0x3F, 'SR': 0x23, 'SRIY': 0x33, 'INDL': 0x27, 'INDLY': 0x37 },
+    'EOR': { 'LONG': 0x4F, 'LONGX': 0x5F, 'SR': 0x43, 'SRIY': 0x53, 'INDL': 0x47, 'INDLY': 0x57 },
+    'ADC': { 'LONG': 0x6F, 'LONGX': 0x7F, 'SR': 0x63, 'SRIY': 0x73, 'INDL': 0x67, 'INDLY': 0x77 },
+    'STA': { 'LONG': 0x8F, 'LONGX': 0x9F, 'SR': 0x83, 'SRIY': 0x93, 'INDL': 0x87, 'INDLY': 0x97 },
+    'LDA': { 'LONG': 0xAF, 'LONGX': 0xBF, 'SR': 0xA3, 'SRIY': 0xB3, 'INDL': 0xA7, 'INDLY': 0xB7 },
+    'CMP': { 'LONG': 0xCF, 'LONGX': 0xDF, 'SR': 0xC3, 'SRIY': 0xD3, 'INDL': 0xC7, 'INDLY': 0xD7 },
+    'SBC': { 'LONG': 0xEF, 'LONGX': 0xFF, 'SR': 0xE3, 'SRIY': 0xF3, 'INDL': 0xE7, 'INDLY': 0xF7 },
+    # Long jumps and calls; JMP to a 24-bit address is JML
+    'JMP': { 'LONG': 0x5C, 'INDL': 0xDC },
+    'JML': { 'LONG': 0x5C, 'INDL': 0xDC },
+    'JSL': { 'LONG': 0x22 },
+    'JSR': { 'INDX': 0xFC },
+    'RTL': { 'IMP': 0x6B },
+    'BRL': { 'RELL': 0x82 },
+    # Stack
+    'PEA': { 'ABS': 0xF4 },
+    'PEI': { 'IND': 0xD4 },
+    'PER': { 'RELL': 0x62 },
+    'PHB': { 'IMP': 0x8B },
+    'PLB': { 'IMP': 0xAB },
+    'PHD': { 'IMP': 0x0B },
+    'PLD': { 'IMP': 0x2B },
+    'PHK': { 'IMP': 0x4B },
+    # Status bits, modes and register transfers
+    'REP': { '#': 0xC2 },
+    'SEP': { '#': 0xE2 },
+    'XCE': { 'IMP': 0xFB },
+    'XBA': { 'IMP': 0xEB },
+    'TCD': { 'IMP': 0x5B },
+    'TDC': { 'IMP': 0x7B },
+    'TCS': { 'IMP': 0x1B },
+    'TSC': { 'IMP': 0x3B },
+    'TXY': { 'IMP': 0x9B },
+    'TYX': { 'IMP': 0xBB },
+    'COP': { '#': 0x02 },
+    'WDM': { '#': 0x42 },
+    # Block moves: MVN/MVP srcbank, destbank
+    'MVN': { 'BLK': 0x54 },
+    'MVP': { 'BLK': 0x44 },
+    **_ADDITIONS_WDC,
+}
+
+# Immediates that are 16-bit with a 16-bit accumulator (.a16) or index registers (.i16)
+ACCUMULATOR_IMMEDIATES = ('ADC', 'AND', 'BIT', 'CMP', 'EOR', 'LDA', 'ORA', 'SBC')
+INDEX_IMMEDIATES = ('CPX', 'CPY', 'LDX', 'LDY')
+_ACCUMULATOR_WIDTH = ACCUMULATOR_IMMEDIATES + ('STA', 'STZ', 'PHA', 'PLA')
+_ACCUMULATOR_RMW = ('ASL', 'LSR', 'ROL', 'ROR', 'INC', 'DEC', 'TRB', 'TSB')
+_INDEX_WIDTH = INDEX_IMMEDIATES + ('STX', 'STY', 'PHX', 'PHY', 'PLX', 'PLY')
+
+def width_cycles(mnemonic: str, mode: str, a16: bool, i16: bool) -> int:
+    """Cycles a 65816 instruction takes on top of the table for its 16-bit registers."""
+    if a16 and mnemonic in _ACCUMULATOR_RMW and mode != 'ACC':
+        return 2 # Reads and writes a byte more
+    if (a16 and mnemonic in _ACCUMULATOR_WIDTH) or (i16 and mnemonic in _INDEX_WIDTH):
+        return 1
+    return 0
+
+# CPU name (as used by .cpu) -> table builder
+_BUILDERS = {
+    '6502': lambda: OPCODES_6502,
+    '65c02': _build_65c02,
+    '6502x': _build_6502x,
+    'r65c02': lambda: extend(opcode_table('65c02'), _ADDITIONS_R65C02),
+    'w65c02': lambda: extend(opcode_table('65c02'), {**_ADDITIONS_R65C02, **_ADDITIONS_WDC}),
+    '65816': lambda: extend(opcode_table('65c02'), _ADDITIONS_65816),
+}
+_TABLES = {'6502': OPCODES_6502}
+
+def cpu_names() -> list:
+    return list(_BUILDERS)
+
+def opcode_table(cpu: str) -> FrozenTable:
+    """Returns the opcode table for a CPU name, building it on first use."""
+    table = _TABLES.get(cpu)
+    if table is None:
+        table = _TABLES[cpu] = _BUILDERS[cpu]()
+    return table
+
+class Cycles(NamedTuple):
+    base: int
+    page: bool = False   # +1 when the indexed address crosses a page
+    branch: bool = False # +1 when taken, +1 more when the target is on another page
+
+_PAGE = True
+
+# Base cycles per addressing mode for each kind of instruction; a tuple
+# marks modes that take the page-crossing penalty
+_MODE_CYCLES = {
+    'read': {'#': 2, 'ZP': 3, 'ZPX': 4, 'ZPY': 4, 'ABS': 4, 'ABSX': (4, _PAGE), 'ABSY': (4, _PAGE),
+             'INDX': 6, 'INDY': (5, _PAGE), 'IND': 5,
+             'LONG': 5, 'LONGX': 5, 'SR': 4, 'SRIY': 7, 'INDL': 6, 'INDLY': 6},
+    'write': {'ZP': 3, 'ZPX': 4, 'ZPY': 4, 'ABS': 4, 'ABSX': 5, 'ABSY': 5, 'INDX': 6, 'INDY': 6, 'IND': 5,
+              'LONG': 5, 'LONGX': 5, 'SR': 4, 'SRIY': 7, 'INDL': 6, 'INDLY': 6},
+    'rmw': {'ACC': 2, 'ZP': 5, 'ZPX': 6, 'ABS': 6, 'ABSX': 7, 'ABSY': 7, 'INDX': 8, 'INDY': 8},
+}
+
+_KINDS = {
+    'read': ('LDA', 'LDX', 'LDY', 'ADC', 'SBC', 'CMP', 'CPX', 'CPY', 'AND', 'ORA', 'EOR', 'BIT',
+             'LAX', 'ANC', 'ALR', 'ARR'),
+    'write': ('STA', 'STX', 'STY', 'STZ', 'SAX'),
+    'rmw': ('ASL', 'LSR', 'ROL', 'ROR', 'INC', 'DEC', 'TRB', 'TSB', 'SLO', 'RLA', 'SRE', 'RRA', 'DCP', 'ISC'),
+}
+_KIND_OF = {mnemonic: kind for kind, mnemonics in _KINDS.items() for mnemonic in mnemonics}
+
+# Everything else: (mnemonic, mode) -> cycles, overriding the rules above
+_FIXED_CYCLES_6502 = {
+    ('JMP', 'ABS'): 3, ('JMP', 'IND'): 5, ('JSR', 'ABS'): 6, ('RTS', 'IMP'): 6,
+    ('BRK', 'IMP'): 7, ('PHA', 'IMP'): 3, ('PHP', 'IMP'): 3, ('PLA', 'IMP'): 4, ('PLP', 'IMP'): 4,
+}
+
+_FIXED_CYCLES_65C02 = {
+    # The 65C02 fixed JMP ($xxFF) at the cost of a cycle
+    ('JMP', 'IND'): 6, ('JMP', 'INDX'): 6,
+    ('PHX', 'IMP'): 3, ('PHY', 'IMP'): 3, ('PLX', 'IMP'): 4, ('PLY', 'IMP'): 4,
+    ('BIT', '#'): 2, ('BIT', 'ZPX'): 4, ('BIT', 'ABSX'): Cycles(4, page=True),
+    # Shifts (not INC/DEC) on abs,X only take the extra cycle on a page cross
+    ('ASL', 'ABSX'): Cycles(6, page=True), ('LSR', 'ABSX'): Cycles(6, page=True),
+    ('ROL', 'ABSX'): Cycles(6, page=True), ('ROR', 'ABSX'): Cycles(6, page=True),
+}
+
+_FIXED_CYCLES_R65C02 = {}
+for _bit in range(8):
+    _FIXED_CYCLES_R65C02.update({
+        (f'RMB{_bit}', 'ZP'): 5, (f'SMB{_bit}', 'ZP'): 5,
+        (f'BBR{_bit}', 'ZPREL'): Cycles(5, branch=True), (f'BBS{_bit}', 'ZPREL'): Cycles(5, branch=True),
+    })
+
+_FIXED_CYCLES_WDC = {('WAI', 'IMP'): 3, ('STP', 'IMP'): 3}
+
+# Counts with 8-bit registers (m = x = 1) and the direct page at a page
+# boundary: 16-bit accesses take one cycle more per extra byte
+_FIXED_CYCLES_65816 = {
+    ('JMP', 'INDX'): 6, ('JMP', 'LONG'): 4, ('JMP', 'INDL'): 6, ('JML', 'LONG'): 4, ('JML', 'INDL'): 6,
+    ('JSL', 'LONG'): 8, ('JSR', 'INDX'): 8, ('RTL', 'IMP'): 6, ('BRL', 'RELL'): 4,
+    ('PHX', 'IMP'): 3, ('PHY', 'IMP'): 3, ('PLX', 'IMP'): 4, ('PLY', 'IMP'): 4,
+    ('BIT', '#'): 2, ('BIT', 'ZPX'): 4, ('BIT', 'ABSX'): Cycles(4, page=True),
+    ('PEA', 'ABS'): 5, ('PEI', 'IND'): 6, ('PER', 'RELL'): 6,
+    ('PHB', 'IMP'): 3, ('PLB', 'IMP'): 4, ('PHD', 'IMP'): 4, ('PLD', 'IMP'): 5, ('PHK', 'IMP'): 3,
+    ('REP', '#'): 3, ('SEP', '#'): 3, ('XBA', 'IMP'): 3, ('COP', '#'): 7, ('WDM', '#'): 2,
+    ('MVN', 'BLK'): 7, ('MVP', 'BLK'): 7, # per byte moved
+    **_FIXED_CYCLES_WDC,
+}
+
+def _cycles(value) -> Cycles:
+    if isinstance(value, Cycles):
+        return value
+    if isinstance(value, tuple):
+        return Cycles(value[0], page=value[1])
+    return Cycles(value)
+
+def build_cycles(opcodes: FrozenTable, fixed: dict) -> FrozenTable:
+    """Derives a cycle table covering every (mnemonic, mode) of an opcode table."""
+    table = {}
+    for mnemonic, modes in opcodes.items():
+        entry = {}
+        for mode in modes:
+            if (mnemonic, mode) in fixed:
+                entry[mode] = _cycles(fixed[(mnemonic, mode)])
+            elif mode == 'REL':
+                entry[mode] = Cycles(2, branch=True)
+            elif mnemonic in _KIND_OF and mode in _MODE_CYCLES[_KIND_OF[mnemonic]]:
+                entry[mode] = _cycles(_MODE_CYCLES[_KIND_OF[mnemonic]][mode])
+            elif mode in ('IMP', 'ACC'):
+                entry[mode] = Cycles(2)
+            else:
+                raise ValueError(f"No cycle count for {mnemonic} {mode}")
+        table[mnemonic] = FrozenTable(entry)
+    return FrozenTable(table)
+
+# CPU name -> cycle table builder, built on first use like the opcode tables
+_CYCLE_BUILDERS = {
+    '6502': lambda: build_cycles(OPCODES_6502, _FIXED_CYCLES_6502),
+    '65c02': lambda: build_cycles(opcode_table('65c02'), {**_FIXED_CYCLES_6502, **_FIXED_CYCLES_65C02}),
+    '6502x': lambda: build_cycles(opcode_table('6502x'), _FIXED_CYCLES_6502),
+    'r65c02': lambda: build_cycles(opcode_table('r65c02'),
+                                   {**_FIXED_CYCLES_6502, **_FIXED_CYCLES_65C02, **_FIXED_CYCLES_R65C02}),
+    'w65c02': lambda: build_cycles(opcode_table('w65c02'), {**_FIXED_CYCLES_6502, **_FIXED_CYCLES_65C02,
+                                                            **_FIXED_CYCLES_R65C02, **_FIXED_CYCLES_WDC}),
+    '65816': lambda: build_cycles(opcode_table('65816'), {**_FIXED_CYCLES_6502, **_FIXED_CYCLES_65816}),
+}
+_CYCLE_TABLES = {}
+
+def cycle_table(cpu: str) -> FrozenTable:
+    """Returns the cycle table for a CPU name, building it on first use."""
+    table = _CYCLE_TABLES.get(cpu)
+    if table is None:
+        table = _CYCLE_TABLES[cpu] = _CYCLE_BUILDERS[cpu]()
+    return table
+
+def __getattr__(name):
+    # OPCODES_65C02 is built lazily so 6502-only builds never pay for it
+    if name == 'OPCODES_65C02':
+        return opcode_table('65c02')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,70 @@
+# Output writers shared by the command line, batch builds and the linker
+
+import os
+
+def write_binary(asm, output_file):
+    write_binary_image(asm.compiler.bytes, asm.origin, output_file)
+
+def write_hex_output(asm, output_file):
+    write_hex_image(asm.compiler.bytes, asm.origin, output_file)
+
+def write_object(asm, output_file):
+    asm.compiler.object_file().save(output_file)
+
+def write_binary_image(data, start_addr, output_file):
+    # A raw image carries no address; the loader supplies it
+    with open(output_file, "wb") as f:
+        f.write(bytes(data))
+
+def _hex_lines(data, start_addr):
+    # Format: 'ADDRESS: B1 B2 ...', 16 bytes per line from start_addr
+    for i in range(0, len(data), 16):
+        chunk = data[i:i+16]
+        addr = start_addr + i
+        hex_bytes = " ".join(f"{b:02X}" for b in chunk)
+        yield f"{addr:04X}: {hex_bytes}\n"
+
+def write_hex_image(data, start_addr, output_file):
+    with open(output_file, "w") as f:
+        f.writelines(_hex_lines(data, start_addr))
+
+WRITERS = {
+    "bin": write_binary,
+    "hex": write_hex_output,
+    "o65": write_object,
+}
+
+IMAGE_WRITERS = {
+    "bin": write_binary_image,
+    "hex": write_hex_image,
+}
+
+def write_output(asm, output_file, format: str = "bin"):
+    if format not in WRITERS:
+        raise ValueError(f"Unknown output format: {format}")
+    WRITERS[format](asm, output_file)
+
+def write_image(data, origin: int, output_file, format: str = "bin"):
+    # A linked program, which has no Assembler behind it
+    if format not in IMAGE_WRITERS:
+        raise ValueError(f"Unknown output format: {format}")
+    IMAGE_WRITERS[format](data, origin, output_file)
+
+def write_chunks(chunks, output_file, format: str = "bin"):
+    """
+    Writes a linked program made of (address, data) chunks and returns the
+    (path, address, size) of each. A hex dump holds them all; a binary
+    file is written per chunk after the first, as out-6000.bin.
+    """
+    if format == "hex" and len(chunks) > 1:
+        with open(output_file, "w") as f:
+            for start, data in chunks:
+                f.writelines(_hex_lines(data, start))
+        return [(output_file, start, len(data)) for start, data in chunks]
+    written = []
+    root, ext = os.path.splitext(output_file)
+    for i, (start, data) in enumerate(chunks or [(0, bytearray())]):
+        path = output_file if i == 0 else f"{root}-{start:04x}{ext}"
+        write_image(data, start, path, format)
+        written.append((path, start, len(data)))
+    return written
@@ -1,8 +1,12 @@
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 import os
-from .tokenizer import Tokenizer, Token, TokenType
-from .ast import Program, Statement, Instruction, Directive, Label, Assignment, Unresolved, BinaryExpr, IfDef, EnumDef
-from .string import str_compare
+import time
+from .tokenizer import Tokenizer, Token, TokenType, CONDITIONAL_OPENERS
+from .ast import Program, Statement, Instruction, Directive, Label, Assignment, Unresolved, BinaryExpr, IfDef, If, EnumDef, StringPool, PageBlock, Table, StructDef, StructInstance, Dispatch, Repeat, MacroCall
+from .string import str_compare, encode_latin1, encode_text, build_pool, STRING_DIRECTIVES
+from .macros import MacroDef, MacroError, TokenStream, argument_key, split_arguments, substitute
+from .unroll import UNROLL_DIRECTIVES
+from .tables import BUILTINS, TABLE_KINDS, TableError, TableExpression, generate, table_labels
 
 class ParserError(Exception):
     def __init__(self, msg: str, token: Token):
@@ -15,14 +19,67 @@ class ParserError(Exception):
             return f"{self.msg}"
         return f"{self.token.line}: {self.msg} ({self.token.lexeme})"
 
+def fold_data(name: str, args: List) -> Tuple[List, int]:
+    """
+    Merges runs of constant .byte/.word entries (numbers, and strings for
+    .byte) into ready bytes objects, leaving symbolic entries in place.
+    Returns the new argument list and the number of bytes it emits.
+    """
+    word = name == '.word'
+    folded = []
+    run = bytearray()
+    size = 0
+    for arg in args:
+        if isinstance(arg, int):
+            run.append(arg & 0xFF)
+            if word:
+                run.append((arg >> 8) & 0xFF)
+        elif isinstance(arg, str) and not word:
+            run += encode_latin1(arg)
+        else:
+            if run:
+                folded.append(bytes(run))
+                size += len(run)
+                run = bytearray()
+            folded.append(arg)
+            size += 2 if word else 1
+    if run:
+        folded.append(bytes(run))
+        size += len(run)
+    return folded, size
+
+# Blocks kept within one page: opening directive -> (kind, closing directive)
+PAGE_BLOCKS = {'.hot': ('hot', '.endhot'), '.table_aligned': ('table', '.endtable')}
+
 class Parser:
-    def __init__(self, tokenizer: Tokenizer, include_paths=None):
+    def __init__(self, tokenizer: Tokenizer, include_paths=None, stats=None, defines=None):
         self.lex = tokenizer
         self.include_paths = include_paths or []
         self.tokenizers: List[Tokenizer] = []
         self.peeked: List[Token] = []
+        self.stats = stats
+        # Preprocessor mode: with fixed defines, conditionals are decided while
+        # parsing and dead blocks are skipped without being tokenized.
+        # Maps each symbol seen so far to its value (None for labels).
+        self.defines: Optional[Dict[str, Optional[int]]] = None
+        if defines is not None:
+            self.defines = dict(defines)
+        self.macros: Dict[str, MacroDef] = {}
+        # .local names of the .macro or .rept body being parsed (None outside one)
+        self.local_names: Optional[List[str]] = None
+        self.expanding: List[str] = [] # Macros being expanded, to catch recursion
 
     def _read_next_token(self) -> Token:
+        if self.stats is not None:
+            # Tokenizing is interleaved with parsing, so time it per token
+            start = time.perf_counter()
+            tok = self._read_raw_token()
+            self.stats.add_time('tokenize', time.perf_counter() - start)
+            self.stats.count('tokens')
+            return tok
+        return self._read_raw_token()
+
+    def _read_raw_token(self) -> Token:
         tok = self.lex.next_token()
         while tok.type == TokenType.EOF and self.tokenizers:
              # Close current stream?
@@ -72,11 +129,16 @@ class Parser:
             if tok is None or tok.type == TokenType.EOF:
                 break
             
-            stmt = self.parse_statement()
-            if stmt:
-                statements.append(stmt)
+            self._append(statements, self.parse_statement())
         return Program(statements)
 
+    def _append(self, block: List[Statement], stmt):
+        # Preprocessed conditionals return the statements of their live branch
+        if isinstance(stmt, list):
+            block.extend(stmt)
+        elif stmt:
+            block.append(stmt)
+
     def parse_statement(self) -> Optional[Statement]:
         # end of line
         if self.expect(TokenType.EOL):
@@ -92,13 +154,19 @@ class Parser:
             if self.expect(TokenType.OP, ':'):
                 stmt = Label(tok.lexeme, line=tok.line)
                 stmt.filename = tok.filename
+                if self.defines is not None:
+                    self.defines.setdefault(tok.lexeme, None)
                 return stmt
             elif self.expect(TokenType.OP, '='):
                 value = self.parse_expr(required_type=int)
                 self.require(TokenType.EOL)
+                if self.defines is not None:
+                    self.defines[tok.lexeme] = self._constant_value(value)
                 stmt = Assignment(tok.lexeme, value, line=tok.line)
                 stmt.filename = tok.filename
                 return stmt
+            elif tok.lexeme in self.macros:
+                return self.parse_macro_call(tok)
             else:
                 return self.parse_instruction(tok)
         # Local numeric label
@@ -124,21 +192,7 @@ class Parser:
              filename = arg.value
              self.require(TokenType.EOL)
              
-             base_dir = os.getcwd()
-             if self.lex.filename:
-                 base_dir = os.path.dirname(os.path.abspath(self.lex.filename))
-             path = os.path.join(base_dir, filename)
-             
-             # Search in include paths if not found
-             if not os.path.exists(path):
-                 for inc_path in self.include_paths:
-                     test_path = os.path.join(inc_path, filename)
-                     if os.path.exists(test_path):
-                         path = test_path
-                         break
-
-             if not os.path.exists(path):
-                 raise ParserError(f"Include file not found: {filename} (searched in {base_dir} and {self.include_paths})", tok)
+             path = self._find_file(filename, tok, "Include")
 
              abs_path = os.path.abspath(path)
              for t in self.tokenizers:
@@ -158,42 +212,96 @@ class Parser:
              
              return None
 
-        if name == '.ifdef':
-             cond_sym = self.require(TokenType.ID).lexeme
+        if name == '.incbin':
+             # .incbin "file"[, offset[, length]]; the path is resolved like .include
+             arg = self.require(TokenType.STR)
+             args = [os.path.abspath(self._find_file(arg.value, tok, "Binary include"))]
+             while self.expect(TokenType.OP, ','):
+                 args.append(self.parse_expr())
+             if len(args) > 3:
+                 raise ParserError(".incbin takes a file, an offset and a length", tok)
              self.require(TokenType.EOL)
-             
-             then_block = []
-             else_block = []
-             current_block = then_block
-             
-             while True:
-                 # Check for end of block or else
-                 tok_peek = self.peektok()
-                 if tok_peek and tok_peek.type == TokenType.DIR:
-                      if tok_peek.lexeme == '.else':
-                           self.nexttok() # consume .else
-                           self.require(TokenType.EOL)
-                           current_block = else_block
-                           continue
-                      elif tok_peek.lexeme == '.endif':
-                           self.nexttok() # consume .endif
-                           self.require(TokenType.EOL)
-                           break
-                 
-                 # Check EOF
-                 if tok_peek is None or tok_peek.type == TokenType.EOF:
-                      raise ParserError("Unexpected EOF in .ifdef block", tok)
-                 
-                 stmt = self.parse_statement()
-                 if stmt:
-                     current_block.append(stmt)
-                     
-             stmt = IfDef(cond_sym, then_block, else_block, line=tok.line)
+             stmt = Directive(name, args, line=tok.line)
              stmt.filename = tok.filename
              return stmt
 
-        if name in ['.byte', '.word', '.fill']:
+        if name in CONDITIONAL_OPENERS:
+             return self.parse_conditional(tok)
+
+        if name == '.macro':
+             return self.parse_macro(tok)
+        elif name == '.rept':
+             return self.parse_rept(tok)
+        elif name == '.local':
+             if self.local_names is None:
+                 raise ParserError(".local outside a .macro or .rept body", tok)
+             self.local_names.append(self.require(TokenType.ID).lexeme)
+             while self.expect(TokenType.OP, ','):
+                 self.local_names.append(self.require(TokenType.ID).lexeme)
+             self.require(TokenType.EOL)
+             return None
+        elif name in ('.endm', '.endr'):
+             raise ParserError(f"{name} without a matching {'.macro' if name == '.endm' else '.rept'}", tok)
+
+        if name in ['.byte', '.word']:
+             args, size = fold_data(name, self.parse_expr_list())
+             self.require(TokenType.EOL)
+             stmt = Directive(name, args, line=tok.line, size=size)
+             stmt.filename = tok.filename
+             return stmt
+        elif name in STRING_DIRECTIVES:
+             try:
+                 data = encode_text(name, self.parse_expr_list())
+             except ValueError as e:
+                 raise ParserError(str(e), tok)
+             self.require(TokenType.EOL)
+             stmt = Directive(name, [data], line=tok.line, size=len(data))
+             stmt.filename = tok.filename
+             return stmt
+        elif name == '.strpool':
+             return self.parse_strpool(tok)
+        elif name == '.dispatch':
+             return self.parse_dispatch(tok)
+        elif name == '.struct':
+             return self.parse_struct(tok)
+        elif name in ('.aos', '.soa'):
+             return self.parse_struct_instance(tok)
+        elif name == '.table':
+             return self.parse_table(tok)
+        elif name in PAGE_BLOCKS:
+             return self.parse_page_block(tok)
+        elif name == '.zpvar':
+             # .zpvar name[, size]; the address is picked by the compiler
+             args = [self.require(TokenType.ID).lexeme]
+             if self.expect(TokenType.OP, ','):
+                 args.append(self.parse_expr())
+             if self.defines is not None:
+                 # Defined, though its address is only known after allocation
+                 self.defines.setdefault(args[0], None)
+        elif name in ('.export', '.import'):
+             # .export name[, name...]: roots for --strip-unreferenced, and in an
+             # object build the symbols other modules can use; .import names
+             # the symbols it uses from them
+             args = [self.require(TokenType.ID).lexeme]
+             while self.expect(TokenType.OP, ','):
+                 args.append(self.require(TokenType.ID).lexeme)
+        elif name == '.segment':
+             # .segment "name": where the following code goes in an object build
+             args = [self.require(TokenType.STR).value]
+        elif name in ('.zprange', '.zpoverflow'):
              args = self.parse_expr_list()
+             if len(args) != 2:
+                 raise ParserError(f"{name} takes a start and an end address", tok)
+        elif name == '.fill':
+             args = self.parse_expr_list()
+        elif name in UNROLL_DIRECTIVES:
+             # .unroll_fill dest, count[, stride[, unroll]]
+             # .unroll_copy src, dest, count[, stride[, unroll]]
+             args = self.parse_expr_list()
+             areas = 2 if name == '.unroll_copy' else 1
+             if not areas + 1 <= len(args) <= areas + 3:
+                 raise ParserError(f"{name} takes {'a source, ' if areas == 2 else ''}a destination, a count "
+                                   "and optionally a stride and an unroll factor", tok)
         elif name in ['.org', '.cpu', '.align']:
              args = [self.parse_expr()]
         elif name == '.enum':
@@ -204,6 +312,378 @@ class Parser:
         stmt.filename = tok.filename
         return stmt
 
+    def _find_file(self, filename: str, tok: Token, kind: str) -> str:
+        # Relative to the current source file first, then the include paths
+        base_dir = os.getcwd()
+        if self.lex.filename:
+            base_dir = os.path.dirname(os.path.abspath(self.lex.filename))
+        path = os.path.join(base_dir, filename)
+
+        # Search in include paths if not found
+        if not os.path.exists(path):
+            for inc_path in self.include_paths:
+                test_path = os.path.join(inc_path, filename)
+                if os.path.exists(test_path):
+                    path = test_path
+                    break
+
+        if not os.path.exists(path):
+            raise ParserError(f"{kind} file not found: {filename} (searched in {base_dir} and {self.include_paths})", tok)
+        return path
+
+    def parse_conditional(self, tok: Token) -> Union[IfDef, If, List[Statement]]:
+        name = tok.lexeme
+        if name == '.if':
+            condition = self.parse_expr()
+        else:
+            condition = self.require(TokenType.ID).lexeme
+        self.require(TokenType.EOL)
+
+        taken = None
+        if self.defines is not None:
+            taken = self._evaluate_condition(name, condition)
+
+        if taken is None:
+            then_block, else_block = self._parse_branches(tok)
+            if name == '.if':
+                stmt = If(condition, then_block, else_block, line=tok.line)
+            else:
+                stmt = IfDef(condition, then_block, else_block, line=tok.line, negate=(name == '.ifndef'))
+            stmt.filename = tok.filename
+            return stmt
+
+        # Decided at parse time: keep only the live branch
+        if taken:
+            block, closer = self._parse_block(tok)
+            if closer == '.else':
+                self._skip_block(tok, '.endif')
+            return block
+        if self._skip_block(tok) == '.endif':
+            return []
+        block, closer = self._parse_block(tok)
+        if closer == '.else':
+            raise ParserError(f"Duplicate .else in {name} block", tok)
+        return block
+
+    def _parse_branches(self, tok: Token) -> Tuple[List[Statement], List[Statement]]:
+        then_block, closer = self._parse_block(tok)
+        else_block = []
+        if closer == '.else':
+            else_block, closer = self._parse_block(tok)
+            if closer == '.else':
+                raise ParserError(f"Duplicate .else in {tok.lexeme} block", tok)
+        return then_block, else_block
+
+    def _parse_block(self, tok: Token) -> Tuple[List[Statement], str]:
+        # Parses statements up to .else or .endif; returns them and the closer
+        block = []
+        while True:
+            tok_peek = self.peektok()
+            if tok_peek and tok_peek.type == TokenType.DIR and tok_peek.lexeme in ('.else', '.endif'):
+                self.nexttok()
+                self.require(TokenType.EOL)
+                return block, tok_peek.lexeme
+
+            if tok_peek is None or tok_peek.type == TokenType.EOF:
+                raise ParserError(f"Unexpected EOF in {tok.lexeme} block", tok)
+
+            self._append(block, self.parse_statement())
+
+    def _skip_block(self, tok: Token, expected: str = None) -> str:
+        # Dead branch: scan lines for the closer without tokenizing them
+        closer, lines = self.lex.skip_conditional()
+        if self.stats is not None:
+            self.stats.count('skipped_lines', lines)
+        if closer is None:
+            raise ParserError(f"Unexpected EOF in {tok.lexeme} block", tok)
+        if expected is not None and closer != expected:
+            raise ParserError(f"Duplicate .else in {tok.lexeme} block", tok)
+        return closer
+
+    def _evaluate_condition(self, name: str, condition) -> Optional[bool]:
+        if name == '.ifdef':
+            return condition in self.defines
+        if name == '.ifndef':
+            return condition not in self.defines
+        value = self._constant_value(condition)
+        if value is None:
+            # Depends on something only the compiler knows; keep it in the AST
+            return None
+        return value != 0
+
+    def _constant_value(self, expr) -> Optional[int]:
+        # Evaluates an expression from the defines and constants seen so far
+        if isinstance(expr, int):
+            return expr
+        if isinstance(expr, BinaryExpr):
+            left = self._constant_value(expr.left)
+            right = self._constant_value(expr.right)
+            if left is None or right is None:
+                return None
+            return left + right if expr.op == '+' else left - right
+        if isinstance(expr, Unresolved) and expr.type in ('ADDRESS', 'LOW', 'HIGH'):
+            value = self.defines.get(expr.name)
+            if value is None:
+                return None
+            if expr.type == 'LOW':
+                return value & 0xFF
+            if expr.type == 'HIGH':
+                return (value >> 8) & 0xFF
+            return value
+        return None
+
+    def parse_strpool(self, tok: Token) -> StringPool:
+        # Labels and string directives up to .endpool, laid out as one pool
+        self.require(TokenType.EOL)
+        strings = []
+        names = []
+        pending = []
+        while True:
+            peek = self.peektok()
+            if peek.type == TokenType.EOF:
+                raise ParserError("Unexpected EOF in .strpool block", tok)
+            if self.expect(TokenType.EOL):
+                continue
+            if peek.type == TokenType.DIR and peek.lexeme == '.endpool':
+                self.nexttok()
+                self.require(TokenType.EOL)
+                break
+            if peek.type == TokenType.ID:
+                self.nexttok()
+                self.require(TokenType.OP, ':')
+                pending.append(peek.lexeme)
+                if self.defines is not None:
+                    self.defines.setdefault(peek.lexeme, None)
+                continue
+            if peek.type == TokenType.DIR and peek.lexeme in STRING_DIRECTIVES:
+                stmt = self.parse_directive(self.nexttok())
+                strings.append((stmt.args[0], stmt.name.startswith('.asciiz')))
+                names.append(pending)
+                pending = []
+                continue
+            raise ParserError("Only labels and string directives are allowed in .strpool", peek)
+        if pending:
+            raise ParserError(f"Label '{pending[0]}' in .strpool has no string", tok)
+
+        data, offsets = build_pool(strings)
+        labels = [(name, offset) for group, offset in zip(names, offsets) for name in group]
+        saved = sum(len(s) for s, _ in strings) - len(data)
+        stmt = StringPool(data, labels, saved, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_table(self, tok: Token) -> Table:
+        # .table name, builtin[, kind] or .table name, count, "expr"[, kind]
+        name = self.require(TokenType.ID).lexeme
+        self.require(TokenType.OP, ',')
+        peek = self.peektok()
+        if peek.type == TokenType.ID and peek.lexeme in BUILTINS:
+            self.nexttok()
+            count, kind, text = BUILTINS[peek.lexeme]
+        else:
+            count = self.parse_expr()
+            self.require(TokenType.OP, ',')
+            text = self.require(TokenType.STR).value
+            kind = 'byte'
+        if self.expect(TokenType.OP, ','):
+            kind = self.require(TokenType.ID).lexeme.lower()
+            if kind not in TABLE_KINDS:
+                raise ParserError(f"Unknown table kind '{kind}' (expected {', '.join(TABLE_KINDS)})", tok)
+        self.require(TokenType.EOL)
+        if isinstance(count, int) and count < 0:
+            raise ParserError(f"Table '{name}' has a negative count", tok)
+
+        try:
+            expression = TableExpression(text)
+            data = None
+            # Without symbols the table can be generated right away
+            if isinstance(count, int) and not expression.symbols:
+                data = generate(expression, count, kind)
+        except TableError as e:
+            raise ParserError(str(e), tok)
+        if self.defines is not None:
+            for label, _ in table_labels(name, 0, kind):
+                self.defines.setdefault(label, None)
+        stmt = Table(name, count, kind, expression, data, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_struct(self, tok: Token) -> StructDef:
+        # .struct Name / field[, size] ... / .end
+        name = self.require(TokenType.ID).lexeme
+        self.require(TokenType.EOL)
+        fields = []
+        while True:
+            peek = self.peektok()
+            if peek.type == TokenType.DIR and str_compare(peek.lexeme, ".end", True):
+                self.nexttok()
+                self.require(TokenType.EOL)
+                break
+            if peek.type == TokenType.EOF:
+                raise ParserError("Unexpected EOF in struct block", peek)
+            if self.expect(TokenType.EOL):
+                continue
+            field_name = self.require(TokenType.ID).lexeme
+            size = 1
+            if self.expect(TokenType.OP, ','):
+                size = self.parse_expr()
+            fields.append((field_name, size))
+            self.require(TokenType.EOL)
+        if not fields:
+            raise ParserError(f"Struct '{name}' has no fields", tok)
+        if self.defines is not None:
+            for label in [f"{name}.{f}" for f, _ in fields] + [f"{name}.size"]:
+                self.defines.setdefault(label, None)
+        stmt = StructDef(name, fields, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_macro(self, tok: Token) -> None:
+        # .macro name [param, ...] / body / .endm; the body is kept as tokens
+        # and only parsed when the macro is called
+        name = self.require(TokenType.ID).lexeme
+        params = []
+        if self.peektok().type != TokenType.EOL:
+            params.append(self.require(TokenType.ID).lexeme)
+            while self.expect(TokenType.OP, ','):
+                params.append(self.require(TokenType.ID).lexeme)
+        self.require(TokenType.EOL)
+        body = []
+        while True:
+            body_tok = self.nexttok()
+            if body_tok.type == TokenType.EOF:
+                raise ParserError(f"Unexpected EOF in macro '{name}'", tok)
+            if body_tok.type == TokenType.DIR and body_tok.lexeme == '.endm':
+                self.require(TokenType.EOL)
+                break
+            if body_tok.type == TokenType.DIR and body_tok.lexeme == '.macro':
+                raise ParserError("Macros cannot be defined inside a macro", body_tok)
+            body.append(body_tok)
+        self.macros[name] = MacroDef(name, params, body, tok.filename, tok.line)
+        return None
+
+    def parse_macro_call(self, tok: Token) -> MacroCall:
+        macro = self.macros[tok.lexeme]
+        tokens = []
+        while self.peektok().type not in (TokenType.EOL, TokenType.EOF):
+            tokens.append(self.nexttok())
+        self.expect(TokenType.EOL)
+        args = split_arguments(tokens)
+        if self.stats is not None:
+            self.stats.count('macro_calls')
+
+        key = argument_key(args)
+        expansion = macro.expansions.get(key)
+        if expansion is None:
+            if macro.name in self.expanding:
+                raise ParserError(f"Macro '{macro.name}' calls itself", tok)
+            try:
+                tokens = substitute(macro, args)
+            except MacroError as e:
+                raise ParserError(str(e), tok)
+            sub = Parser(TokenStream(tokens, macro.filename, macro.line), self.include_paths, self.stats)
+            sub.defines = self.defines
+            sub.macros = self.macros
+            sub.local_names = []
+            sub.expanding = self.expanding + [macro.name]
+            expansion = macro.expansions[key] = (sub.parse_program().statements, sub.local_names)
+            if self.stats is not None:
+                self.stats.count('macro_expansions')
+        statements, local_names = expansion
+        stmt = MacroCall(macro.name, statements, local_names, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_rept(self, tok: Token) -> Repeat:
+        # .rept count[, var] / body / .endr; the body is parsed once
+        count = self.parse_expr()
+        var = None
+        if self.expect(TokenType.OP, ','):
+            var = self.require(TokenType.ID).lexeme
+        self.require(TokenType.EOL)
+        outer, self.local_names = self.local_names, []
+        statements = []
+        while True:
+            peek = self.peektok()
+            if peek.type == TokenType.DIR and peek.lexeme == '.endr':
+                self.nexttok()
+                self.require(TokenType.EOL)
+                break
+            if peek.type == TokenType.EOF:
+                raise ParserError("Unexpected EOF in .rept block", tok)
+            self._append(statements, self.parse_statement())
+        local_names, self.local_names = self.local_names, outer
+        if self.stats is not None:
+            self.stats.count('rept_blocks')
+        stmt = Repeat(count, statements, local_names, var, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_dispatch(self, tok: Token) -> Dispatch:
+        # .dispatch name[, default] / key, handler ... / .end
+        name = self.require(TokenType.ID).lexeme
+        default = None
+        if self.expect(TokenType.OP, ','):
+            default = self.parse_expr()
+        self.require(TokenType.EOL)
+        entries = []
+        while True:
+            peek = self.peektok()
+            if peek.type == TokenType.DIR and str_compare(peek.lexeme, ".end", True):
+                self.nexttok()
+                self.require(TokenType.EOL)
+                break
+            if peek.type == TokenType.EOF:
+                raise ParserError("Unexpected EOF in dispatch block", peek)
+            if self.expect(TokenType.EOL):
+                continue
+            key = self.parse_expr()
+            self.require(TokenType.OP, ',')
+            entries.append((key, self.parse_expr()))
+            self.require(TokenType.EOL)
+        if not entries:
+            raise ParserError(f"Dispatch '{name}' has no entries", tok)
+        if self.defines is not None:
+            self.defines.setdefault(name, None)
+        stmt = Dispatch(name, entries, default, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_struct_instance(self, tok: Token) -> StructInstance:
+        # .aos name, Struct, count or .soa name, Struct, count[, page]
+        name = self.require(TokenType.ID).lexeme
+        self.require(TokenType.OP, ',')
+        struct = self.require(TokenType.ID).lexeme
+        self.require(TokenType.OP, ',')
+        count = self.parse_expr()
+        page = False
+        if tok.lexeme == '.soa' and self.expect(TokenType.OP, ','):
+            self.require(TokenType.ID, 'page', casei=True)
+            page = True
+        self.require(TokenType.EOL)
+        if self.defines is not None:
+            self.defines.setdefault(name, None)
+        stmt = StructInstance(name, struct, count, tok.lexeme[1:], page, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
+    def parse_page_block(self, tok: Token) -> PageBlock:
+        kind, closer = PAGE_BLOCKS[tok.lexeme]
+        self.require(TokenType.EOL)
+        statements = []
+        while True:
+            peek = self.peektok()
+            if peek.type == TokenType.DIR and peek.lexeme == closer:
+                self.nexttok()
+                self.require(TokenType.EOL)
+                break
+            if peek.type == TokenType.EOF:
+                raise ParserError(f"Unexpected EOF in {tok.lexeme} block", tok)
+            self._append(statements, self.parse_statement())
+        stmt = PageBlock(kind, statements, line=tok.line)
+        stmt.filename = tok.filename
+        return stmt
+
     def parse_enum(self, tok: Token) -> EnumDef:
         # Optional name
         name = None
@@ -250,18 +730,43 @@ class Parser:
             members.append((member_name, member_val))
             self.require(TokenType.EOL)
             
+        if self.defines is not None:
+            # Same numbering as Compiler.visit_enum_def; after a member that is
+            # not a constant yet, the values are left to the compiler
+            value = 0
+            for member_name, member_val in members:
+                if member_val is not None:
+                    value = self._constant_value(member_val)
+                full_name = f"{name}.{member_name}" if name else member_name
+                self.defines[full_name] = value
+                if value is not None:
+                    value += 1
+
         stmt = EnumDef(name, size, members, line=tok.line)
         stmt.filename = tok.filename
         return stmt
 
     def parse_instruction(self, tok: Token) -> Instruction:
         mnemonic = tok.lexeme.upper()
+        # 'lda src: $FFFF,x' names the operand field
+        label = None
+        if name := self.expect(TokenType.ID):
+            if self.expect(TokenType.OP, ':'):
+                label = name
+            else:
+                self.peeked.insert(0, name)
         mode, operands = self.parse_operands(mnemonic)
         self.require(TokenType.EOL)
+        if label is not None:
+            if mode in ('IMP', 'ACC'):
+                raise ParserError(f"{mnemonic} has no operand to label", label)
+            if self.defines is not None:
+                self.defines.setdefault(label.lexeme, None)
         
         operand = operands[0] if operands else None
         inst = Instruction(mnemonic, mode, operand, line=tok.line)
         inst.filename = tok.filename
+        inst.operand_label = label.lexeme if label else None
         return inst
 
     def parse_operands(self, instruction: str) -> Tuple[str, List]:
@@ -322,12 +827,26 @@ class Parser:
         if self.expect(TokenType.OP, '#'):
             val = self.parse_expr()
             return ('#', [val])
+
+        # Indirect long (65816): [expr] or [expr], Y
+        if self.expect(TokenType.OP, '['):
+            expr = self.parse_expr()
+            self.require(TokenType.OP, ']')
+            if self.expect(TokenType.OP, ','):
+                self.require(TokenType.ID, 'Y', casei=True)
+                return ('INDLY', [expr])
+            return ('INDL', [expr])
             
         # Indirect: (expr)...
         if self.expect(TokenType.OP, '('):
             expr = self.parse_expr()
-            # Case 1: (expr, X) -> INDX
+            # Case 1: (expr, X) -> INDX, or (expr, S), Y -> SRIY (65816)
             if self.expect(TokenType.OP, ','):
+                if self.expect(TokenType.ID, 'S', casei=True):
+                    self.require(TokenType.OP, ')')
+                    self.require(TokenType.OP, ',')
+                    self.require(TokenType.ID, 'Y', casei=True)
+                    return ('SRIY', [expr])
                 self.require(TokenType.ID, 'X', casei=True)
                 self.require(TokenType.OP, ')')
                 return ('INDX', [expr])
@@ -350,6 +869,14 @@ class Parser:
                  return ('ABSX', [expr]) 
             elif self.expect(TokenType.ID, 'Y', casei=True):
                  return ('ABSY', [expr])
+            elif self.expect(TokenType.ID, 'S', casei=True):
+                 return ('SR', [expr])
+            elif instruction in ('MVN', 'MVP'):
+                 # Source and destination banks
+                 return ('BLK', [(expr, self.parse_expr())])
+            elif instruction[:3] in ('BBR', 'BBS'):
+                 # Zero-page byte and branch target
+                 return ('ZPREL', [(expr, self.parse_expr())])
             else:
                 raise ParserError("Expected index register X or Y", self.peektok())
         
@@ -399,10 +926,9 @@ class Parser:
         if tok := self.expect(TokenType.ID):
             # Check for dot access (Enum.Member) which comes as ID + DIR (.Member) by tokenizer behavior
             name = tok.lexeme
-            peek = self.peektok()
-            if peek.type == TokenType.DIR:
+            while self.peektok().type == TokenType.DIR:
                  # The tokenizer treats .Member as a directive token, but here we want to treat it as .Member property access
-                 # So "Enum.Member" becomes ID("Enum") followed by DIR(".Member")
+                 # So "Enum.Member" becomes ID("Enum") followed by DIR(".Member"), and "lines.ptr.hi" takes two
                  part = self.nexttok()
                  # part.lexeme includes the dot, e.g. ".Member"
                  name += part.lexeme
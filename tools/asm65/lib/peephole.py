@@ -0,0 +1,530 @@
+import copy
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ast import Program, Statement, Instruction, Label, Unresolved, BinaryExpr, IfDef, If, PageBlock
+from .compiler import Compiler, ListingEntry
+from .opcodes import cycle_table, opcode_table
+
+# Registers and flags an instruction reads and writes ('M' is its memory operand)
+_NZ = {'N', 'Z'}
+_EFFECTS = {
+    'LDA': (set(), {'A'} | _NZ), 'LDX': (set(), {'X'} | _NZ), 'LDY': (set(), {'Y'} | _NZ),
+    'STA': ({'A'}, set()), 'STX': ({'X'}, set()), 'STY': ({'Y'}, set()), 'STZ': (set(), set()),
+    'ADC': ({'A', 'C'}, {'A', 'C', 'V'} | _NZ), 'SBC': ({'A', 'C'}, {'A', 'C', 'V'} | _NZ),
+    'AND': ({'A'}, {'A'} | _NZ), 'ORA': ({'A'}, {'A'} | _NZ), 'EOR': ({'A'}, {'A'} | _NZ),
+    'CMP': ({'A'}, {'C'} | _NZ), 'CPX': ({'X'}, {'C'} | _NZ), 'CPY': ({'Y'}, {'C'} | _NZ),
+    'BIT': ({'A'}, {'V'} | _NZ), 'TRB': ({'A'}, {'Z'}), 'TSB': ({'A'}, {'Z'}),
+    'INC': (set(), _NZ), 'DEC': (set(), _NZ),
+    'INX': ({'X'}, {'X'} | _NZ), 'DEX': ({'X'}, {'X'} | _NZ), 'INY': ({'Y'}, {'Y'} | _NZ), 'DEY': ({'Y'}, {'Y'} | _NZ),
+    'ASL': (set(), {'C'} | _NZ), 'LSR': (set(), {'C'} | _NZ), 'ROL': ({'C'}, {'C'} | _NZ), 'ROR': ({'C'}, {'C'} | _NZ),
+    'TAX': ({'A'}, {'X'} | _NZ), 'TXA': ({'X'}, {'A'} | _NZ), 'TAY': ({'A'}, {'Y'} | _NZ), 'TYA': ({'Y'}, {'A'} | _NZ),
+    'TSX': (set(), {'X'} | _NZ), 'TXS': ({'X'}, set()),
+    'PHA': ({'A'}, set()), 'PHX': ({'X'}, set()), 'PHY': ({'Y'}, set()), 'PHP': ({'C', 'V'} | _NZ, set()),
+    'PLA': (set(), {'A'} | _NZ), 'PLX': (set(), {'X'} | _NZ), 'PLY': (set(), {'Y'} | _NZ),
+    'PLP': (set(), {'C', 'V'} | _NZ),
+    'CLC': (set(), {'C'}), 'SEC': (set(), {'C'}), 'CLV': (set(), {'V'}),
+    'CLI': (set(), set()), 'SEI': (set(), set()), 'CLD': (set(), set()), 'SED': (set(), set()), 'NOP': (set(), set()),
+    'BCC': ({'C'}, set()), 'BCS': ({'C'}, set()), 'BEQ': ({'Z'}, set()), 'BNE': ({'Z'}, set()),
+    'BMI': ({'N'}, set()), 'BPL': ({'N'}, set()), 'BVC': ({'V'}, set()), 'BVS': ({'V'}, set()),
+}
+# Shifts and INC/DEC on the accumulator also read and write A
+_ACC_EFFECTS = {'A'}
+
+# Instructions that leave straight-line code; liveness stops (conservatively) at them
+_CONTROL = ('JMP', 'JSR', 'RTS', 'RTI', 'BRK', 'BRA',
+            'BCC', 'BCS', 'BEQ', 'BNE', 'BMI', 'BPL', 'BVC', 'BVS')
+_STORES = ('STA', 'STX', 'STY', 'STZ')
+_LOADS = {'STA': 'LDA', 'STX': 'LDX', 'STY': 'LDY'}
+
+# Apple II soft switches and slot I/O: reads and writes have side effects
+IO_START, IO_END = 0xC000, 0xCFFF
+
+@dataclass
+class Change:
+    rule: str
+    routine: str
+    filename: Optional[str]
+    line: int
+    description: str
+    bytes: int = 0
+    cycles: int = 0
+
+@dataclass
+class OptimizationReport:
+    changes: List[Change] = field(default_factory=list)
+
+    @property
+    def bytes(self) -> int:
+        return sum(c.bytes for c in self.changes)
+
+    @property
+    def cycles(self) -> int:
+        return sum(c.cycles for c in self.changes)
+
+    def by_routine(self) -> Dict[str, Tuple[int, int, int]]:
+        """routine -> (changes, bytes saved, cycles saved), in source order."""
+        result: Dict[str, Tuple[int, int, int]] = {}
+        for c in self.changes:
+            count, size, cycles = result.get(c.routine, (0, 0, 0))
+            result[c.routine] = (count + 1, size + c.bytes, cycles + c.cycles)
+        return result
+
+    def format(self, details: bool = False) -> str:
+        lines = [f"Optimizer: {len(self.changes)} change(s), {self.bytes} bytes and {self.cycles} cycles saved"]
+        for routine, (count, size, cycles) in self.by_routine().items():
+            lines.append(f"  {routine:<24} {count:>3} change(s) {size:>5} bytes {cycles:>5} cycles")
+        if details:
+            for c in self.changes:
+                loc = f"{c.filename}:" if c.filename else ""
+                lines.append(f"  {loc}{c.line}: [{c.rule}] {c.description} ({c.bytes} bytes, {c.cycles} cycles)")
+        return "\n".join(lines)
+
+class Peephole:
+    """
+    Rewrites Instruction sequences of a parsed program before layout. Each
+    rule looks at one statement list at a time; labels and directives are
+    barriers, so no rewrite ever spans a branch target. Addresses come from
+    trial layouts (Compiler.layout), and rewrites that create branches are
+    undone if the final layout puts them out of range.
+    """
+    MAX_PASSES = 8
+
+    def __init__(self, compiler: Compiler, rules: List[str]):
+        unknown = [name for name in rules if name not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown optimization rule(s): {', '.join(unknown)}")
+        self.compiler = compiler
+        self.rules = [name for name in RULES if name in rules]
+        self.report = OptimizationReport()
+        self.entries: Dict[int, ListingEntry] = {}
+        self.symbols = None
+        self.pcs: Dict[int, Instruction] = {}
+        # Rewrites that turned something into a branch: (change, node, old fields)
+        self.branches: List[Tuple[Change, Instruction, tuple]] = []
+
+    def run(self, program: Program) -> Program:
+        program = copy.deepcopy(program)
+        for _ in range(self.MAX_PASSES):
+            self._layout(program)
+            changed = False
+            for name in self.rules:
+                for block, routine in self._blocks(program.statements, "(top)"):
+                    changed |= RULES[name](self, block, routine)
+                if changed:
+                    # Later rules need addresses that reflect this one
+                    self._layout(program)
+            if not changed:
+                break
+        self._check_branches(program)
+        return program
+
+    # Layout and addresses
+
+    def _layout(self, program: Program):
+        scratch = self.compiler.layout(program)
+        self.entries = {id(e.node): e for e in scratch.listing}
+        self.symbols = scratch.symbols
+        self.pcs = {e.pc: e.node for e in scratch.listing}
+
+    def _check_branches(self, program: Program):
+        # Undo branch rewrites whose target ended up out of range, until stable
+        while self.branches:
+            self._layout(program)
+            bad = []
+            for item in self.branches:
+                entry = self.entries.get(id(item[1]))
+                if entry is not None and not -128 <= entry.operand - (entry.pc + 2) <= 127:
+                    bad.append(item)
+            if not bad:
+                return
+            for change, node, old in bad:
+                node.mnemonic, node.mode, node.operand = old
+                self.report.changes = [c for c in self.report.changes if c is not change]
+            self.branches = [item for item in self.branches if not any(item is b for b in bad)]
+
+    def _blocks(self, statements: List[Statement], routine: str):
+        # Yields each statement list with the routine (last non-local label) it starts in
+        yield statements, routine
+        for stmt in statements:
+            if isinstance(stmt, Label) and not stmt.name.isdigit():
+                routine = stmt.name
+            elif isinstance(stmt, (IfDef, If)):
+                yield from self._blocks(stmt.then_block, routine)
+                yield from self._blocks(stmt.else_block, routine)
+            elif isinstance(stmt, PageBlock):
+                yield from self._blocks(stmt.statements, routine)
+
+    def value(self, expr) -> Optional[int]:
+        if isinstance(expr, int):
+            return expr
+        if isinstance(expr, Unresolved) and expr.type == 'ADDRESS':
+            return self.symbols.get(expr.name)
+        if isinstance(expr, BinaryExpr):
+            left, right = self.value(expr.left), self.value(expr.right)
+            if left is None or right is None:
+                return None
+            return left + right if expr.op == '+' else left - right
+        return None
+
+    def is_io(self, expr, indexed: bool = False) -> bool:
+        # Unknown addresses are treated as I/O; indexed accesses reach 255 bytes on
+        value = self.value(expr)
+        if value is None:
+            return True
+        end = value + 255 if indexed else value
+        return value <= IO_END and end >= IO_START
+
+    def cost(self, inst: Instruction) -> Tuple[int, int]:
+        """(bytes, base cycles) of an instruction as laid out; (0, 0) if it is not."""
+        entry = self.entries.get(id(inst))
+        if entry is None:
+            return 0, 0
+        return entry.size, cycle_table(entry.cpu)[entry.mnemonic][entry.mode].base
+
+    def cpu(self, inst: Instruction) -> Optional[str]:
+        entry = self.entries.get(id(inst))
+        return entry.cpu if entry is not None else None
+
+    def routine_of(self, block: List[Statement], index: int, routine: str) -> str:
+        for stmt in block[:index]:
+            if isinstance(stmt, Label) and not stmt.name.isdigit():
+                routine = stmt.name
+        return routine
+
+    def record(self, rule: str, block: List[Statement], index: int, routine: str, inst: Instruction,
+               description: str, size: int, cycles: int) -> Change:
+        change = Change(rule, self.routine_of(block, index, routine), inst.filename, inst.line,
+                        description, size, cycles)
+        self.report.changes.append(change)
+        return change
+
+    # Liveness
+
+    def dead_after(self, block: List[Statement], index: int, regs: set) -> bool:
+        """True if none of regs is read after block[index] before being overwritten."""
+        regs = set(regs)
+        for stmt in block[index + 1:]:
+            if not isinstance(stmt, Instruction):
+                return False
+            reads, writes = effects(stmt)
+            if regs & reads:
+                return False
+            regs -= writes
+            if not regs:
+                return True
+            if stmt.mnemonic in _CONTROL or stmt.mnemonic not in _EFFECTS:
+                return False
+        return False
+
+def effects(inst: Instruction) -> Tuple[set, set]:
+    reads, writes = _EFFECTS.get(inst.mnemonic, (set(), set()))
+    if inst.mode == 'ACC':
+        reads, writes = reads | _ACC_EFFECTS, writes | _ACC_EFFECTS
+    if inst.mode in ('ABSX', 'ZPX', 'INDX'):
+        reads = reads | {'X'}
+    elif inst.mode in ('ABSY', 'ZPY', 'INDY'):
+        reads = reads | {'Y'}
+    return reads, writes
+
+def _instruction(opt: Peephole, block: List[Statement], index: int, mnemonic=None) -> Optional[Instruction]:
+    # Only instructions in the layout count: the rest sit in conditional
+    # branches that are not assembled. One with a labelled operand is patched
+    # at run time, so it is not the instruction it looks like
+    if index < len(block) and isinstance(block[index], Instruction):
+        inst = block[index]
+        if (id(inst) in opt.entries and inst.operand_label is None
+                and (mnemonic is None or inst.mnemonic == mnemonic)):
+            return inst
+    return None
+
+def _is_name(expr) -> bool:
+    return isinstance(expr, Unresolved) and expr.type == 'ADDRESS'
+
+# Rules: each takes the optimizer, one statement list and its routine name,
+# rewrites the list in place and returns True if it changed anything
+
+def rule_jsr_rts(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # JSR x / RTS -> JMP x (tail call)
+    changed = False
+    i = 0
+    while i < len(block):
+        jsr = _instruction(opt, block, i, 'JSR')
+        rts = _instruction(opt, block, i + 1, 'RTS')
+        if jsr and rts and jsr.mode == 'ABS':
+            size, cycles = opt.cost(jsr)
+            rts_size, rts_cycles = opt.cost(rts)
+            jsr.mnemonic = 'JMP'
+            del block[i + 1]
+            opt.record('jsr-rts', block, i, routine, jsr, "JSR/RTS -> JMP", rts_size, cycles + rts_cycles - 3)
+            changed = True
+        i += 1
+    return changed
+
+def rule_sta_lda(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # STA m / LDA m -> STA m, when the flags the load would set are not used
+    changed = False
+    i = 0
+    while i < len(block):
+        store = _instruction(opt, block, i)
+        load = _instruction(opt, block, i + 1)
+        if (store and load and store.mnemonic in _LOADS and load.mnemonic == _LOADS[store.mnemonic]
+                and load.mode == store.mode and load.operand == store.operand
+                and store.mode in ('ABS', 'ABSX', 'ABSY')
+                and not opt.is_io(store.operand, indexed=store.mode != 'ABS')
+                and opt.dead_after(block, i + 1, _NZ)):
+            size, cycles = opt.cost(load)
+            del block[i + 1]
+            opt.record('sta-lda', block, i, routine, store, f"{load.mnemonic} after {store.mnemonic} removed", size, cycles)
+            changed = True
+        i += 1
+    return changed
+
+def rule_clc_adc0(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # CLC / ADC #0 and SEC / SBC #0 do nothing but set flags
+    changed = False
+    i = 0
+    while i < len(block):
+        first = _instruction(opt, block, i)
+        second = _instruction(opt, block, i + 1)
+        if (first and second and second.mode == '#' and opt.value(second.operand) == 0
+                and (first.mnemonic, second.mnemonic) in (('CLC', 'ADC'), ('SEC', 'SBC'))
+                and opt.dead_after(block, i + 1, {'C', 'V'} | _NZ)):
+            size = sum(opt.cost(inst)[0] for inst in (first, second))
+            cycles = sum(opt.cost(inst)[1] for inst in (first, second))
+            del block[i:i + 2]
+            opt.record('clc-adc0', block, i, routine, first, f"{first.mnemonic}/{second.mnemonic} #0 removed", size, cycles)
+            changed = True
+            continue
+        i += 1
+    return changed
+
+def _jump_target(opt: Peephole, name: str):
+    # The final operand of the chain of JMP abs that label `name` lands on
+    seen = {name}
+    operand = None
+    while True:
+        jmp = opt.pcs.get(opt.symbols.get(name))
+        # A JMP with an operand label is patched at run time, so it has to be taken
+        if (jmp is None or jmp.mnemonic != 'JMP' or jmp.mode != 'ABS'
+                or jmp.operand_label is not None or not _is_name(jmp.operand)):
+            return operand
+        name = jmp.operand.name
+        if name in seen:
+            # A cycle of jumps never gets anywhere; leave it alone
+            return None
+        seen.add(name)
+        operand = jmp.operand
+
+def rule_branch_jmp(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # Branch or JMP to a JMP -> straight to the final target
+    changed = False
+    for i, inst in enumerate(block):
+        if not _instruction(opt, block, i) or not _is_name(inst.operand):
+            continue
+        is_jmp = inst.mnemonic == 'JMP' and inst.mode == 'ABS'
+        is_branch = inst.mode == 'REL' or (inst.mode == 'ABS' and inst.mnemonic in _CONTROL
+                                           and inst.mnemonic not in ('JMP', 'JSR'))
+        if not (is_jmp or is_branch):
+            continue
+        operand = _jump_target(opt, inst.operand.name)
+        if operand is None:
+            continue
+        old = (inst.mnemonic, inst.mode, inst.operand)
+        if is_branch:
+            entry = opt.entries.get(id(inst))
+            target = opt.value(operand)
+            if entry is None or target is None or not -128 <= target - (entry.pc + 2) <= 127:
+                continue
+        inst.operand = copy.deepcopy(operand)
+        change = opt.record('branch-jmp', block, i, routine, inst,
+                            f"{inst.mnemonic} {old[2].name} -> {inst.operand.name}", 0, 3)
+        if is_branch:
+            opt.branches.append((change, inst, old))
+        changed = True
+    return changed
+
+def rule_dead_store(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # A store overwritten by another store to the same address before any read
+    changed = False
+    i = 0
+    while i < len(block):
+        store = _instruction(opt, block, i)
+        if (store and store.mnemonic in _STORES and store.mode == 'ABS'
+                and not opt.is_io(store.operand) and _overwritten(opt, block, i)):
+            size, cycles = opt.cost(store)
+            del block[i]
+            opt.record('dead-store', block, i, routine, store, f"dead {store.mnemonic} removed", size, cycles)
+            changed = True
+            continue
+        i += 1
+    return changed
+
+def _overwritten(opt: Peephole, block: List[Statement], index: int) -> bool:
+    store = block[index]
+    address = opt.value(store.operand)
+    for stmt in block[index + 1:]:
+        if not isinstance(stmt, Instruction) or stmt.mnemonic in _CONTROL:
+            return False
+        if stmt.mode in ('IMP', 'ACC', '#'):
+            continue
+        if stmt.mode != 'ABS':
+            # Indexed and indirect accesses may touch the same address
+            return False
+        value = opt.value(stmt.operand)
+        if value is None:
+            return False
+        if value == address:
+            return stmt.mnemonic in _STORES
+    return False
+
+# 65C02 upgrades: these only touch code assembled under .cpu 65c02
+
+# CPU name -> whether the 65C02 rules apply, worked out on first use
+_HAS_65C02: Dict[str, bool] = {}
+
+def _has_65c02(cpu: Optional[str]) -> bool:
+    # Any CPU whose opcode table holds every 65C02 instruction (r65c02 and
+    # w65c02 add to it). Not the 65816: with 16-bit registers PHX and PLX
+    # no longer move the same bytes as TXA/PHA and PLA/TAX
+    if cpu is None or cpu == '65816':
+        return False
+    if cpu not in _HAS_65C02:
+        table = opcode_table(cpu)
+        _HAS_65C02[cpu] = all(mode in table.get(mnemonic, {})
+                              for mnemonic, modes in opcode_table('65c02').items() for mode in modes)
+    return _HAS_65C02[cpu]
+
+def _all_65c02(opt: Peephole, *insts: Instruction) -> bool:
+    return all(_has_65c02(opt.cpu(inst)) for inst in insts)
+
+def rule_stz(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # LDA #0 / STA m [/ STA n ...] -> STZ m [/ STZ n ...]
+    changed = False
+    i = 0
+    while i < len(block):
+        load = _instruction(opt, block, i, 'LDA')
+        stores = []
+        while load and load.mode == '#' and opt.value(load.operand) == 0:
+            store = _instruction(opt, block, i + 1 + len(stores), 'STA')
+            if not store or store.mode not in ('ABS', 'ABSX'):
+                break
+            stores.append(store)
+        if stores and _all_65c02(opt, load, *stores) and opt.dead_after(block, i + len(stores), {'A'} | _NZ):
+            size, cycles = opt.cost(load)
+            for store in stores:
+                store.mnemonic = 'STZ'
+            del block[i]
+            opt.record('stz', block, i, routine, load, f"LDA #0 / STA -> STZ x{len(stores)}", size, cycles)
+            changed = True
+        i += 1
+    return changed
+
+_PUSHES = {('TXA', 'PHA'): 'PHX', ('TYA', 'PHA'): 'PHY'}
+_PULLS = {('PLA', 'TAX'): 'PLX', ('PLA', 'TAY'): 'PLY'}
+
+def rule_push_pull(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # TXA / PHA -> PHX and PLA / TAX -> PLX (and the Y forms), when A is dead
+    changed = False
+    i = 0
+    while i < len(block):
+        first = _instruction(opt, block, i)
+        second = _instruction(opt, block, i + 1)
+        pair = (first.mnemonic, second.mnemonic) if first and second else None
+        if pair in _PUSHES:
+            replacement, dead = _PUSHES[pair], {'A'} | _NZ
+        elif pair in _PULLS:
+            # PLX sets N and Z from the pulled value, just as TAX did
+            replacement, dead = _PULLS[pair], {'A'}
+        else:
+            i += 1
+            continue
+        if _all_65c02(opt, first, second) and opt.dead_after(block, i + 1, dead):
+            size = sum(opt.cost(inst)[0] for inst in (first, second)) - 1
+            cycles = sum(opt.cost(inst)[1] for inst in (first, second))
+            first.mnemonic = replacement
+            del block[i + 1]
+            cycles -= cycle_table('65c02')[replacement]['IMP'].base
+            opt.record('push-pull', block, i, routine, first, f"{pair[0]}/{pair[1]} -> {replacement}", size, cycles)
+            changed = True
+        i += 1
+    return changed
+
+def rule_jmp_bra(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # JMP to a target in branch range on the same page -> BRA (one byte shorter)
+    changed = False
+    for i in range(len(block)):
+        jmp = _instruction(opt, block, i, 'JMP')
+        if not jmp or jmp.mode != 'ABS' or not _all_65c02(opt, jmp):
+            continue
+        entry = opt.entries[id(jmp)]
+        target = entry.operand
+        if not -128 <= target - (entry.pc + 2) <= 127 or (entry.pc + 2) >> 8 != target >> 8:
+            continue
+        old = (jmp.mnemonic, jmp.mode, jmp.operand)
+        jmp.mnemonic = 'BRA'
+        change = opt.record('jmp-bra', block, i, routine, jmp, "JMP -> BRA", 1, 0)
+        opt.branches.append((change, jmp, old))
+        changed = True
+    return changed
+
+# Instructions with a 65C02 (zp) form
+_ZP_INDIRECT = ('ADC', 'AND', 'CMP', 'EOR', 'LDA', 'ORA', 'SBC', 'STA')
+
+def rule_indy_zero(opt: Peephole, block: List[Statement], routine: str) -> bool:
+    # LDY #0 ... OP (zp),Y -> OP (zp), dropping the LDY if Y is then unused
+    changed = False
+    i = 0
+    while i < len(block):
+        ldy = _instruction(opt, block, i, 'LDY')
+        if not ldy or ldy.mode != '#' or opt.value(ldy.operand) != 0 or not _all_65c02(opt, ldy):
+            i += 1
+            continue
+        # Uses while Y still holds 0, up to the end of the straight-line code
+        uses = []
+        for j in range(i + 1, len(block)):
+            inst = _instruction(opt, block, j)
+            if not inst:
+                break
+            if inst.mode == 'INDY' and inst.mnemonic in _ZP_INDIRECT and _all_65c02(opt, inst):
+                uses.append(inst)
+            if 'Y' in effects(inst)[1] or inst.mnemonic in _CONTROL:
+                break
+        for inst in uses:
+            inst.mode = 'IND'
+        removable = bool(uses) and opt.dead_after(block, i, {'Y'} | _NZ)
+        for inst in uses:
+            # Unless the LDY goes away only stores gain anything
+            if not removable and inst.mnemonic != 'STA':
+                inst.mode = 'INDY'
+                continue
+            old_cycles = opt.cost(inst)[1]
+            new_cycles = cycle_table('65c02')[inst.mnemonic]['IND'].base
+            opt.record('indy-zero', block, i, routine, inst, f"{inst.mnemonic} (zp),Y -> (zp)", 0, old_cycles - new_cycles)
+            changed = True
+        if removable:
+            size, cycles = opt.cost(ldy)
+            del block[i]
+            opt.record('indy-zero', block, i, routine, ldy, "LDY #0 removed", size, cycles)
+            continue
+        i += 1
+    return changed
+
+# Rule name -> function, in the order they run
+RULES: Dict[str, Callable] = {
+    'jsr-rts': rule_jsr_rts,
+    'sta-lda': rule_sta_lda,
+    'clc-adc0': rule_clc_adc0,
+    'branch-jmp': rule_branch_jmp,
+    'dead-store': rule_dead_store,
+    'stz': rule_stz,
+    'push-pull': rule_push_pull,
+    'indy-zero': rule_indy_zero,
+    'jmp-bra': rule_jmp_bra,
+}
+
+def optimize(program: Program, compiler: Compiler, rules: List[str] = None) -> Tuple[Program, OptimizationReport]:
+    """Returns an optimized copy of program and the report of what changed."""
+    peephole = Peephole(compiler, list(RULES) if rules is None else rules)
+    program = peephole.run(program)
+    return program, peephole.report
@@ -0,0 +1,227 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .ast import (Program, Statement, Instruction, Directive, Label, Assignment, IfDef, If,
+                  EnumDef, StringPool, PageBlock, Table, StructInstance, Dispatch, Repeat, MacroCall)
+from .compiler import Compiler
+from .string import STRING_DIRECTIVES
+from .tables import table_labels
+from .unroll import UNROLL_DIRECTIVES
+from .zpalloc import operand_names
+
+# Instructions after which execution does not fall into the next routine
+_NO_FALL_THROUGH = ('JMP', 'RTS', 'RTI', 'BRA', 'BRL', 'JML', 'RTL')
+
+# Statements holding a nested list of statements that are assembled in place
+_BLOCKS = (PageBlock, Repeat, MacroCall)
+
+# Statements that define symbols or layout rather than a routine's bytes;
+# they survive when the routine around them is dropped
+_KEEP_DIRECTIVES = ('.org', '.cpu', '.export', '.import', '.segment', '.zpvar', '.zprange', '.zpoverflow')
+
+@dataclass
+class Routine:
+    name: str # '' for the statements before the first label
+    statements: List[Tuple[int, Statement]] = field(default_factory=list) # (index in program, statement)
+    defines: Set[str] = field(default_factory=set)
+    references: Set[str] = field(default_factory=set)
+    falls_through: bool = True
+    strippable: bool = True
+    first: Optional[str] = None # Kind of the first and last statements that emit bytes
+    last: Optional[str] = None
+    size: int = 0
+
+    @property
+    def node(self) -> Optional[Statement]:
+        return self.statements[0][1] if self.statements else None
+
+@dataclass
+class StripReport:
+    removed: List[Routine] = field(default_factory=list)
+    kept: int = 0
+
+    @property
+    def bytes(self) -> int:
+        return sum(r.size for r in self.removed)
+
+    def format(self) -> str:
+        lines = [f"Stripped {len(self.removed)} unreferenced routine(s), {self.bytes} bytes reclaimed "
+                 f"({self.kept} routine(s) kept)"]
+        for routine in self.removed:
+            node = routine.node
+            loc = f"{node.filename}:{node.line}" if node is not None and node.filename else f"line {node.line}"
+            lines.append(f"  {routine.name:<24} {routine.size:>5} bytes  {loc}")
+        return "\n".join(lines)
+
+def _expr_names(value) -> Set[str]:
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_expr_names(v) for v in value)) if value else set()
+    return set(operand_names(value))
+
+def _defined_names(stmt: Statement) -> Set[str]:
+    if isinstance(stmt, Label):
+        return {stmt.name}
+    if isinstance(stmt, Instruction) and stmt.operand_label is not None:
+        return {stmt.operand_label}
+    if isinstance(stmt, StringPool):
+        return {name for name, _ in stmt.labels}
+    if isinstance(stmt, Table):
+        return {name for name, _ in table_labels(stmt.name, 0, stmt.kind)}
+    if isinstance(stmt, (StructInstance, Dispatch)):
+        return {stmt.name}
+    if isinstance(stmt, _BLOCKS):
+        return set().union(*(_defined_names(s) for s in stmt.statements)) if stmt.statements else set()
+    return set()
+
+def _referenced_names(stmt: Statement) -> Set[str]:
+    if isinstance(stmt, Instruction):
+        return _expr_names(stmt.operand)
+    if isinstance(stmt, Directive):
+        if stmt.name == '.export':
+            return set()
+        return _expr_names(stmt.args)
+    if isinstance(stmt, Assignment):
+        return _expr_names(stmt.value)
+    if isinstance(stmt, Table):
+        return _expr_names(stmt.count) | set(stmt.expression.symbols)
+    if isinstance(stmt, StructInstance):
+        return _expr_names(stmt.count)
+    if isinstance(stmt, Dispatch):
+        return _expr_names([e for entry in stmt.entries for e in entry]) | _expr_names(stmt.default)
+    if isinstance(stmt, Repeat):
+        names = _expr_names(stmt.count)
+        return names.union(*(_referenced_names(s) for s in stmt.statements))
+    if isinstance(stmt, _BLOCKS):
+        return set().union(*(_referenced_names(s) for s in stmt.statements)) if stmt.statements else set()
+    return set()
+
+def _kind(stmt: Statement) -> str:
+    # 'code', 'text' (a string stands alone) or 'data' (may be part of a larger structure)
+    if isinstance(stmt, (Instruction, Dispatch)) or (isinstance(stmt, Directive) and stmt.name in UNROLL_DIRECTIVES):
+        return 'code'
+    if isinstance(stmt, StringPool) or (isinstance(stmt, Directive) and stmt.name in STRING_DIRECTIVES):
+        return 'text'
+    if isinstance(stmt, _BLOCKS):
+        emitting = [s for s in stmt.statements if _emits(s)]
+        return _kind(emitting[-1]) if emitting else 'data'
+    return 'data'
+
+def _emits(stmt: Statement) -> bool:
+    if isinstance(stmt, (Instruction, StringPool, PageBlock, Table, StructInstance, Dispatch)):
+        return True
+    if isinstance(stmt, (Repeat, MacroCall)):
+        # A macro may only define symbols; those have to stay
+        return any(_emits(s) for s in stmt.statements)
+    return isinstance(stmt, Directive) and stmt.name not in _KEEP_DIRECTIVES
+
+def split_routines(program: Program) -> List[Routine]:
+    """
+    Splits the top-level statements at every non-local label. Statements
+    before the first label form a routine named ''.
+    """
+    routines = [Routine('')]
+    for index, stmt in enumerate(program.statements):
+        if isinstance(stmt, Label) and not stmt.name.isdigit():
+            routines.append(Routine(stmt.name))
+        routine = routines[-1]
+        routine.statements.append((index, stmt))
+        routine.defines |= _defined_names(stmt)
+        routine.references |= _referenced_names(stmt)
+        if isinstance(stmt, (IfDef, If, EnumDef)):
+            # Too much is decided at compile time; keep such routines whole
+            routine.strippable = False
+        if _emits(stmt):
+            routine.first = routine.first or _kind(stmt)
+            routine.last = _kind(stmt)
+        emitting = [s for s in stmt.statements if _emits(s)] if isinstance(stmt, _BLOCKS) else []
+        if emitting:
+            last = emitting[-1]
+            routine.falls_through = not (isinstance(last, Instruction) and last.mnemonic in _NO_FALL_THROUGH)
+        elif _emits(stmt):
+            # Data is not executed, so it does not fall through either. A
+            # dispatch without a default continues after it on no match, and
+            # generated fill/copy code always does
+            if isinstance(stmt, Dispatch):
+                routine.falls_through = stmt.default is None
+            elif isinstance(stmt, Directive) and stmt.name in UNROLL_DIRECTIVES:
+                routine.falls_through = True
+            else:
+                routine.falls_through = isinstance(stmt, Instruction) and stmt.mnemonic not in _NO_FALL_THROUGH
+    if routines[0].first is None:
+        # Only symbols and .org before the first label: no code to run into it
+        routines[0].falls_through = False
+    if not routines[0].statements:
+        routines.pop(0)
+    return routines
+
+def exported_names(program: Program) -> Set[str]:
+    names = set()
+    for stmt in program.statements:
+        if isinstance(stmt, Directive) and stmt.name == '.export':
+            names.update(stmt.args)
+    return names
+
+def reachable(routines: List[Routine], entries: Set[str]) -> Set[int]:
+    """
+    Indexes of the routines reachable from the entry names, the code before
+    the first label and every routine that cannot be stripped. Labelled data
+    right next to other data is kept with it, as it may be one structure.
+    """
+    owners: Dict[str, List[int]] = {}
+    for i, routine in enumerate(routines):
+        for name in routine.defines:
+            owners.setdefault(name, []).append(i)
+    work = [i for name in entries for i in owners.get(name, [])]
+    work += [i for i, r in enumerate(routines) if r.name == '' or not r.strippable]
+    seen: Set[int] = set()
+    while work:
+        i = work.pop()
+        if i in seen:
+            continue
+        seen.add(i)
+        routine = routines[i]
+        for name in routine.references:
+            # instance.field belongs to whatever defines instance
+            work.extend(owners.get(name) or owners.get(name.split('.')[0], []))
+        following = routines[i + 1] if i + 1 < len(routines) else None
+        if following is not None and (routine.falls_through or (routine.last == 'data' and following.first == 'data')):
+            work.append(i + 1)
+        if i > 0 and routine.first == 'data' and routines[i - 1].last == 'data':
+            work.append(i - 1)
+    return seen
+
+def strip_unreferenced(program: Program, compiler: Compiler,
+                       entries: List[str] = None) -> Tuple[Program, StripReport]:
+    """
+    Returns program without the routines that nothing reachable calls,
+    jumps or branches to, or names in an operand or data. Roots are the
+    entry labels (the first routine if none are given), .export'ed
+    names and the code before the first label.
+    """
+    routines = split_routines(program)
+    names = set(entries or [])
+    if not names:
+        first = next((r for r in routines if r.name), None)
+        if first is not None:
+            names.add(first.name)
+    names |= exported_names(program)
+    for stmt in program.statements:
+        if isinstance(stmt, Assignment):
+            names |= _expr_names(stmt.value)
+    live = reachable(routines, names)
+
+    report = StripReport(kept=len(live))
+    dead = [r for i, r in enumerate(routines) if i not in live]
+    if not dead:
+        return program, report
+
+    sizes = compiler.layout(program).measure(program)
+    drop = set()
+    for routine in dead:
+        for index, stmt in routine.statements:
+            routine.size += sizes[index]
+            if _emits(stmt) or isinstance(stmt, Label):
+                drop.add(index)
+        report.removed.append(routine)
+    statements = [stmt for index, stmt in enumerate(program.statements) if index not in drop]
+    return Program(statements), report
@@ -0,0 +1,132 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Pipeline phases, in the order they run
+PHASES = ('tokenize', 'parse', 'optimize', 'pass1', 'pass2', 'output')
+
+class BuildStats:
+    """
+    Collects per-phase wall time and counters for one or more assemblies.
+
+    Pass an instance to Assembler(stats=...) and read the results back with
+    as_dict(). Timings accumulate, so one instance can cover several files.
+    """
+    def __init__(self, trace_memory: bool = False):
+        self.times: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+        self.counts: Dict[str, int] = {'tokens': 0, 'statements': 0, 'bytes': 0, 'symbols': 0}
+        self.trace_memory = trace_memory
+        self.peak_memory: Optional[int] = None
+        self.hotspots: Optional[List[dict]] = None
+        self._started_tracing = False
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def start_memory(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop_memory(self):
+        if not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_memory = max(peak, self.peak_memory or 0)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def total_time(self) -> float:
+        return sum(self.times.values())
+
+    def as_dict(self) -> dict:
+        def rate(count, seconds):
+            return count / seconds if seconds > 0 else 0.0
+
+        compile_time = self.times['pass1'] + self.times['pass2']
+        result = {
+            'phases': dict(self.times),
+            'total': self.total_time(),
+            'counts': dict(self.counts),
+            'rates': {
+                'tokens_per_sec': rate(self.counts['tokens'], self.times['tokenize']),
+                'statements_per_sec': rate(self.counts['statements'], self.times['parse']),
+                'bytes_per_sec': rate(self.counts['bytes'], compile_time),
+            },
+            'peak_memory': self.peak_memory,
+            # Times taken with tracemalloc on are not comparable to plain ones
+            'memory_traced': self.trace_memory,
+        }
+        if self.hotspots is not None:
+            result['hotspots'] = self.hotspots
+        return result
+
+    def format(self) -> str:
+        data = self.as_dict()
+        lines = ["Build statistics (timed under tracemalloc):" if data['memory_traced'] else "Build statistics:"]
+        total = data['total'] or 1.0
+        for phase in PHASES:
+            seconds = data['phases'][phase]
+            lines.append(f"  {phase:<10} {seconds * 1000:9.2f} ms {seconds / total * 100:5.1f}%")
+        lines.append(f"  {'total':<10} {data['total'] * 1000:9.2f} ms")
+        counts = data['counts']
+        rates = data['rates']
+        lines.append(f"  tokens:     {counts['tokens']:>9} ({rates['tokens_per_sec']:,.0f}/s)")
+        lines.append(f"  statements: {counts['statements']:>9} ({rates['statements_per_sec']:,.0f}/s)")
+        lines.append(f"  bytes:      {counts['bytes']:>9} ({rates['bytes_per_sec']:,.0f}/s)")
+        lines.append(f"  symbols:    {counts['symbols']:>9}")
+        for name in sorted(counts):
+            if name not in ('tokens', 'statements', 'bytes', 'symbols'):
+                lines.append(f"  {name + ':':<11} {counts[name]:>9}")
+        if data['peak_memory'] is not None:
+            lines.append(f"  peak mem:   {data['peak_memory'] / 1024:9.1f} KiB")
+        return "\n".join(lines)
+
+def count_statements(statements) -> int:
+    # Count statements including those nested in conditional and other blocks
+    total = 0
+    for stmt in statements:
+        total += 1
+        for attr in ('then_block', 'else_block', 'statements'):
+            block = getattr(stmt, attr, None)
+            if block:
+                total += count_statements(block)
+    return total
+
+def profile_summary(profile, limit: int = 20, package_dir: str = None) -> List[dict]:
+    """
+    Returns the hottest functions from a cProfile.Profile as a list of dicts,
+    restricted to files in package_dir (this lib/ directory by default).
+    """
+    import os
+    import pstats
+
+    package_dir = os.path.abspath(package_dir or os.path.dirname(__file__))
+    stats = pstats.Stats(profile)
+    entries = []
+    for (filename, line, func), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        if os.path.dirname(os.path.abspath(filename)) != package_dir:
+            continue
+        entries.append({
+            'function': func,
+            'file': f"{os.path.basename(package_dir)}/{os.path.basename(filename)}",
+            'line': line,
+            'calls': nc,
+            'tottime': tottime,
+            'cumtime': cumtime,
+        })
+    entries.sort(key=lambda e: e['tottime'], reverse=True)
+    return entries[:limit]
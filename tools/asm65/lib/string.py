@@ -4,3 +4,67 @@ def str_compare(a: str, b: str, casei: bool) -> bool:
   if casei:
     return a.lower() == b.lower()
   return a == b
+
+# Text directives; all of them encode to constant bytes at parse time
+STRING_DIRECTIVES = ('.asciiz', '.ascii_hi', '.asciiz_hi', '.pstring')
+
+# Sets bit 7 on every byte (Apple II "normal" text)
+HIGH_BIT = bytes(i | 0x80 for i in range(256))
+
+def encode_latin1(text: str) -> bytes:
+  try:
+    return text.encode('latin-1')
+  except UnicodeEncodeError:
+    return bytes(ord(char) & 0xFF for char in text)
+
+def encode_text(name: str, args: list) -> bytes:
+  """
+  Encodes the arguments of a string directive. Strings and constant numbers
+  may be mixed; numbers are taken as single bytes. Raises ValueError.
+  """
+  data = bytearray()
+  for arg in args:
+    if isinstance(arg, str):
+      data += encode_latin1(arg)
+    elif isinstance(arg, int):
+      data.append(arg & 0xFF)
+    else:
+      raise ValueError(f"{name} only takes strings and constant numbers")
+  if name.endswith('_hi'):
+    data = data.translate(HIGH_BIT)
+  if name.startswith('.asciiz'):
+    data.append(0)
+  if name == '.pstring':
+    if len(data) > 255:
+      raise ValueError(f".pstring is {len(data)} bytes long, the limit is 255")
+    data.insert(0, len(data))
+  return bytes(data)
+
+def build_pool(strings: list) -> tuple:
+  """
+  Lays out a string pool. `strings` is a list of (data, terminated) pairs.
+  Identical strings are stored once, and a zero-terminated string that is
+  the tail of another one points into it. Returns (blob, offsets) where
+  offsets[i] is the position of strings[i] in the blob.
+  """
+  placed = {}
+  blob = bytearray()
+
+  # Sorting on the reversed bytes puts every string right after the
+  # strings it is a suffix of, so one pass finds all sharing
+  terminated = sorted({data for data, term in strings if term}, key=lambda d: d[::-1], reverse=True)
+  owner = None
+  for data in terminated:
+    if owner is not None and owner.endswith(data):
+      placed[(data, True)] = placed[(owner, True)] + len(owner) - len(data)
+    else:
+      placed[(data, True)] = len(blob)
+      blob += data
+      owner = data
+
+  for data, term in strings:
+    if not term and (data, False) not in placed:
+      placed[(data, False)] = len(blob)
+      blob += data
+
+  return bytes(blob), [placed[(data, term)] for data, term in strings]
@@ -0,0 +1,70 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+# How .aos/.soa lay out instances: interleaved records, or one array per field byte
+STRUCT_LAYOUTS = ('aos', 'soa')
+
+class StructError(Exception):
+    pass
+
+@dataclass
+class StructLayout:
+    name: str
+    fields: List[Tuple[str, int, int]] = field(default_factory=list) # (name, offset, size)
+    size: int = 0
+
+    def add(self, name: str, size: int):
+        if size < 1:
+            raise StructError(f"Field '{name}' of struct '{self.name}' has size {size}")
+        if name == 'size' or any(f[0] == name for f in self.fields):
+            raise StructError(f"Duplicate field '{name}' in struct '{self.name}'")
+        self.fields.append((name, self.size, size))
+        self.size += size
+
+    def symbols(self) -> List[Tuple[str, int]]:
+        """Name.field offsets and Name.size."""
+        return [(f"{self.name}.{name}", offset) for name, offset, _ in self.fields] + [(f"{self.name}.size", self.size)]
+
+def plane_names(name: str, size: int) -> List[List[str]]:
+    # Labels of each byte of a field: word fields get .lo/.hi, longer ones .0, .1, ...
+    if size == 1:
+        return [[name]]
+    planes = [[f"{name}.{k}"] for k in range(size)]
+    planes[0].insert(0, name)
+    if size == 2:
+        planes[0].append(f"{name}.lo")
+        planes[1].append(f"{name}.hi")
+    return planes
+
+def aos_labels(name: str, struct: StructLayout, count: int, start: int) -> Tuple[List[Tuple[str, int]], int]:
+    """
+    Array of structs: count records of struct.size bytes back to back.
+    name.field is the field in the first record, so record i is at
+    name.field + i * Struct.size. Returns the labels and the end address.
+    """
+    labels = [(name, start)] + [(f"{name}.{field}", start + offset) for field, offset, _ in struct.fields]
+    return labels, start + count * struct.size
+
+def soa_labels(name: str, struct: StructLayout, count: int, start: int,
+               page: bool = False) -> Tuple[List[Tuple[str, int]], int]:
+    """
+    Struct of arrays: one count-byte array per byte of each field, so
+    record i's field is name.field,X with X = i. Each array is placed so
+    that it does not cross a page (or at a page start, with page=True),
+    which keeps every indexed access at its base cycle count.
+    Returns the labels and the end address, including padding.
+    """
+    if not 1 <= count <= 256:
+        raise StructError(f"'{name}' has {count} records; struct-of-arrays needs 1-256 to index with X or Y")
+    labels = []
+    pc = start
+    for field_name, _, size in struct.fields:
+        for names in plane_names(f"{name}.{field_name}", size):
+            offset = pc & 0xFF
+            if offset and (page or offset + count > 256):
+                pc += 256 - offset
+            labels += [(label, pc) for label in names]
+            pc += count
+    # The instance name is the first array, after any padding
+    first = labels[0][1] if labels else start
+    return [(name, first)] + labels, pc
@@ -0,0 +1,121 @@
+import ast
+import math
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Output layouts: one byte per entry, little-endian words, or all low bytes
+# followed by all high bytes (name.lo / name.hi)
+TABLE_KINDS = ('byte', 'word', 'split')
+
+def text_row(row: int) -> int:
+    """Address of a 40-column text row on page 1 ($400 interleave)."""
+    return 0x400 + 0x80 * (row % 8) + 0x28 * (row // 8)
+
+def hgr_row(y: int) -> int:
+    """Address of a hi-res scan line on page 1 ($2000 interleave)."""
+    return 0x2000 + 0x400 * (y % 8) + 0x80 * ((y // 8) % 8) + 0x28 * (y // 64)
+
+def crc16(value: int) -> int:
+    """CRC-16/CCITT (polynomial $1021) table entry for one byte."""
+    crc = value << 8
+    for _ in range(8):
+        crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+    return crc & 0xFFFF
+
+# Functions and constants an expression may use, besides i, count and symbols
+FUNCTIONS: Dict[str, Callable] = {
+    'text_row': text_row, 'hgr_row': hgr_row, 'crc16': crc16,
+    'lo': lambda v: v & 0xFF, 'hi': lambda v: (v >> 8) & 0xFF,
+    'abs': abs, 'min': min, 'max': max, 'int': int, 'round': round,
+    'sin': math.sin, 'cos': math.cos, 'sqrt': math.sqrt, 'floor': math.floor, 'ceil': math.ceil,
+}
+CONSTANTS = {'pi': math.pi}
+
+# name -> (count, kind, expression)
+BUILTINS: Dict[str, Tuple[int, str, str]] = {
+    'text_rows': (24, 'split', "text_row(i)"),
+    'hgr_rows': (192, 'split', "hgr_row(i)"),
+    'mul40': (24, 'split', "i * 40"),
+    'squares': (512, 'split', "i * i // 4"), # quarter squares: a*b = sq(a+b) - sq(a-b)
+    'crc16': (256, 'split', "crc16(i)"),
+}
+
+_ALLOWED = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.IfExp, ast.Compare, ast.BoolOp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.LShift, ast.RShift,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.USub, ast.UAdd, ast.Invert, ast.Not,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.And, ast.Or,
+)
+
+class TableError(Exception):
+    pass
+
+class TableExpression:
+    """
+    An entry expression over i (0..count-1), checked against a small
+    whitelist of Python syntax. Assembly-style $hex numbers are accepted
+    (% is Python's modulo here, so binary is written 0b...). Names other
+    than i, count and the FUNCTIONS are assembler symbols.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        source = re.sub(r'\$([0-9A-Fa-f]+)', r'0x\1', text)
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise TableError(f"Invalid table expression '{text}': {e.msg}")
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED):
+                raise TableError(f"'{type(node).__name__}' is not allowed in table expression '{text}'")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                raise TableError(f"Unknown function in table expression '{text}'")
+            if isinstance(node, ast.Name):
+                names.add(node.id)
+        self.symbols = sorted(names - set(FUNCTIONS) - set(CONSTANTS) - {'i', 'count'})
+        # The whole table is one list comprehension over a single code object
+        body = ast.unparse(tree.body)
+        self.code = compile(f"[({body}) for i in range(count)]", "<table>", 'eval')
+
+    def evaluate(self, count: int, symbols: Dict[str, int] = None) -> List[int]:
+        namespace = {'__builtins__': {'range': range}, 'count': count, **FUNCTIONS, **CONSTANTS}
+        for name in self.symbols:
+            value = (symbols or {}).get(name)
+            if value is None:
+                raise TableError(f"Unknown symbol '{name}' in table expression '{self.text}'")
+            namespace[name] = value
+        try:
+            values = eval(self.code, namespace)
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise TableError(f"Table expression '{self.text}' failed: {e}")
+        return [int(v) for v in values]
+
+def entry_size(kind: str) -> int:
+    return 1 if kind == 'byte' else 2
+
+def encode_table(values: List[int], kind: str) -> bytes:
+    """Packs entry values as bytes, words or split lo/hi halves."""
+    low, high = (-0x80, 0xFF) if kind == 'byte' else (-0x8000, 0xFFFF)
+    for index, value in enumerate(values):
+        if not low <= value <= high:
+            raise TableError(f"Entry {index} is {value}, which does not fit in a {kind} table")
+    if kind == 'byte':
+        return bytes(v & 0xFF for v in values)
+    lo = bytes(v & 0xFF for v in values)
+    hi = bytes((v >> 8) & 0xFF for v in values)
+    if kind == 'split':
+        return lo + hi
+    data = bytearray(2 * len(values))
+    data[0::2] = lo
+    data[1::2] = hi
+    return bytes(data)
+
+def table_labels(name: str, count: int, kind: str) -> List[Tuple[str, int]]:
+    """Labels a table defines and their offsets from its start."""
+    if kind == 'split':
+        return [(name, 0), (f"{name}.lo", 0), (f"{name}.hi", count)]
+    return [(name, 0)]
+
+def generate(expression: TableExpression, count: int, kind: str, symbols: Dict[str, int] = None) -> bytes:
+    return encode_table(expression.evaluate(count, symbols), kind)
@@ -1,5 +1,4 @@
 import re
-import re
 from enum import Enum
 
 class TokenType(Enum):
@@ -33,6 +32,33 @@ class Token:
   def __repr__(self):
     return self.__str__()
 
+# Regex patterns, tried in order (first match wins)
+PATTERNS = [
+    (TokenType.EOL, r'\n'),
+    (TokenType.DIR, r'\.[a-zA-Z0-9_]+'),
+    (TokenType.NUM, r'\$[0-9a-fA-F]+'),      # Hex $12
+    (TokenType.NUM, r'0x[0-9a-fA-F]+'),      # Hex 0x12
+    (TokenType.NUM, r'%[01]+'),              # Binary %101
+    (TokenType.NUM, r'0b[01]+'),             # Binary 0b101
+    (TokenType.LOCAL_LABEL_REF, r'[0-9]+[fb]'), # Local label reference 1f, 1b
+    (TokenType.NUM, r'[0-9]+'),              # Decimal
+    # Only support simple chars for now
+    (TokenType.STR, r'"[^"]*"'),             # String "..."
+    (TokenType.NUM, r"'[^']'"),              # Char 'c' -> treated as NUM usually but kept as STR/NUM flexibility
+    (TokenType.OP,  r'[#=<>(),\[\]@:+\-*\/]'),   # Operators
+    (TokenType.ID,  r'[a-zA-Z_][a-zA-Z0-9_]*') # Identifiers
+]
+
+# All patterns compiled once into a single alternation. Python tries the
+# alternatives left to right, so this keeps the first-match-wins order above.
+_MASTER = re.compile("|".join(f"(?P<T{i}>{pattern})" for i, (_, pattern) in enumerate(PATTERNS)))
+_GROUP_TYPES = {f"T{i}": type for i, (type, _) in enumerate(PATTERNS)}
+
+# A directive at the start of a line, after an optional label (`skip: .if X`),
+# used when skipping dead conditional code
+_LINE_DIRECTIVE = re.compile(r'[ \t]*(?:(?:[a-zA-Z_][a-zA-Z0-9_]*|[0-9]+)[ \t]*:[ \t]*)?(\.[a-zA-Z0-9_]+)')
+CONDITIONAL_OPENERS = ('.if', '.ifdef', '.ifndef')
+
 class Tokenizer:
     def __init__(self, stream, filename: str = None):
         self.text = stream.read()
@@ -43,22 +69,7 @@ class Tokenizer:
         self.peek_token = None
         self.last_token = None
         
-        # Regex patterns
-        self.patterns = [
-            (TokenType.EOL, r'\n'),
-            (TokenType.DIR, r'\.[a-zA-Z0-9_]+'),
-            (TokenType.NUM, r'\$[0-9a-fA-F]+'),      # Hex $12
-            (TokenType.NUM, r'0x[0-9a-fA-F]+'),      # Hex 0x12
-            (TokenType.NUM, r'%[01]+'),              # Binary %101
-            (TokenType.NUM, r'0b[01]+'),             # Binary 0b101
-            (TokenType.LOCAL_LABEL_REF, r'[0-9]+[fb]'), # Local label reference 1f, 1b
-            (TokenType.NUM, r'[0-9]+'),              # Decimal
-            # Only support simple chars for now
-            (TokenType.STR, r'"[^"]*"'),             # String "..."
-            (TokenType.NUM, r"'[^']'"),              # Char 'c' -> treated as NUM usually but kept as STR/NUM flexibility
-            (TokenType.OP,  r'[#=<>(),@:+\-*\/]'),   # Operators
-            (TokenType.ID,  r'[a-zA-Z_][a-zA-Z0-9_]*') # Identifiers
-        ]
+        self.patterns = PATTERNS
 
     def next_token(self) -> Token:
         if self.peek_token:
@@ -79,23 +90,22 @@ class Tokenizer:
             self._skip_comment()
             return self.next_token() # Recursively get next token after comment
             
-        remaining = self.text[self.pos:]
-        
-        for type, pattern in self.patterns:
-            match = re.match(pattern, remaining)
-            if match:
-                lexeme = match.group(0)
-                self.pos += len(lexeme)
-                if type == TokenType.EOL:
-                    self.line += 1
-                    tok = Token(type, lexeme, None, self.line - 1, self.filename)
-                    self.last_token = tok
-                    return tok
-                
-                value = self._parse_value(type, lexeme)
-                tok = Token(type, lexeme, value, self.line, self.filename)
+        # Match in place; slicing the remaining text per token is quadratic
+        match = _MASTER.match(self.text, self.pos)
+        if match:
+            type = _GROUP_TYPES[match.lastgroup]
+            lexeme = match.group(0)
+            self.pos = match.end()
+            if type == TokenType.EOL:
+                self.line += 1
+                tok = Token(type, lexeme, None, self.line - 1, self.filename)
                 self.last_token = tok
                 return tok
+            
+            value = self._parse_value(type, lexeme)
+            tok = Token(type, lexeme, value, self.line, self.filename)
+            self.last_token = tok
+            return tok
                 
         # Unknown character
         char = self.text[self.pos]
@@ -104,6 +114,41 @@ class Tokenizer:
         self.last_token = tok
         return tok
 
+    def skip_conditional(self) -> 'tuple[str | None, int]':
+        """
+        Skips whole lines up to the .else or .endif closing the current
+        conditional block, without tokenizing them. Nested blocks are
+        skipped entirely. The closing line is consumed; returns its
+        directive (None at end of file) and the number of lines skipped.
+        """
+        assert self.peek_token is None
+        text = self.text
+        pos = self.pos
+        start_line = self.line
+        depth = 0
+        while pos < self.len:
+            end = text.find('\n', pos)
+            if end == -1:
+                end = self.len
+            match = _LINE_DIRECTIVE.match(text, pos, end)
+            pos = end + 1
+            self.line += 1
+            if match is None:
+                continue
+            name = match.group(1)
+            if name in CONDITIONAL_OPENERS:
+                depth += 1
+            elif name == '.endif':
+                if depth == 0:
+                    self.pos = min(pos, self.len)
+                    return name, self.line - start_line
+                depth -= 1
+            elif name == '.else' and depth == 0:
+                self.pos = min(pos, self.len)
+                return name, self.line - start_line
+        self.pos = self.len
+        return None, self.line - start_line
+
     def _skip_whitespace(self):
         while self.pos < self.len:
             char = self.text[self.pos]
@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .ast import Instruction
+from .opcodes import cycle_table
+
+UNROLL_DIRECTIVES = ('.unroll_fill', '.unroll_copy')
+
+# Loops step X with one DEX/INX per unit of stride; past this a loop is no
+# longer worth it and the code should be unrolled fully
+MAX_LOOP_STRIDE = 4
+
+class UnrollError(Exception):
+    pass
+
+@dataclass
+class UnrollPlan:
+    """
+    How count elements, stride bytes apart, are covered: iterations passes
+    of a loop with unroll stores (or loads and stores) each, then remainder
+    elements in straight-line code. No loop at all when iterations is 0.
+    """
+    kind: str # 'fill' or 'copy'
+    count: int
+    stride: int
+    unroll: int
+    iterations: int
+    remainder: int
+
+    @property
+    def counts_up(self) -> bool:
+        # X runs 0, s, ... and wraps to 0 on the last INX; otherwise it counts down to 0
+        return self.iterations * self.stride == 256
+
+def plan(kind: str, count: int, stride: int = 1, unroll: Optional[int] = None) -> UnrollPlan:
+    if count < 1:
+        raise UnrollError(f"Nothing to {kind}: count is {count}")
+    if stride < 1:
+        raise UnrollError(f"Stride must be at least 1, not {stride}")
+    unroll = count if unroll is None else unroll
+    if unroll < 1:
+        raise UnrollError(f"Unroll factor must be at least 1, not {unroll}")
+    if unroll >= count:
+        return UnrollPlan(kind, count, stride, count, 0, count)
+    iterations = count // unroll
+    if iterations * stride > 256:
+        raise UnrollError(f"{iterations} iterations of stride {stride} do not fit in X; unroll at least "
+                          f"{-(-count * stride // 256)} times")
+    if stride > MAX_LOOP_STRIDE:
+        raise UnrollError(f"Stride {stride} is too large for a loop (at most {MAX_LOOP_STRIDE}); unroll fully")
+    return UnrollPlan(kind, count, stride, unroll, iterations, count - iterations * unroll)
+
+def loop_operands(p: UnrollPlan, base: int) -> List[int]:
+    """Indexed operand of each unrolled access in the loop body, for an area at base."""
+    span = p.iterations * p.stride
+    offset = 0 if p.counts_up else -p.stride
+    return [base + t * span + offset for t in range(p.unroll)]
+
+def tail_operands(p: UnrollPlan, base: int) -> List[int]:
+    """Absolute operand of each element after the loop."""
+    first = p.unroll * p.iterations if p.iterations else 0
+    return [base + k * p.stride for k in range(first, p.count)]
+
+def check_operands(p: UnrollPlan, bases: List[int]):
+    # zp,X wraps within zero page, so an indexed area has to stay on one side of $100
+    if not p.iterations:
+        return
+    top = (p.iterations - 1) * p.stride if p.counts_up else p.iterations * p.stride
+    for base in bases:
+        for operand in loop_operands(p, base):
+            if operand < 0 or (operand < 0x100 and operand + top > 0xFF):
+                raise UnrollError(f"Indexed access at ${max(operand, 0):04X} would wrap in zero page; unroll fully")
+
+def _mode(operand: int, indexed: bool) -> str:
+    if operand < 0x100:
+        return 'ZPX' if indexed else 'ZP'
+    return 'ABSX' if indexed else 'ABS'
+
+def instructions(p: UnrollPlan, src: int, dest: int) -> List[Instruction]:
+    """
+    The loop body (when there is a loop) followed by the straight-line tail.
+    The LDX before the loop and the closing branch are added by the caller,
+    which knows where the loop starts.
+    """
+    body = []
+    if p.iterations:
+        sources = loop_operands(p, src)
+        for i, operand in enumerate(loop_operands(p, dest)):
+            if p.kind == 'copy':
+                body.append(Instruction('LDA', 'ABSX', sources[i]))
+            body.append(Instruction('STA', 'ABSX', operand))
+        body += [Instruction('INX' if p.counts_up else 'DEX', 'IMP', None) for _ in range(p.stride)]
+    sources = tail_operands(p, src)
+    for i, operand in enumerate(tail_operands(p, dest)):
+        if p.kind == 'copy':
+            body.append(Instruction('LDA', 'ABS', sources[i]))
+        body.append(Instruction('STA', 'ABS', operand))
+    return body
+
+def index_start(p: UnrollPlan) -> int:
+    return 0 if p.counts_up else p.iterations * p.stride
+
+def cycles(p: UnrollPlan, src: int, dest: int, branch_crosses_page: bool = False, cpu: str = '6502') -> int:
+    """Total cycles of the generated code, with every indexed page crossing counted."""
+    table = cycle_table(cpu)
+    total = 0
+    if p.iterations:
+        total += table['LDX']['#'].base
+        xs = [j * p.stride for j in range(p.iterations)] if p.counts_up else \
+             [(j + 1) * p.stride for j in range(p.iterations)]
+        accesses = [('STA', operand) for operand in loop_operands(p, dest)]
+        if p.kind == 'copy':
+            accesses += [('LDA', operand) for operand in loop_operands(p, src)]
+        for mnemonic, operand in accesses:
+            entry = table[mnemonic][_mode(operand, True)]
+            total += entry.base * p.iterations
+            if entry.page:
+                total += sum(1 for x in xs if (operand & 0xFF) + x > 0xFF)
+        step = table['INX' if p.counts_up else 'DEX']['IMP'].base
+        branch = table['BNE']['REL'].base
+        taken = branch + 1 + (1 if branch_crosses_page else 0)
+        total += p.iterations * p.stride * step + (p.iterations - 1) * taken + branch
+    for operand in tail_operands(p, dest):
+        total += table['STA'][_mode(operand, False)].base
+    if p.kind == 'copy':
+        for operand in tail_operands(p, src):
+            total += table['LDA'][_mode(operand, False)].base
+    return total
+
+@dataclass
+class UnrollReport:
+    plan: UnrollPlan
+    cycles: int
+    size: int # Bytes of generated code
+    filename: Optional[str] = None
+    line: int = 0
+
+    @property
+    def cycles_per_byte(self) -> float:
+        return self.cycles / self.plan.count
+
+    def format(self) -> str:
+        p = self.plan
+        loc = f"{self.filename}:{self.line}" if self.filename else f"line {self.line}"
+        shape = f"{p.iterations} x {p.unroll}" + (f" + {p.remainder}" if p.iterations and p.remainder else "") \
+            if p.iterations else "fully unrolled"
+        return (f"Unrolled {p.kind} ({loc}): {p.count} bytes, stride {p.stride}, {shape}, "
+                f"{self.size} bytes of code, {self.cycles} cycles ({self.cycles_per_byte:.2f} per byte)")
@@ -0,0 +1,144 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ast import Statement, Instruction, Label, Unresolved, BinaryExpr
+
+# Zero page bytes that are free on an Apple II running the Monitor, DOS and BASIC
+DEFAULT_RANGES = [(0x06, 0x09), (0xEB, 0xEF), (0xFA, 0xFF)]
+# Where variables go once the zero page ranges are full (page 3 free space)
+DEFAULT_OVERFLOW = (0x0300, 0x03CF)
+
+# An access inside a loop counts this many times more, per level of nesting
+LOOP_WEIGHT = 8
+MAX_LOOP_DEPTH = 2
+
+# Modes that only work with a zero page operand
+_POINTER_MODES = ('INDX', 'INDY')
+
+class AllocationError(Exception):
+    pass
+
+@dataclass
+class ZpVar:
+    name: str
+    size: int
+    node: Statement
+    accesses: int = 0 # Static references, weighted for loops
+    pointer: bool = False # Used as (zp,X) or (zp),Y, so it has to live in zero page
+    address: Optional[int] = None
+
+    @property
+    def in_zero_page(self) -> bool:
+        return self.address is not None and self.address + self.size <= 0x100
+
+def operand_names(expr) -> Iterable[str]:
+    if isinstance(expr, Unresolved):
+        if expr.type != 'LOCAL_REL':
+            yield expr.name
+    elif isinstance(expr, BinaryExpr):
+        yield from operand_names(expr.left)
+        yield from operand_names(expr.right)
+
+def _loop_depths(block: List[Statement]) -> List[int]:
+    # Lexical loops: code between a label and a later branch or jump back to it
+    labels: Dict[str, int] = {}
+    depths = [0] * len(block)
+    for i, stmt in enumerate(block):
+        if isinstance(stmt, Label):
+            labels[stmt.name] = i
+        elif isinstance(stmt, Instruction) and isinstance(stmt.operand, Unresolved):
+            name = stmt.operand.name
+            if stmt.operand.type == 'LOCAL_REL':
+                if not name.endswith('b'):
+                    continue
+                name = name[:-1]
+            start = labels.get(name)
+            if start is not None:
+                for j in range(start, i + 1):
+                    depths[j] += 1
+    return depths
+
+def count_accesses(blocks: Iterable[List[Statement]], variables: Dict[str, ZpVar]):
+    """Adds each instruction operand reference to a variable to its access count."""
+    for block in blocks:
+        depths = None
+        for i, stmt in enumerate(block):
+            if not isinstance(stmt, Instruction) or stmt.mode in ('#', 'IMP', 'ACC'):
+                continue
+            for name in operand_names(stmt.operand):
+                var = variables.get(name)
+                if var is None:
+                    continue
+                if depths is None:
+                    depths = _loop_depths(block)
+                var.accesses += LOOP_WEIGHT ** min(depths[i], MAX_LOOP_DEPTH)
+                if stmt.mode in _POINTER_MODES:
+                    var.pointer = True
+
+class ZeroPageAllocator:
+    """
+    Packs .zpvar declarations into the free zero page ranges. Pointers
+    ((zp),Y and (zp,X) operands) go first, then the variables with the most
+    accesses per byte; whatever does not fit goes to the overflow area.
+    Allocated bytes stay taken, so several compile() calls share the map.
+    """
+    def __init__(self, ranges: List[Tuple[int, int]] = None, overflow: Tuple[int, int] = None):
+        self.ranges = list(ranges or DEFAULT_RANGES)
+        self.overflow = overflow or DEFAULT_OVERFLOW
+        self.custom_ranges = False
+        self.used = set()
+        self.overflow_next = self.overflow[0]
+        self.variables: List[ZpVar] = []
+
+    def add_range(self, start: int, end: int):
+        if not 0 <= start <= end <= 0xFF:
+            raise AllocationError(f"Zero page range ${start:02X}-${end:02X} is outside $00-$FF")
+        # The first .zprange replaces the defaults
+        if not self.custom_ranges:
+            self.ranges = []
+            self.custom_ranges = True
+        self.ranges.append((start, end))
+
+    def set_overflow(self, start: int, end: int):
+        if not 0 <= start <= end <= 0xFFFF:
+            raise AllocationError(f"Overflow area ${start:04X}-${end:04X} is outside memory")
+        self.overflow = (start, end)
+        self.overflow_next = start
+
+    def allocate(self, variables: List[ZpVar]):
+        order = sorted(variables, key=lambda v: (not v.pointer, -v.accesses / v.size))
+        for var in order:
+            var.address = self._take_zero_page(var.size)
+            if var.address is None:
+                if var.pointer:
+                    raise AllocationError(f"No zero page left for pointer '{var.name}' ({var.size} bytes)")
+                var.address = self._take_overflow(var)
+        self.variables.extend(variables)
+
+    def _take_zero_page(self, size: int) -> Optional[int]:
+        for start, end in self.ranges:
+            for address in range(start, end - size + 2):
+                span = range(address, address + size)
+                if not any(a in self.used for a in span):
+                    self.used.update(span)
+                    return address
+        return None
+
+    def _take_overflow(self, var: ZpVar) -> int:
+        address = self.overflow_next
+        if address + var.size - 1 > self.overflow[1]:
+            raise AllocationError(f"No room for '{var.name}' ({var.size} bytes): zero page and overflow area "
+                                  f"${self.overflow[0]:04X}-${self.overflow[1]:04X} are full")
+        self.overflow_next += var.size
+        return address
+
+    def format(self) -> str:
+        lines = ["Zero page allocation:"]
+        for var in sorted(self.variables, key=lambda v: v.address):
+            where = "zp" if var.in_zero_page else "overflow"
+            kind = ", pointer" if var.pointer else ""
+            lines.append(f"  ${var.address:04X}  {var.name:<20} {var.size:>3} byte(s)  "
+                         f"{var.accesses:>5} accesses  {where}{kind}")
+        free = sum(1 for start, end in self.ranges for a in range(start, end + 1) if a not in self.used)
+        lines.append(f"  {free} zero page byte(s) free")
+        return "\n".join(lines)
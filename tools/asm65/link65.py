@@ -0,0 +1,44 @@
+import sys
+import argparse
+
+from lib.linker import LinkError, link_files
+from lib.objfile import ObjectError
+from lib.output import write_chunks
+
+def build_arg_parser():
+  parser = argparse.ArgumentParser(description="link65 - links asm65 object files (asm65 -c) into a program")
+  parser.add_argument("files", nargs="+", metavar="object_files... output_file", help="Object files followed by the output file (or give it with -o)")
+  parser.add_argument("-o", "--output", help="Output file")
+  parser.add_argument("-C", "--config", metavar="FILE", help="JSON memory config with memory areas, forbidden regions and segments (default: one area at $0800-$95FF)")
+  parser.add_argument("-f", "--format", choices=["bin", "hex"], default="bin", help="Output format (bin is default)")
+  parser.add_argument("-m", "--map", action="store_true", help="Print where each section and exported symbol went and the free memory left")
+  return parser
+
+def parse_args(argv=None):
+  parser = build_arg_parser()
+  args = parser.parse_args(argv)
+  if args.output is None:
+      if len(args.files) < 2:
+          parser.error("expected one or more object files followed by an output file")
+      args.output = args.files.pop()
+  return args
+
+def main(argv=None):
+  args = parse_args(argv)
+  try:
+      result = link_files(args.files, args.config)
+  except (OSError, ObjectError, LinkError) as e:
+      print(f"Error: {e}", file=sys.stderr)
+      sys.exit(1)
+
+  report_written(write_chunks(result.chunks, args.output, args.format), args.format)
+  if args.map:
+      print(result.format_map())
+
+def report_written(written, format):
+  kind = "binary" if format == "bin" else format
+  for path, start, size in written:
+      print(f"Written {size} bytes at ${start:04X} to {path} ({kind})")
+
+if __name__ == "__main__":
+  main()
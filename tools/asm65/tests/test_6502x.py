@@ -0,0 +1,53 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.opcodes import Cycles, OPCODES_6502, cycle_table, opcode_table
+
+class Test6502X(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_not_available_by_default(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("lax $10\n")
+        with self.assertRaises(CompilerError):
+            self.assemble('.cpu "65c02"\nlax $10\n')
+
+    def test_encodings(self):
+        asm = self.assemble('.cpu "6502x"\n.org $1000\nlax $10\nlax $1234,y\nsax $20,y\n'
+                            'dcp $30,x\nisc ($40),y\nslo $2000,y\nanc #$80\nalr #$FE\narr #1\n')
+        self.assertEqual(asm.bytes, [0xA7, 0x10, 0xBF, 0x34, 0x12, 0x97, 0x20, 0xD7, 0x30, 0xF3, 0x40,
+                                     0x1B, 0x00, 0x20, 0x0B, 0x80, 0x4B, 0xFE, 0x6B, 0x01])
+
+    def test_missing_modes(self):
+        # SAX has no indexed absolute forms, LAX no abs,X
+        with self.assertRaises(CompilerError):
+            self.assemble('.cpu "6502x"\nsax $2000,y\n')
+        with self.assertRaises(CompilerError):
+            self.assemble('.cpu "6502x"\nlax $2000,x\n')
+
+    def test_table_shares_6502_modes(self):
+        table = opcode_table('6502x')
+        self.assertIs(opcode_table('6502x'), table)
+        self.assertIs(table['LDA'], OPCODES_6502['LDA'])
+        self.assertNotIn('LAX', OPCODES_6502)
+        self.assertNotIn('BRA', table)
+
+    def test_cycles(self):
+        t = cycle_table('6502x')
+        self.assertEqual(t['LAX']['ABSY'], Cycles(4, page=True))
+        self.assertEqual(t['LAX']['INDY'], Cycles(5, page=True))
+        self.assertEqual(t['SAX']['INDX'], Cycles(6))
+        self.assertEqual(t['DCP']['ABSY'], Cycles(7))
+        self.assertEqual(t['ISC']['INDY'], Cycles(8))
+        self.assertEqual(t['SLO']['ZP'], Cycles(5))
+        self.assertEqual(t['ANC']['#'], Cycles(2))
+        # Documented instructions keep their NMOS timings
+        self.assertEqual(t['JMP']['IND'].base, 5)
+
+if __name__ == '__main__':
+    unittest.main()
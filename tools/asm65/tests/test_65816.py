@@ -0,0 +1,75 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.cycles import analyze
+from lib.opcodes import cycle_table
+
+class Test65816(unittest.TestCase):
+    def assemble(self, code, **kwargs):
+        asm = Assembler(**kwargs)
+        asm.assemble_stream(StringIO('.cpu 65816\n.org $8000\n' + code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_immediate_widths(self):
+        asm = self.assemble("lda #1\n.a16\nlda #$1234\nldx #1\n.i16\nldy #$0203\ncpx #4\nrep #$30\n"
+                            ".a8\nand #$0F\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x01, 0xA9, 0x34, 0x12, 0xA2, 0x01, 0xA0, 0x03, 0x02,
+                                     0xE0, 0x04, 0x00, 0xC2, 0x30, 0x29, 0x0F])
+
+    def test_width_directives_need_65816(self):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(".a16\n"), "t.asm")
+        with self.assertRaises(CompilerError):
+            asm.parse()
+
+    def test_cpu_switch_resets_widths(self):
+        asm = self.assemble('.a16\n.cpu "65c02"\n.cpu 65816\nlda #1\n')
+        self.assertEqual(asm.bytes, [0xA9, 0x01])
+
+    def test_address_sizes(self):
+        asm = self.assemble("lda $12\nlda $1234\nlda $123456\nlda $7E0000,x\nsta $1234,y\n")
+        self.assertEqual(asm.bytes, [0xA5, 0x12, 0xAD, 0x34, 0x12, 0xAF, 0x56, 0x34, 0x12,
+                                     0xBF, 0x00, 0x00, 0x7E, 0x99, 0x34, 0x12])
+        # No long abs,Y form
+        with self.assertRaises(CompilerError):
+            self.assemble("lda $123456,y\n")
+
+    def test_long_only_instructions(self):
+        asm = self.assemble("jsl sub\njml sub\njmp $018000\nsub: rtl\n")
+        self.assertEqual(asm.bytes, [0x22, 0x0C, 0x80, 0x00, 0x5C, 0x0C, 0x80, 0x00, 0x5C, 0x00, 0x80, 0x01, 0x6B])
+
+    def test_forward_long_reference(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("lda far\nfar = $7E2000\n")
+        self.assertEqual(self.assemble("far = $7E2000\nlda far\n").bytes, [0xAF, 0x00, 0x20, 0x7E])
+
+    def test_new_modes(self):
+        asm = self.assemble("lda 3,s\nsta (1,s),y\nlda [$10]\nlda [$10],y\njml [$1000]\njsr ($2000,x)\n"
+                            "pei ($30)\npea $1234\nmvn $01, $7E\nmvp 2, 3\n")
+        self.assertEqual(asm.bytes, [0xA3, 0x03, 0x93, 0x01, 0xA7, 0x10, 0xB7, 0x10, 0xDC, 0x00, 0x10,
+                                     0xFC, 0x00, 0x20, 0xD4, 0x30, 0xF4, 0x34, 0x12, 0x54, 0x7E, 0x01,
+                                     0x44, 0x03, 0x02])
+
+    def test_long_branches(self):
+        asm = self.assemble("top: brl top\nper data\n.fill 300\ndata: rts\n")
+        self.assertEqual(asm.bytes[:6], [0x82, 0xFD, 0xFF, 0x62, 0x2C, 0x01])
+
+    def test_operand_label_bytes(self):
+        asm = self.assemble("lda src: $7E0000,x\n.a16\nadc n: #0\n")
+        self.assertEqual([asm.symbols.get(f"src.{s}") for s in ('lo', 'hi', 'bank')], [0x8001, 0x8002, 0x8003])
+        self.assertEqual(asm.symbols.get('n.hi'), 0x8006)
+
+    def test_cycles(self):
+        t = cycle_table('65816')
+        self.assertEqual(t['LDA']['LONGX'].base, 5)
+        self.assertEqual(t['JSL']['LONG'].base, 8)
+        self.assertEqual(t['JMP']['IND'].base, 5)
+        self.assertNotIn('RMB0', t)
+        asm = self.assemble(".a16\nlda $1234\ninc $1234\nasl a\n.i16\nldx #1\nsta $10\n", listing=True)
+        report = analyze(asm.compiler.listing)
+        self.assertEqual([c.max for c in report.routines[0].blocks[0].costs], [5, 8, 2, 3, 4])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import json
+import unittest
+import tempfile
+from io import StringIO
+from lib.asm import Assembler
+from lib.batch import (BuildJob, Variant, load_manifest, build_job, run_batch, format_summary,
+                       parse_variant, variant_output, run_matrix)
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name), "rb") as f:
+            return f.read()
+
+    def test_manifest_paths_and_defines(self):
+        self.write("a.asm", "nop\n")
+        manifest = self.write("batch.json", json.dumps({
+            "output_dir": "out",
+            "jobs": [
+                {"name": "a", "sources": ["a.asm"], "output": "a.bin", "defines": ["DEBUG", "MAX=0x10"]},
+                {"source": "a.asm", "defines": {"LEVEL": 2}, "cpu": "65C02"},
+            ]
+        }))
+        jobs = load_manifest(manifest)
+        self.assertEqual(jobs[0].sources, [os.path.join(self.dir, "a.asm")])
+        self.assertEqual(jobs[0].output, os.path.join(self.dir, "out", "a.bin"))
+        self.assertEqual(jobs[0].defines, {"DEBUG": 1, "MAX": 16})
+        self.assertEqual(jobs[1].name, "a")
+        self.assertEqual(jobs[1].cpu, "65c02")
+        self.assertIsNone(jobs[1].output)
+
+    def test_jobs_are_isolated(self):
+        # Job "b" must not see the symbol that job "a" defines
+        a = self.write("a.asm", "FLAG = 1\nnop\n")
+        b = self.write("b.asm", ".ifdef FLAG\n  lda #1\n.else\n  lda #2\n.endif\n")
+        results = run_batch([
+            BuildJob("a", [a], os.path.join(self.dir, "a.bin")),
+            BuildJob("b", [b], os.path.join(self.dir, "b.bin")),
+        ], workers=1)
+        self.assertEqual([r.error for r in results], [None, None])
+        self.assertEqual(self.read("b.bin"), bytes([0xA9, 0x02]))
+
+    def test_multiple_sources_form_one_program(self):
+        main = self.write("main.asm", ".org $1000\njmp sub\n")
+        sub = self.write("sub.asm", "sub: rts\n")
+        result = build_job(BuildJob("prog", [main, sub], os.path.join(self.dir, "prog.bin")))
+        self.assertIsNone(result.error)
+        self.assertEqual(self.read("prog.bin"), bytes([0x4C, 0x03, 0x10, 0x60]))
+
+    def test_cpu_and_format(self):
+        src = self.write("c.asm", ".org $0800\nphx\n")
+        result = build_job(BuildJob("c", [src], os.path.join(self.dir, "c.hex"), cpu="65c02", format="hex"))
+        self.assertIsNone(result.error)
+        self.assertEqual(self.read("c.hex"), b"0800: DA\n")
+
+    def test_errors_are_reported_per_job(self):
+        good = self.write("good.asm", "nop\n")
+        bad = self.write("bad.asm", "bra nowhere\n")
+        results = run_batch([BuildJob("good", [good]), BuildJob("bad", [bad])], workers=1)
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[1].error)
+        summary = format_summary(results)
+        self.assertIn("FAILED", summary)
+        self.assertIn("2 job(s), 1 failed", summary)
+
+    def test_process_pool(self):
+        sources = [self.write(f"p{i}.asm", f".byte {i}\n") for i in range(3)]
+        jobs = [BuildJob(f"p{i}", [src], os.path.join(self.dir, f"p{i}.bin")) for i, src in enumerate(sources)]
+        results = run_batch(jobs, workers=2)
+        self.assertEqual([r.name for r in results], ["p0", "p1", "p2"])
+        for i in range(3):
+            self.assertEqual(self.read(f"p{i}.bin"), bytes([i]))
+
+class TestMatrix(unittest.TestCase):
+    SOURCE = """
+    .org $1000
+    .ifdef DEBUG
+        lda #$FF
+    .else
+        lda #LEVEL
+    .endif
+    LEVEL = 3
+        rts
+    """
+
+    def parse(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code))
+        return asm.parse_program()
+
+    def full_build(self, code, defines):
+        asm = Assembler()
+        for name, value in defines.items():
+            asm.define(name, value)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return bytes(asm.compiler.bytes)
+
+    def test_parse_variant(self):
+        self.assertEqual(parse_variant("release:"), Variant("release", {}))
+        self.assertEqual(parse_variant("dbg:DEBUG,MAX=0x20"), Variant("dbg", {"DEBUG": 1, "MAX": 32}))
+        with self.assertRaises(ValueError):
+            parse_variant("DEBUG")
+
+    def test_variant_output(self):
+        self.assertEqual(variant_output("out/prog.bin", "debug"), "out/prog-debug.bin")
+
+    def test_matrix_matches_full_builds(self):
+        program = self.parse(self.SOURCE)
+        variants = [Variant("release"), Variant("debug", {"DEBUG": 1}), Variant("level", {"LEVEL": 9})]
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "prog.bin")
+            # The same parsed program is compiled for every variant
+            results = run_matrix(program, variants, output=output, workers=1)
+            self.assertEqual([r.error for r in results], [None] * 3)
+            for variant in variants:
+                with open(variant_output(output, variant.name), "rb") as f:
+                    self.assertEqual(f.read(), self.full_build(self.SOURCE, variant.defines), variant.name)
+
+    def test_matrix_process_pool(self):
+        program = self.parse(self.SOURCE)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "prog.bin")
+            results = run_matrix(program, [Variant("a"), Variant("b", {"DEBUG": 1})], output=output, workers=2)
+            self.assertEqual([r.name for r in results], ["a", "b"])
+            self.assertEqual([r.size for r in results], [3, 3])
+            with open(variant_output(output, "b"), "rb") as f:
+                self.assertEqual(f.read(), bytes([0xA9, 0xFF, 0x60]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+import tempfile
+from lib.asm import Assembler
+from benchmarks.generate import SourceConfig, write_source
+from benchmarks.bench import compare
+
+class TestBenchmarkGenerator(unittest.TestCase):
+    def assemble(self, path):
+        asm = Assembler()
+        with open(path, "r") as f:
+            asm.assemble_stream(f, path)
+        asm.parse()
+        return asm
+
+    def test_generated_source_assembles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = SourceConfig(lines=400, table_size=100, forward_ratio=1.0)
+            path = write_source(config, tmp)
+            with open(path) as f:
+                line_count = len(f.readlines())
+            self.assertGreater(line_count, 300)
+            asm = self.assemble(path)
+            self.assertIn("table", asm.symbols)
+            self.assertGreater(len(asm.bytes), 100)
+
+    def test_include_depth(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_source(SourceConfig(lines=300, include_depth=3), tmp, "deep")
+            self.assertEqual(len([n for n in os.listdir(tmp) if n.endswith(".inc")]), 3)
+            flat = write_source(SourceConfig(lines=300), os.path.join(tmp, "flat"), "deep")
+            # Same program regardless of how it is split across files
+            self.assertEqual(self.assemble(path).bytes, self.assemble(flat).bytes)
+
+    def test_deterministic(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            a = write_source(SourceConfig(lines=200), os.path.join(tmp, "a"))
+            b = write_source(SourceConfig(lines=200), os.path.join(tmp, "b"))
+            with open(a) as fa, open(b) as fb:
+                self.assertEqual(fa.read(), fb.read())
+
+    def test_compare_flags_regressions(self):
+        phases = {'tokenize': 0.010, 'parse': 0.010, 'pass1': 0.001, 'pass2': 0.001, 'output': 0.0}
+        baseline = {'case': {'phases': phases, 'total': 0.022}}
+        slower = dict(phases, parse=0.020)
+        results = {'case': {'phases': slower, 'total': 0.032}}
+        messages = compare(results, baseline, 0.25)
+        self.assertTrue(any(m.startswith("case/parse") for m in messages))
+        self.assertEqual(compare(baseline, baseline, 0.25), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.ast import IfDef, If
+from lib.parser import ParserError
+from lib.compiler import CompilerError
+from lib.stats import BuildStats
+from lib.tokenizer import Tokenizer
+
+SOURCE = """
+.org $1000
+.ifdef DEBUG
+    lda #1
+  .ifdef VERBOSE
+    lda #2
+  .else
+    lda #3
+  .endif
+.else
+    lda #4
+  .if LEVEL - 2
+    lda #5
+  .endif
+.endif
+.ifndef DEBUG
+    lda #6
+.endif
+    rts
+"""
+
+class TestConditionals(unittest.TestCase):
+    def assemble(self, code, defines=None, preprocess=False, stats=None):
+        asm = Assembler(preprocess=preprocess, stats=stats)
+        for name, value in (defines or {}).items():
+            asm.define(name, value)
+        asm.assemble_stream(StringIO(code))
+        program = asm.parse_program()
+        asm.compile(program)
+        return asm, program
+
+    def test_ifndef(self):
+        asm, _ = self.assemble(".ifndef DEBUG\nlda #1\n.else\nlda #2\n.endif\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x01])
+        asm, _ = self.assemble(".ifndef DEBUG\nlda #1\n.else\nlda #2\n.endif\n", {'DEBUG': 1})
+        self.assertEqual(asm.bytes, [0xA9, 0x02])
+
+    def test_if_expression(self):
+        asm, _ = self.assemble("LEVEL = 2\n.if LEVEL - 2\nlda #1\n.else\nlda #2\n.endif\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x02])
+
+    def test_if_unresolved_is_an_error(self):
+        with self.assertRaises(CompilerError):
+            self.assemble(".if LATER\nnop\n.endif\nLATER = 1\n")
+
+    def test_preprocess_matches_ast_mode(self):
+        for defines in ({}, {'DEBUG': 1}, {'DEBUG': 1, 'VERBOSE': 1}, {'LEVEL': 3}, {'LEVEL': 2}):
+            ast_asm, _ = self.assemble(SOURCE, dict(defines, LEVEL=defines.get('LEVEL', 2)))
+            pre_asm, program = self.assemble(SOURCE, dict(defines, LEVEL=defines.get('LEVEL', 2)), preprocess=True)
+            self.assertEqual(ast_asm.bytes, pre_asm.bytes, defines)
+            # Every conditional was decided while parsing
+            self.assertFalse(any(isinstance(s, (IfDef, If)) for s in program.statements))
+
+    def test_dead_blocks_are_not_tokenized(self):
+        # The dead branch is not valid syntax at all
+        code = ".ifdef DEBUG\n  ]] not @ assembly\n  .ifdef X\n  ((\n  .endif\n.else\n  nop\n.endif\n"
+        asm, _ = self.assemble(code, preprocess=True)
+        self.assertEqual(asm.bytes, [0xEA])
+        with self.assertRaises(ParserError):
+            self.assemble(code)
+
+    def test_dead_lines_are_counted(self):
+        stats = BuildStats()
+        self.assemble(SOURCE, {'LEVEL': 2}, preprocess=True, stats=stats)
+        # DEBUG branch up to its .else (7 lines) and the .if LEVEL - 2 body (2)
+        self.assertEqual(stats.counts['skipped_lines'], 9)
+
+    def test_labelled_conditional_in_dead_block(self):
+        # The labelled .ifdef opens a nested block, so its .endif does not close the outer one
+        code = ".ifdef DEBUG\nskip: .ifdef X\n  nop\n.endif\n  brk\n1: .ifdef Y\n.endif\n.else\n  rts\n.endif\n"
+        for defines in ({}, {'DEBUG': 1}):
+            pre_asm, _ = self.assemble(code, defines, preprocess=True)
+            ast_asm, _ = self.assemble(code, defines)
+            self.assertEqual(pre_asm.bytes, ast_asm.bytes, defines)
+        self.assertEqual(pre_asm.bytes, [0x00])
+
+    def test_preprocess_sees_enums_and_zpvars(self):
+        codes = [".enum\nFOO\n.end\n.ifdef FOO\nnop\n.endif\n",
+                 ".enum\nONE = 1\nTWO\n.end\n.if TWO - 2\nbrk\n.else\nnop\n.endif\n",
+                 ".enum Cmd\nSEEK\n.end\n.ifdef SEEK\nbrk\n.endif\nnop\n",
+                 ".zpvar foo\n.ifdef foo\nnop\n.endif\n.ifndef foo\nbrk\n.endif\n"]
+        for code in codes:
+            with self.subTest(code=code):
+                ast_asm, _ = self.assemble(code)
+                pre_asm, program = self.assemble(code, preprocess=True)
+                self.assertEqual(pre_asm.bytes, [0xEA])
+                self.assertEqual(ast_asm.bytes, pre_asm.bytes)
+
+    def test_preprocess_sees_earlier_assignments(self):
+        code = "FAST = 1\n.ifdef FAST\nnop\n.endif\n.if FAST - 1\nbrk\n.endif\n"
+        asm, program = self.assemble(code, preprocess=True)
+        self.assertEqual(asm.bytes, [0xEA])
+        self.assertEqual(len(program.statements), 2)
+
+    def test_undecidable_if_stays_in_ast(self):
+        code = "start: nop\n.if start\nnop\n.endif\n"
+        asm, program = self.assemble(code, preprocess=True)
+        self.assertIsInstance(program.statements[-1], If)
+        self.assertEqual(asm.bytes, [0xEA])
+
+    def test_unterminated_block(self):
+        with self.assertRaises(ParserError):
+            self.assemble(".ifdef DEBUG\nnop\n", preprocess=True)
+        with self.assertRaises(ParserError):
+            self.assemble(".ifndef DEBUG\nnop\n", preprocess=True)
+
+    def test_skip_conditional_line_numbers(self):
+        lex = Tokenizer(StringIO("  nop\n  .if 1\n  .endif ; nested\n.else\nnop\n"))
+        self.assertEqual(lex.skip_conditional(), ('.else', 4))
+        tok = lex.next_token()
+        self.assertEqual((tok.lexeme, tok.line), ('nop', 5))
+
+if __name__ == '__main__':
+    unittest.main()
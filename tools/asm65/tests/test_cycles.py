@@ -0,0 +1,85 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.cycles import analyze, format_report
+from lib.opcodes import Cycles, cpu_names, cycle_table, opcode_table
+
+class TestCycleTables(unittest.TestCase):
+    def test_every_opcode_has_cycles(self):
+        for cpu in cpu_names():
+            cycles = cycle_table(cpu)
+            for mnemonic, modes in opcode_table(cpu).items():
+                self.assertEqual(set(cycles[mnemonic]), set(modes), (cpu, mnemonic))
+
+    def test_6502_counts(self):
+        t = cycle_table('6502')
+        self.assertEqual(t['LDA']['ABSX'], Cycles(4, page=True))
+        self.assertEqual(t['STA']['ABSX'], Cycles(5))
+        self.assertEqual(t['LDA']['INDY'], Cycles(5, page=True))
+        self.assertEqual(t['INC']['ABSX'], Cycles(7))
+        self.assertEqual(t['BNE']['REL'], Cycles(2, branch=True))
+        self.assertEqual(t['JSR']['ABS'].base, 6)
+        self.assertEqual(t['JMP']['IND'].base, 5)
+
+    def test_65c02_counts(self):
+        t = cycle_table('65c02')
+        self.assertEqual(t['JMP']['IND'].base, 6)
+        self.assertEqual(t['LSR']['ABSX'], Cycles(6, page=True))
+        self.assertEqual(t['STZ']['ABSX'], Cycles(5))
+        self.assertEqual(t['LDA']['IND'], Cycles(5))
+
+class TestCycleReport(unittest.TestCase):
+    def analyze(self, code):
+        asm = Assembler(listing=True)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return analyze(asm.compiler.listing, asm.compiler.listing_labels)
+
+    def test_indexed_page_penalty(self):
+        report = self.analyze(".org $1000\nlda $2000,x\nlda $2001,x\nlda ($80),y\nrts\n")
+        costs = report.routines[0].blocks[0].costs
+        self.assertEqual([(c.min, c.max) for c in costs], [(4, 4), (4, 5), (5, 6), (6, 6)])
+        self.assertEqual([c.data_dependent for c in costs], [False, True, True, False])
+
+    def test_branch_costs(self):
+        # The first branch stays on page $10, the second goes back to $0FFx
+        report = self.analyze(".org $0FF0\nback: nop\n.fill $0E\nfwd: beq near\nnear: bne back\nrts\n")
+        costs = {c.entry.mnemonic: c for r in report.routines for b in r.blocks for c in b.costs}
+        self.assertEqual((costs['BEQ'].min, costs['BEQ'].max), (2, 3))
+        self.assertEqual((costs['BNE'].min, costs['BNE'].max), (2, 4))
+        self.assertTrue(costs['BNE'].crosses_page)
+
+    def test_blocks_and_routines(self):
+        report = self.analyze(
+            ".org $1000\n"
+            "first: ldx #0\n"
+            "1: dex\n"
+            "   bne 1b\n"
+            "   rts\n"
+            "second: lda #1\n"
+            "   jmp second\n")
+        first, second = report.routines
+        self.assertEqual(first.name, 'first')
+        self.assertEqual([b.start for b in first.blocks], [0x1000, 0x1002, 0x1005])
+        self.assertEqual((first.min, first.max), (2 + 2 + 2 + 6, 2 + 2 + 3 + 6))
+        self.assertEqual((second.min, second.max), (5, 5))
+
+    def test_loops(self):
+        report = self.analyze(
+            ".org $1000\n"
+            "copy: ldy #0\n"
+            "loop: lda $2001,y\n"
+            "   sta $3000,y\n"
+            "   iny\n"
+            "   bne loop\n"
+            "   rts\n"
+            "other: jmp copy\n")
+        self.assertEqual(len(report.loops), 1)
+        loop = report.loops[0]
+        self.assertEqual(loop.name, 'loop')
+        self.assertEqual((loop.min, loop.max), (4 + 5 + 2 + 3, 5 + 5 + 2 + 3))
+        self.assertEqual([c.entry.mnemonic for c in loop.data_dependent], ['LDA'])
+        self.assertIn("VARIES", format_report(report))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,5 +50,26 @@ class TestDirectives(unittest.TestCase):
             # asm.py implementation defaults value to 0 if not provided
             self.assertEqual(self.asm.bytes[i], 0)
 
+    def test_constant_data_is_folded(self):
+        from lib.parser import fold_data
+        args, size = fold_data('.byte', [1, "AB", -1, 256])
+        self.assertEqual((args, size), ([b"\x01AB\xff\x00"], 5))
+        args, size = fold_data('.word', [0x1234, -2])
+        self.assertEqual((args, size), ([b"\x34\x12\xfe\xff"], 4))
+
+    def test_symbolic_entries_stay_separate(self):
+        from lib.ast import Unresolved
+        from lib.parser import fold_data
+        label = Unresolved('label', 'LOW')
+        args, size = fold_data('.byte', [1, 2, label, 3])
+        self.assertEqual((args, size), ([b"\x01\x02", label, b"\x03"], 4))
+        args, size = fold_data('.word', [label, 7])
+        self.assertEqual((args, size), ([label, b"\x07\x00"], 4))
+
+    def test_mixed_data_with_forward_refs(self):
+        self.parse(".org $1000\n.byte 1, <later, 2, >later\n.word later, $BEEF\nlater: .byte \"Z\"\n")
+        self.assertEqual(self.asm.bytes, [1, 0x08, 2, 0x10, 0x08, 0x10, 0xEF, 0xBE, ord('Z')])
+        self.assertEqual(self.asm.symbols.get('later'), 0x1008)
+
 if __name__ == '__main__':
     unittest.main()
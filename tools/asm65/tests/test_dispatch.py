@@ -0,0 +1,95 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.dispatch import DispatchLayout, chain_cycles, choose_layout
+
+class TestDispatchLayout(unittest.TestCase):
+    def test_dense_for_contiguous_keys(self):
+        layout = choose_layout([0xC1, 0xC2, 0xC3, 0xC5])
+        self.assertEqual((layout.kind, layout.low, layout.span), ('dense', 0xC1, 5))
+        self.assertEqual(layout.cycles, 30)
+
+    def test_sparse_for_scattered_keys(self):
+        layout = choose_layout([0x01, 0x40, 0x80])
+        self.assertEqual(layout.kind, 'sparse')
+        self.assertEqual(layout.table_bytes, 128 + 8)
+        self.assertEqual(layout.cycles, 34)
+
+    def test_full_byte_range_needs_no_check(self):
+        self.assertEqual(DispatchLayout('dense', 0, 255, 256).cycles, 22)
+
+    def test_chain_cycles(self):
+        self.assertEqual([chain_cycles(n) for n in (1, 2, 8)], [5, 9, 33])
+
+class TestDispatchDirective(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def byte(self, asm, address):
+        return asm.bytes[address - asm.origin]
+
+    def target(self, asm, name, key):
+        # Follow the tables the way the generated code does; RTS adds one
+        sym = asm.symbols.get
+        report = next(r for r in asm.compiler.dispatches if r.name == name)
+        index = key - report.layout.low
+        if report.layout.kind == 'sparse':
+            index = self.byte(asm, sym(f"{name}.index") + index)
+        return self.byte(asm, sym(f"{name}.lo") + index) + 256 * self.byte(asm, sym(f"{name}.hi") + index) + 1
+
+    def test_dense_dispatch(self):
+        asm = self.assemble(
+            ".org $1000\n"
+            ".dispatch cmd, other\n"
+            "    'A'+$80, do_a\n"
+            "    'B'+$80, do_b\n"
+            "    'D'+$80, do_d\n"
+            ".end\n"
+            "other: rts\ndo_a: rts\ndo_b: rts\ndo_d: rts\n")
+        self.assertEqual(asm.bytes[:7], [0x38, 0xE9, 0xC1, 0xC9, 0x04, 0xB0, 0x0A])
+        sym = asm.symbols.get
+        self.assertEqual(self.target(asm, 'cmd', 0xC1), sym('do_a'))
+        self.assertEqual(self.target(asm, 'cmd', 0xC3), sym('other'))
+        self.assertEqual(self.target(asm, 'cmd', 0xC4), sym('do_d'))
+        # Out of range keys jump to the default
+        nomatch = sym('cmd.nomatch') - asm.origin
+        self.assertEqual(asm.bytes[nomatch:nomatch + 3], [0x4C, sym('other') & 0xFF, sym('other') >> 8])
+
+    def test_sparse_dispatch_falls_through(self):
+        asm = self.assemble(".org $1000\n.dispatch keys\n    0, one\n    $80, two\n    $FF, three\n.end\n"
+                            "after: rts\none: rts\ntwo: rts\nthree: rts\n")
+        report = asm.compiler.dispatches[0]
+        self.assertEqual(report.layout.kind, 'sparse')
+        sym = asm.symbols.get
+        self.assertEqual(self.target(asm, 'keys', 0x80), sym('two'))
+        self.assertEqual(self.target(asm, 'keys', 0xFF), sym('three'))
+        # No default: unknown keys carry on after the tables
+        self.assertEqual(self.target(asm, 'keys', 0x10), sym('after'))
+        self.assertEqual(sym('keys.end'), sym('after'))
+
+    def test_report(self):
+        keys = "".join(f"    {k}, h\n" for k in range(10, 20))
+        asm = self.assemble(f".org $1000\n.dispatch d\n{keys}.end\nh: rts\n")
+        report = asm.compiler.dispatches[0]
+        self.assertEqual((report.cycles, report.chain), (30, 41))
+        self.assertIn("11 saved", report.format())
+
+    def test_page_crossing_tables_cost_more(self):
+        keys = "".join(f"    {k}, h\n" for k in range(10, 20))
+        asm = self.assemble(f".org $10E0\n.dispatch d\n{keys}.end\nh: rts\n")
+        self.assertEqual(asm.compiler.dispatches[0].cycles, 31)
+
+    def test_errors(self):
+        with self.assertRaises(CompilerError):
+            self.assemble(".dispatch d\n    1, h\n    1, h\n.end\nh: rts\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".dispatch d\n    KEY, h\n.end\nh: rts\nKEY = 1\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".dispatch d\n    1, missing\n.end\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 
 import unittest
 import os
+import tempfile
+from io import StringIO
 from lib.asm import Assembler, AssemblyError, Tokenizer
-from lib.parser import Parser
+from lib.parser import Parser, ParserError
+from lib.compiler import CompilerError
 
 class TestInclude(unittest.TestCase):
     def setUp(self):
@@ -66,5 +69,55 @@ class TestInclude(unittest.TestCase):
             self.assemble_file("include_missing.asm")
         self.assertIn("Include file not found", str(cm.exception))
 
+class TestIncbin(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.blob = bytes(range(256)) * 16
+        self.write("font.bin", self.blob)
+        self.write("empty.bin", b"")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.dir, name), "wb") as f:
+            f.write(data)
+
+    def assemble(self, code, include_paths=None):
+        asm = Assembler(include_paths=include_paths)
+        asm.assemble_stream(StringIO(code), os.path.join(self.dir, "main.asm"))
+        asm.parse()
+        return asm
+
+    def test_whole_file(self):
+        asm = self.assemble('.org $2000\n.incbin "font.bin"\nafter: rts\n')
+        self.assertEqual(bytes(asm.compiler.bytes[:-1]), self.blob)
+        self.assertEqual(asm.symbols.get("after"), 0x2000 + len(self.blob))
+
+    def test_offset_and_length(self):
+        asm = self.assemble('.incbin "font.bin", $10\n.incbin "font.bin", 300, 4\n')
+        self.assertEqual(bytes(asm.compiler.bytes), self.blob[0x10:] + self.blob[300:304])
+
+    def test_empty_file(self):
+        asm = self.assemble('.incbin "empty.bin"\nnop\n')
+        self.assertEqual(asm.bytes, [0xEA])
+
+    def test_include_paths(self):
+        sub = os.path.join(self.dir, "assets")
+        os.mkdir(sub)
+        with open(os.path.join(sub, "tile.bin"), "wb") as f:
+            f.write(b"\x01\x02")
+        asm = self.assemble('.incbin "tile.bin"\n', include_paths=[sub])
+        self.assertEqual(asm.bytes, [1, 2])
+
+    def test_errors(self):
+        with self.assertRaises(ParserError):
+            self.assemble('.incbin "missing.bin"\n')
+        with self.assertRaises(CompilerError):
+            self.assemble('.incbin "font.bin", 5000\n')
+        with self.assertRaises(CompilerError):
+            self.assemble('.incbin "font.bin", 4000, 100\n')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,191 @@
+import os
+import json
+import unittest
+import tempfile
+from io import StringIO
+from lib.asm import Assembler
+from lib.batch import BuildJob, build_job
+from lib.compiler import CompilerError
+from lib.linker import LinkError, link, parse_config
+from lib.objfile import ObjectFile
+
+MAIN = """
+.import putc
+.export main
+main:
+  ldx #0
+1:
+  lda msg,x
+  beq done
+  jsr putc
+  inx
+  bne 1b
+done:
+  rts
+.segment "rodata"
+msg: .byte "HI", 0
+"""
+
+IO = """
+.export putc, count
+count = 3
+putc:
+  sta $C0F0
+  rts
+"""
+
+CONFIG = {"memory": {"MAIN": {"start": "$2000", "size": "$100"}},
+          "segments": [{"name": "code", "memory": "MAIN"}, {"name": "rodata", "memory": "MAIN"},
+                       {"name": "bss", "memory": "MAIN", "type": "bss"}]}
+
+def compile_object(code, filename="t.asm"):
+    asm = Assembler(objects=True)
+    asm.assemble_stream(StringIO(code), filename)
+    asm.parse()
+    obj = asm.compiler.object_file()
+    obj.filename = filename
+    return obj
+
+class TestObjects(unittest.TestCase):
+    def compile(self, code):
+        return compile_object(code)
+
+    def relocations(self, obj, section="code"):
+        return [(r.offset, r.type, r.addend, r.section or r.symbol) for r in obj.sections[section].relocations]
+
+    def test_sections_and_relocations(self):
+        obj = self.compile(MAIN)
+        self.assertEqual(list(obj.sections), ['code', 'rodata'])
+        self.assertEqual(bytes(obj.sections['code'].data).hex(), "a200bd0000f0062000" "00e8d0f560")
+        self.assertEqual(self.relocations(obj), [(3, 'ABS', 0, 'rodata'), (8, 'ABS', 0, 'putc')])
+        self.assertEqual(obj.imports, ['putc'])
+        self.assertEqual([(e.name, e.value, e.section) for e in obj.exports], [('main', 0, 'code')])
+
+    def test_byte_relocations(self):
+        # < and > take their byte of the whole address at link time
+        obj = self.compile("lda #<msg\nldx #>msg\n.byte <msg, >msg\n.segment \"rodata\"\n.fill 300\nmsg: .byte 0\n")
+        self.assertEqual(self.relocations(obj), [(1, 'LOW', 300, 'rodata'), (3, 'HIGH', 300, 'rodata'),
+                                                 (4, 'LOW', 300, 'rodata'), (5, 'HIGH', 300, 'rodata')])
+        with self.assertRaises(CompilerError):
+            self.compile("lda #msg\nmsg: .byte 0\n")
+
+    def test_addresses_are_not_promoted(self):
+        # Section labels and imports may end up anywhere; constants still go to zero page
+        obj = self.compile(".import ptr\nlda ptr\nlda var\nlda $12\nvar: .byte 0\n")
+        self.assertEqual(bytes(obj.sections['code'].data).hex(), "ad0000" "ad0800" "a512" "00")
+        self.assertEqual(self.relocations(obj), [(1, 'ABS', 0, 'ptr'), (4, 'ABS', 8, 'code')])
+
+    def test_expressions(self):
+        obj = self.compile(".import table\nlda table+2,x\nsta end-1\nlen = end - start\nstart: .byte len\nend:\n")
+        self.assertEqual(self.relocations(obj), [(1, 'ABS', 2, 'table'), (4, 'ABS', 6, 'code')])
+        self.assertEqual(obj.sections['code'].data[6], 1)
+        with self.assertRaises(CompilerError):
+            self.compile("one: nop\n.segment \"data\"\ntwo: nop\nlda one - two\n")
+
+    def test_branches(self):
+        # Within a section nothing is relocated; out of it the linker works out the offset
+        obj = self.compile(".import far\nloop: bne loop\nbeq far\n")
+        self.assertEqual(self.relocations(obj), [(3, 'REL', 0, 'far')])
+
+    def test_alignment(self):
+        obj = self.compile("nop\n.hot\nloop: dex\nbne loop\n.endhot\n.segment \"data\"\n.align 4\n.byte 1\n")
+        self.assertEqual(obj.sections['code'].align, 256)
+        self.assertEqual(obj.sections['data'].align, 4)
+
+    def test_errors(self):
+        for code in (".org $2000\nnop\n", "a: nop\nlda (a),y\n", ".import far\njml far\n",
+                     ".dispatch d, x\n    1, x\n.end\nx: rts\n", ".import a\na: nop\n"):
+            with self.subTest(code=code), self.assertRaises(CompilerError):
+                self.compile(code)
+        asm = Assembler()
+        asm.assemble_stream(StringIO(".segment \"data\"\n"), "t.asm")
+        with self.assertRaises(CompilerError):
+            asm.parse()
+
+    def test_save_and_load(self):
+        obj = self.compile(MAIN)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "main.o65")
+            obj.save(path)
+            loaded = ObjectFile.load(path)
+        self.assertEqual(loaded.sections, obj.sections)
+        self.assertEqual(loaded.exports, obj.exports)
+        self.assertEqual(loaded.imports, obj.imports)
+
+class TestLinker(unittest.TestCase):
+    def compile(self, code, filename):
+        return compile_object(code, filename)
+
+    def test_link(self):
+        result = link([self.compile(MAIN, "main.asm"), self.compile(IO, "io.asm")], parse_config(CONFIG))
+        self.assertEqual(result.origin, 0x2000)
+        # Code of both modules, then rodata
+        self.assertEqual(result.symbols['main'], (0x2000, 'main.asm'))
+        self.assertEqual(result.symbols['putc'], (0x200E, 'io.asm'))
+        self.assertEqual(result.symbols['count'], (3, 'io.asm'))
+        self.assertEqual(bytes(result.image).hex(),
+                         "a200bd1220f006200e20e8d0f560" "8df0c060" "484900")
+        self.assertIn("rodata", result.format_map())
+
+    def test_cross_module_branch(self):
+        far = self.compile(".import putc\nbeq putc\n", "b.asm")
+        result = link([far, self.compile(IO, "io.asm")], parse_config(CONFIG))
+        self.assertEqual(result.image[:2], bytes([0xF0, 0x00]))
+        padded = self.compile(".import putc\nbeq putc\n.fill 200\n", "b.asm")
+        with self.assertRaises(LinkError):
+            link([padded, self.compile(IO, "io.asm")], parse_config(CONFIG))
+
+    def test_aligned_section(self):
+        tables = self.compile(".segment \"rodata\"\n.align 256\nt: .byte 1\n", "t.asm")
+        config = dict(CONFIG, memory={"MAIN": {"start": "$2000", "size": "$400"}})
+        result = link([self.compile(IO, "io.asm"), tables], parse_config(config))
+        self.assertEqual([(p.segment, p.start) for p in result.placements], [('code', 0x2000), ('rodata', 0x2100)])
+
+    def test_bss(self):
+        objects = [self.compile(IO, "io.asm"), self.compile(".segment \"bss\"\nbuf: .fill 16\n.export buf\n", "b.asm")]
+        result = link(objects, parse_config(CONFIG))
+        self.assertEqual(len(result.image), 4)
+        self.assertEqual(result.symbols['buf'][0], 0x2004)
+
+    def test_errors(self):
+        main, io = self.compile(MAIN, "main.asm"), self.compile(IO, "io.asm")
+        cases = [
+            [main], # unresolved putc
+            [main, io, self.compile(".export putc\nputc: rts\n", "dup.asm")],
+            [main, io, self.compile(".fill 256\n", "big.asm")],
+            [main, io, self.compile(".segment \"zp\"\nnop\n", "zp.asm")],
+        ]
+        for objects in cases:
+            with self.subTest(files=[o.filename for o in objects]), self.assertRaises(LinkError):
+                link(objects, parse_config(CONFIG))
+
+class TestCommandLine(unittest.TestCase):
+    def test_compile_and_link(self):
+        import asm65
+        import link65
+        from contextlib import redirect_stdout
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {}
+            for name, text in (("main.asm", MAIN), ("io.asm", IO)):
+                paths[name] = os.path.join(tmp, name)
+                with open(paths[name], "w") as f:
+                    f.write(text)
+            config = os.path.join(tmp, "apple2.json")
+            with open(config, "w") as f:
+                json.dump(CONFIG, f)
+            out = os.path.join(tmp, "prog.bin")
+            with redirect_stdout(StringIO()):
+                asm65.main(["-c", paths["main.asm"]])
+                asm65.main(["-c", paths["io.asm"], "-o", os.path.join(tmp, "io.o65")])
+                link65.main([os.path.join(tmp, "main.o65"), os.path.join(tmp, "io.o65"), out, "-C", config])
+            with open(out, "rb") as f:
+                self.assertEqual(f.read().hex(), "a200bd1220f006200e20e8d0f5608df0c060484900")
+
+            job = BuildJob("io", [paths["io.asm"]], os.path.join(tmp, "job.o65"), format="o65")
+            result = build_job(job)
+            self.assertIsNone(result.error)
+            self.assertEqual(result.size, 4)
+            self.assertEqual(ObjectFile.load(job.output).imports, [])
+
+if __name__ == '__main__':
+    unittest.main()
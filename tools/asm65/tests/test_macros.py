@@ -0,0 +1,97 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.ast import MacroCall, Repeat
+from lib.parser import ParserError
+from lib.stats import BuildStats, count_statements
+
+STORE = ".macro store value, addr\n    lda #value\n    sta addr\n.endm\n"
+
+class TestMacros(unittest.TestCase):
+    def assemble(self, code, stats=None, defines=None):
+        asm = Assembler(stats=stats)
+        for name in defines or []:
+            asm.define(name)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_parameters(self):
+        asm = self.assemble(STORE + ".org $1000\nstore 1, $20\nstore >buf, buf\nbuf: .byte 0\n")
+        self.assertEqual(asm.bytes[:4], [0xA9, 0x01, 0x85, 0x20])
+        self.assertEqual(asm.bytes[4:9], [0xA9, 0x10, 0x8D, 0x09, 0x10])
+
+    def test_indirect_argument(self):
+        # Commas inside parentheses do not split arguments
+        asm = self.assemble(".macro load operand, ptr\n    lda operand\n    lda (ptr),y\n.endm\nload ($20,x), $30\n")
+        self.assertEqual(asm.bytes, [0xA1, 0x20, 0xB1, 0x30])
+
+    def test_expansions_are_memoized(self):
+        stats = BuildStats()
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO(STORE + "store 1, $20\nstore 1, $20\nstore 2, $20\n"))
+        program = asm.parse_program()
+        calls = [s for s in program.statements if isinstance(s, MacroCall)]
+        self.assertIs(calls[0].statements, calls[1].statements)
+        self.assertIsNot(calls[0].statements, calls[2].statements)
+        self.assertEqual((stats.counts['macro_calls'], stats.counts['macro_expansions']), (3, 2))
+
+    def test_local_labels(self):
+        code = ".org $1000\n.macro wait n\n    .local loop\n    ldx #n\nloop: dex\n    bne loop\n.endm\nwait 1\nwait 1\n"
+        asm = self.assemble(code)
+        self.assertEqual(asm.bytes, [0xA2, 0x01, 0xCA, 0xD0, 0xFD] * 2)
+        self.assertNotIn('loop', asm.symbols)
+
+    def test_nested_macros(self):
+        asm = self.assemble(STORE + ".macro clear addr\n    store 0, addr\n.endm\nclear $30\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x00, 0x85, 0x30])
+
+    def test_conditionals_in_body(self):
+        code = ".macro trace\n.ifdef DEBUG\n    brk\n.else\n    nop\n.endif\n.endm\ntrace\n"
+        self.assertEqual(self.assemble(code, defines=['DEBUG']).bytes, [0x00])
+        self.assertEqual(self.assemble(code).bytes, [0xEA])
+
+    def test_errors(self):
+        for code in (STORE + "store 1\n",
+                     ".macro r\n    r\n.endm\nr\n",
+                     ".local x\n",
+                     ".endr\n",
+                     ".macro open\n    nop\n",
+                     ".rept 2\n    nop\n"):
+            with self.assertRaises(ParserError, msg=code):
+                self.assemble(code)
+
+class TestRept(unittest.TestCase):
+    def assemble(self, code, stats=None):
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_counter(self):
+        asm = self.assemble(".rept 3, i\n    lda $2000+i\n.endr\n")
+        self.assertEqual(asm.bytes, [0xAD, 0x00, 0x20, 0xAD, 0x01, 0x20, 0xAD, 0x02, 0x20])
+
+    def test_body_is_not_copied(self):
+        stats = BuildStats()
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO("COUNT = 256\n.rept COUNT, i\n    lda $2000+i,x\n    sta $4000+i,x\n.endr\n"))
+        program = asm.parse_program()
+        self.assertEqual(count_statements(program.statements), 4)
+        repeat = program.statements[1]
+        self.assertIsInstance(repeat, Repeat)
+        asm.compile(program)
+        self.assertEqual(len(asm.bytes), 256 * 6)
+        self.assertEqual(asm.bytes[-6:], [0xBD, 0xFF, 0x20, 0x9D, 0xFF, 0x40])
+        self.assertEqual(stats.counts['rept_iterations'], 256)
+
+    def test_local_and_numeric_labels(self):
+        asm = self.assemble(".org $1000\n.rept 2\n    .local skip\n    beq skip\n1:  dex\n    bne 1b\nskip:\n.endr\n")
+        self.assertEqual(asm.bytes, [0xF0, 0x03, 0xCA, 0xD0, 0xFD] * 2)
+
+    def test_nested(self):
+        asm = self.assemble(".rept 2\n.rept 3\n    nop\n.endr\n    rts\n.endr\n")
+        self.assertEqual(asm.bytes, [0xEA, 0xEA, 0xEA, 0x60] * 2)
+
+if __name__ == '__main__':
+    unittest.main()
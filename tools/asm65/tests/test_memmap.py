@@ -0,0 +1,114 @@
+import os
+import json
+import unittest
+import tempfile
+from io import StringIO
+from lib.asm import Assembler
+from lib.linker import LinkError, link, parse_config
+from lib.memmap import MemoryMap, MemoryMapError, Region, preset
+
+def compile_object(code, filename="t.asm"):
+    asm = Assembler(objects=True)
+    asm.assemble_stream(StringIO(code), filename)
+    asm.parse()
+    obj = asm.compiler.object_file()
+    obj.filename = filename
+    return obj
+
+def sized(size):
+    return lambda start: start + size
+
+class TestMemoryMap(unittest.TestCase):
+    def test_free_regions(self):
+        memory = MemoryMap([Region("MAIN", 0x0800, 0x9600)], [preset("hires1"), Region("buf", 0x9000, 0x9100)])
+        self.assertEqual(memory.free_regions(), [(0x0800, 0x2000, "MAIN"), (0x4000, 0x9000, "MAIN"),
+                                                 (0x9100, 0x9600, "MAIN")])
+
+    def test_first_fit(self):
+        memory = MemoryMap([Region("MAIN", 0x1F00, 0x6000)], [preset("hires1")])
+        self.assertEqual(memory.allocate("code", sized(0x80)), (0x1F00, 0x1F80, "MAIN"))
+        # Too big for what is left below $2000, so it goes above hi-res page 1
+        self.assertEqual(memory.allocate("tables", sized(0x100)), (0x4000, 0x4100, "MAIN"))
+        # ...and a small one still fills the hole
+        self.assertEqual(memory.allocate("data", sized(0x10), align=16), (0x1F80, 0x1F90, "MAIN"))
+        self.assertEqual(memory.free_regions(), [(0x1F90, 0x2000, "MAIN"), (0x4100, 0x6000, "MAIN")])
+        self.assertIn("Free memory: 8048 bytes in 2 block(s)", memory.format_free())
+
+    def test_fixed_start(self):
+        memory = MemoryMap([Region("MAIN", 0x0800, 0x9600)], [preset("hires1")])
+        self.assertEqual(memory.allocate("code", sized(0x100), start=0x6000), (0x6000, 0x6100, "MAIN"))
+        for start in (0x1F80, 0x6080, 0x0700):
+            with self.subTest(start=start), self.assertRaises(MemoryMapError):
+                memory.allocate("more", sized(0x100), start=start)
+
+    def test_errors(self):
+        with self.assertRaises(MemoryMapError):
+            MemoryMap([Region("A", 0x0800, 0x2000), Region("B", 0x1000, 0x3000)])
+        with self.assertRaises(MemoryMapError):
+            preset("hires3")
+        memory = MemoryMap([Region("MAIN", 0x0800, 0x1000)])
+        with self.assertRaises(MemoryMapError):
+            memory.allocate("big", sized(0x900))
+
+class TestPlacement(unittest.TestCase):
+    CONFIG = {"memory": {"MAIN": {"start": "$1F00", "end": "$5FFF"}, "LC": {"start": "$D000", "size": "$1000"}},
+              "forbid": ["hires1", {"name": "buffer", "start": "$5000", "end": "$5FFF"}],
+              "segments": [{"name": "code", "memory": "MAIN"}, {"name": "tables", "align": 256},
+                           {"name": "data"}, {"name": "high", "memory": "LC"}, {"name": "bss", "type": "bss"}]}
+
+    def test_scattered_segments(self):
+        obj = compile_object("main: jmp far\n.fill $F0\n"
+                             ".segment \"tables\"\nfar: rts\n.fill $7F\n"
+                             ".segment \"data\"\nmsg: .word main\n"
+                             ".segment \"high\"\nlc: .byte 1\n")
+        result = link([obj], parse_config(self.CONFIG))
+        self.assertEqual([(p.segment, p.start, p.size) for p in result.placements],
+                         [('code', 0x1F00, 0xF3), ('data', 0x1FF3, 2), ('tables', 0x4000, 0x80), ('high', 0xD000, 1)])
+        # Code and data load together; hi-res page 1 and the gap to $D000 are skipped
+        self.assertEqual([(start, len(data)) for start, data in result.chunks],
+                         [(0x1F00, 0xF5), (0x4000, 0x80), (0xD000, 1)])
+        self.assertEqual(result.chunks[0][1][:3], bytes([0x4C, 0x00, 0x40]))
+        self.assertEqual(result.chunks[0][1][0xF3:], bytes([0x00, 0x1F]))
+        self.assertEqual(result.symbols['__tables_start__'][0], 0x4000)
+        self.assertEqual(result.symbols['__tables_size__'][0], 0x80)
+        with self.assertRaises(LinkError):
+            result.image
+        report = result.format_map()
+        self.assertIn("buffer       $5000-$5FFF", report)
+        self.assertIn("Free memory: 8074 bytes in 3 block(s)", report)
+
+    def test_segment_bounds_can_be_imported(self):
+        obj = compile_object(".import __bss_end__\nlda #>__bss_end__\n.segment \"bss\"\n.fill 16\n")
+        result = link([obj], parse_config(self.CONFIG))
+        self.assertEqual(result.symbols['__bss_end__'][0], 0x1F12)
+        self.assertEqual(result.image, bytes([0xA9, 0x1F]))
+
+    def test_no_room(self):
+        obj = compile_object(".segment \"tables\"\n.fill $1200\n")
+        with self.assertRaises(LinkError):
+            link([obj], parse_config(self.CONFIG))
+        fixed = dict(self.CONFIG, segments=[{"name": "code", "start": "$3F00"}])
+        with self.assertRaises(LinkError):
+            link([compile_object("nop\n")], parse_config(fixed))
+
+    def test_command_line(self):
+        import asm65
+        from contextlib import redirect_stdout
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "prog.asm")
+            with open(source, "w") as f:
+                f.write("lda msg\n.fill $FD\n.segment \"tables\"\nmsg: .byte 7\n")
+            config = os.path.join(tmp, "memory.json")
+            with open(config, "w") as f:
+                json.dump(self.CONFIG, f)
+            out = os.path.join(tmp, "prog.bin")
+            with redirect_stdout(StringIO()) as printed:
+                asm65.main([source, out, "-C", config, "--map"])
+            self.assertIn("Free memory", printed.getvalue())
+            with open(out, "rb") as f:
+                self.assertEqual(f.read()[:3], bytes([0xAD, 0x00, 0x40]))
+            with open(os.path.join(tmp, "prog-4000.bin"), "rb") as f:
+                self.assertEqual(f.read(), bytes([7]))
+
+if __name__ == '__main__':
+    unittest.main()
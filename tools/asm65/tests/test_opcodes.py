@@ -1,5 +1,7 @@
 import unittest
-from lib.opcodes import OPCODES
+import pickle
+from lib import opcodes
+from lib.opcodes import OPCODES, OPCODES_6502, opcode_table
 
 class TestOpcodes(unittest.TestCase):
     def test_structure(self):
@@ -21,6 +23,29 @@ class TestOpcodes(unittest.TestCase):
         self.assertIn("JMP", OPCODES)
         self.assertIn("ABS", OPCODES["JMP"])
         self.assertEqual(OPCODES["JMP"]["ABS"], 0x4C)
-        
+
+    def test_tables_are_read_only(self):
+        with self.assertRaises(TypeError):
+            OPCODES["LDA"]["#"] = 0
+        with self.assertRaises(TypeError):
+            OPCODES["FOO"] = {}
+        with self.assertRaises(TypeError):
+            OPCODES["LDA"].update({'IND': 0xB2})
+
+    def test_65c02_table_built_on_demand(self):
+        table = opcode_table("65c02")
+        self.assertIs(opcode_table("65c02"), table)
+        self.assertIs(opcodes.OPCODES_65C02, table)
+        self.assertEqual(table["BIT"]["#"], 0x89)
+        self.assertEqual(table["BIT"]["ZP"], 0x24)
+        # The 6502 table is untouched and unchanged modes are shared
+        self.assertNotIn("IND", OPCODES_6502["LDA"])
+        self.assertIs(table["TAX"], OPCODES_6502["TAX"])
+
+    def test_tables_pickle(self):
+        table = pickle.loads(pickle.dumps(opcode_table("65c02")))
+        self.assertEqual(table, opcode_table("65c02"))
+        self.assertEqual(table["STZ"]["ABS"], 0x9C)
+
 if __name__ == '__main__':
     unittest.main()
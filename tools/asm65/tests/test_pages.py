@@ -0,0 +1,96 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.cycles import data_tables, page_diagnostics
+from lib.parser import ParserError
+
+class TestPageBlocks(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler(listing=True)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return asm
+
+    def test_hot_block_padded_with_nops(self):
+        asm = self.assemble(".org $10FE\nnop\n.hot\nloop: dex\nbne loop\n.endhot\nrts\n")
+        # The 3-byte loop would cross $1100 from $10FF, so one NOP moves it to $1100
+        self.assertEqual(asm.symbols.get('loop'), 0x1100)
+        self.assertEqual(asm.bytes, [0xEA, 0xEA, 0xCA, 0xD0, 0xFD, 0x60])
+        self.assertEqual(asm.compiler.warnings, [])
+
+    def test_no_padding_when_block_fits(self):
+        asm = self.assemble(".org $10F0\n.hot\nloop: dex\nbne loop\n.endhot\n")
+        self.assertEqual(asm.symbols.get('loop'), 0x10F0)
+        self.assertEqual(len(asm.bytes), 3)
+
+    def test_table_aligned_padded_with_zero(self):
+        asm = self.assemble(".org $20F0\nlda table,x\n.table_aligned\ntable: .fill 32, $FF\n.endtable\nafter: rts\n")
+        self.assertEqual(asm.symbols.get('table'), 0x2100)
+        self.assertEqual(asm.symbols.get('after'), 0x2120)
+        self.assertEqual(asm.bytes[3:16], [0] * 13)
+        # The operand was resolved against the padded address
+        self.assertEqual(asm.bytes[:3], [0xBD, 0x00, 0x21])
+
+    def test_local_labels_inside_block(self):
+        asm = self.assemble(".org $10FE\n.hot\n1: dex\nbne 1b\n.endhot\n1: jmp 1b\n")
+        self.assertEqual(asm.bytes[2:], [0xCA, 0xD0, 0xFD, 0x4C, 0x03, 0x11])
+
+    def test_rept_local_inside_block(self):
+        # The trial layout must not use up the .local serials of the real one
+        asm = self.assemble(".org $10F0\n.fill 12\n.hot\n.rept 2\n.local top\ntop: dex\nbne top\n.endr\n.endhot\n")
+        self.assertEqual(asm.bytes[12:], [0xEA] * 4 + [0xCA, 0xD0, 0xFD] * 2)
+
+    def test_rept_pads_each_copy(self):
+        # Each iteration of the same .hot node gets its own padding
+        code = (".org $10FC\n.rept 2\n.hot\n1: dex\nnop\nnop\nnop\nnop\nbne 1b\n.endhot\n.fill 200\n.endr\n"
+                "end: jmp end\n")
+        asm = self.assemble(code)
+        self.assertEqual(asm.bytes[:5], [0xEA] * 4 + [0xCA])
+        self.assertEqual(asm.symbols.get('end'), 0x129E)
+        self.assertEqual(asm.bytes[-3:], [0x4C, 0x9E, 0x12])
+        self.assertEqual(asm.compiler.warnings, [])
+
+    def test_oversized_block_warns(self):
+        asm = self.assemble(".org $1000\n.table_aligned\n.fill 300\n.endtable\n")
+        self.assertEqual(len(asm.bytes), 300)
+        self.assertEqual(len(asm.compiler.warnings), 1)
+        self.assertIn("more than a page", asm.compiler.warnings[0])
+
+    def test_unterminated_block(self):
+        with self.assertRaises(ParserError):
+            self.assemble(".hot\nnop\n")
+
+class TestPageDiagnostics(unittest.TestCase):
+    def diagnostics(self, code):
+        asm = Assembler(listing=True)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        c = asm.compiler
+        return page_diagnostics(c.listing, c.listing_labels, c.listing_data)
+
+    def test_branch_crossing(self):
+        messages = self.diagnostics(".org $10F8\nloop: dex\n.fill 8, $EA\nbne loop\n")
+        self.assertEqual(len(messages), 1)
+        self.assertIn("loop branch BNE at $1101", messages[0])
+        self.assertTrue(messages[0].startswith("t.asm:4: "))
+
+    def test_straddling_table(self):
+        messages = self.diagnostics(
+            ".org $1000\nlda table,x\nlda table+1,y\nlda other,x\nrts\n"
+            ".org $10F0\ntable: .fill 32\nother: .fill 8\n")
+        self.assertEqual(len(messages), 2)
+        self.assertIn("indexes 'table' ($10F0-$110F)", messages[0])
+        self.assertIn("LDA $10F1,Y", messages[1])
+
+    def test_aligned_block_silences_diagnostic(self):
+        messages = self.diagnostics(
+            ".org $1000\nlda table,x\nrts\n"
+            ".org $10F0\n.table_aligned\ntable: .fill 32\n.endtable\n")
+        self.assertEqual(messages, [])
+
+    def test_data_tables(self):
+        tables = data_tables({0x10: ['a'], 0x14: ['b'], 0x40: ['code']}, [(0x10, 0x12), (0x12, 0x20)])
+        self.assertEqual([(t.name, t.start, t.end) for t in tables], [('a', 0x10, 0x14), ('b', 0x14, 0x20)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.peephole import RULES
+
+class TestPeephole(unittest.TestCase):
+    def assemble(self, code, rules=None):
+        asm = Assembler(optimize=list(RULES) if rules is None else rules)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def rules_applied(self, asm):
+        return [c.rule for c in asm.optimization.changes]
+
+    def test_jsr_rts(self):
+        asm = self.assemble(".org $1000\nmain: jsr sub\nrts\nsub: rts\n")
+        self.assertEqual(asm.bytes, [0x4C, 0x03, 0x10, 0x60])
+        change = asm.optimization.changes[0]
+        self.assertEqual((change.rule, change.routine, change.bytes, change.cycles), ('jsr-rts', 'main', 1, 9))
+
+    def test_label_between_is_a_barrier(self):
+        asm = self.assemble(".org $1000\njsr sub\nentry: rts\nsub: rts\n")
+        self.assertEqual(asm.bytes, [0x20, 0x04, 0x10, 0x60, 0x60])
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_sta_lda(self):
+        asm = self.assemble(".org $1000\nsta $2000\nlda $2000\nldx #1\nrts\n")
+        self.assertEqual(asm.bytes, [0x8D, 0x00, 0x20, 0xA2, 0x01, 0x60])
+
+    def test_sta_lda_keeps_flags_and_io(self):
+        # The load sets Z for the branch; the second pair reads a soft switch
+        asm = self.assemble(".org $1000\n1: sta $2000\nlda $2000\nbne 1b\nsta $C054\nlda $C054\nldx #0\nrts\n")
+        self.assertEqual(len(asm.bytes), 17)
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_clc_adc0(self):
+        asm = self.assemble(".org $1000\nlda #1\nclc\nadc #0\nsec\nsbc #0\nclv\nclc\nlda #2\nrts\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x01, 0xB8, 0x18, 0xA9, 0x02, 0x60])
+        self.assertEqual(self.rules_applied(asm), ['clc-adc0', 'clc-adc0'])
+
+    def test_clc_adc0_carry_used(self):
+        asm = self.assemble(".org $1000\nclc\nadc #0\nrol a\nrts\n")
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_branch_to_jmp(self):
+        asm = self.assemble(".org $1000\nloop: dex\nbne hop\njmp hop\nhop: jmp loop\n")
+        self.assertEqual(asm.bytes, [0xCA, 0xD0, 0xFD, 0x4C, 0x00, 0x10, 0x4C, 0x00, 0x10])
+        self.assertEqual(self.rules_applied(asm), ['branch-jmp', 'branch-jmp'])
+
+    def test_branch_out_of_range_not_retargeted(self):
+        asm = self.assemble(".org $1000\nfar: nop\n.fill 200, $EA\nbne hop\nrts\nhop: jmp far\n")
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_jump_cycle_left_alone(self):
+        asm = self.assemble(".org $1000\njmp one\none: jmp two\ntwo: jmp one\n")
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_dead_store(self):
+        asm = self.assemble(".org $1000\nsta $2000\nlda #1\nsta $2001\nstx $2000\nrts\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x01, 0x8D, 0x01, 0x20, 0x8E, 0x00, 0x20, 0x60])
+
+    def test_dead_store_read_or_indexed_between(self):
+        asm = self.assemble(".org $1000\nsta $2000\nldx $2000\nsta $2000\nsta $2001\nldx $1F00,y\nsta $2001\nrts\n")
+        self.assertNotIn('dead-store', self.rules_applied(asm))
+
+    def test_rules_selected_one_by_one(self):
+        code = ".org $1000\njsr sub\nrts\nsub: clc\nadc #0\nclv\nclc\nlda #1\nrts\n"
+        asm = self.assemble(code, rules=['clc-adc0'])
+        self.assertEqual(asm.bytes, [0x20, 0x04, 0x10, 0x60, 0xB8, 0x18, 0xA9, 0x01, 0x60])
+        with self.assertRaises(ValueError):
+            self.assemble(code, rules=['no-such-rule'])
+
+    def test_conditional_blocks(self):
+        asm = Assembler(optimize=list(RULES))
+        asm.define('FAST')
+        asm.assemble_stream(StringIO(".org $1000\n.ifdef FAST\njsr sub\nrts\n.else\njsr sub\nrts\n.endif\nsub: rts\n"))
+        asm.parse()
+        self.assertEqual(asm.bytes, [0x4C, 0x03, 0x10, 0x60])
+        self.assertEqual(len(asm.optimization.changes), 1)
+
+    def test_report(self):
+        asm = self.assemble(".org $1000\nmain: jsr sub\nrts\nsub: sta $2000\nlda $2000\nldy #0\nrts\n")
+        text = asm.optimization.format(details=True)
+        self.assertIn("2 change(s), 4 bytes and 13 cycles saved", text)
+        self.assertIn("t.asm:4: [sta-lda]", text)
+        self.assertEqual(list(asm.optimization.by_routine()), ['main', 'sub'])
+
+class TestPeephole65C02(unittest.TestCase):
+    def assemble(self, code, cpu="65c02"):
+        asm = Assembler(optimize=list(RULES))
+        asm.assemble_stream(StringIO(f'.cpu "{cpu}"\n.org $1000\n' + code), "t.asm")
+        asm.parse()
+        return asm
+
+    def rules_applied(self, asm):
+        return [c.rule for c in asm.optimization.changes]
+
+    def test_stz(self):
+        asm = self.assemble("lda #0\nsta $2000\nsta $80,x\nlda #1\nrts\n")
+        self.assertEqual(asm.bytes, [0x9C, 0x00, 0x20, 0x74, 0x80, 0xA9, 0x01, 0x60])
+        self.assertEqual(asm.optimization.changes[0].bytes, 2)
+
+    def test_stz_keeps_live_accumulator(self):
+        asm = self.assemble("lda #0\nsta $2000\ntax\nrts\n")
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_not_applied_on_6502(self):
+        asm = self.assemble("lda #0\nsta $2000\nlda #1\ntxa\npha\nlda #2\nrts\n", cpu="6502")
+        self.assertEqual(asm.optimization.changes, [])
+
+    def test_applied_on_65c02_supersets(self):
+        for cpu in ("r65c02", "w65c02"):
+            with self.subTest(cpu=cpu):
+                asm = self.assemble("lda #0\nsta $2000\nlda #1\nloop: dex\njmp loop\n", cpu=cpu)
+                self.assertEqual(asm.bytes, [0x9C, 0x00, 0x20, 0xA9, 0x01, 0xCA, 0x80, 0xFD])
+
+    def test_push_pull(self):
+        asm = self.assemble("tya\npha\nlda #1\npla\ntax\nlda #2\nrts\n")
+        self.assertEqual(asm.bytes, [0x5A, 0xA9, 0x01, 0xFA, 0xA9, 0x02, 0x60])
+        self.assertEqual([c.cycles for c in asm.optimization.changes], [2, 2])
+
+    def test_indy_zero(self):
+        asm = self.assemble("ldy #0\nlda ($80),y\nsta ($82),y\nldy #5\nrts\n")
+        self.assertEqual(asm.bytes, [0xB2, 0x80, 0x92, 0x82, 0xA0, 0x05, 0x60])
+        self.assertEqual(asm.optimization.bytes, 2)
+
+    def test_indy_zero_keeps_ldy_while_y_used(self):
+        asm = self.assemble("ldy #0\nlda ($80),y\nsta ($82),y\niny\nrts\n")
+        # Only the store gains anything while the LDY has to stay
+        self.assertEqual(asm.bytes, [0xA0, 0x00, 0xB1, 0x80, 0x92, 0x82, 0xC8, 0x60])
+
+    def test_jmp_bra(self):
+        asm = self.assemble("loop: dex\njmp loop\n")
+        self.assertEqual(asm.bytes, [0xCA, 0x80, 0xFD])
+
+    def test_jmp_bra_range_and_page(self):
+        asm = self.assemble("far: nop\n.fill 200, $EA\njmp far\n.org $10FC\njmp next\nnop\n.org $1100\nnext: rts\n")
+        self.assertNotIn('jmp-bra', self.rules_applied(asm))
+
+    def test_report_per_routine(self):
+        asm = self.assemble("first: lda #0\nsta $2000\nlda #1\nrts\nsecond: txa\npha\nlda #2\nrts\n")
+        self.assertEqual(asm.optimization.by_routine(), {'first': (1, 2, 2), 'second': (1, 1, 2)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.opcodes import Cycles, cycle_table, opcode_table
+
+class TestRockwellBits(unittest.TestCase):
+    def assemble(self, code, cpu='r65c02'):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(f'.cpu "{cpu}"\n.org $1000\n' + code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_set_and_reset(self):
+        asm = self.assemble("rmb0 $10\nrmb7 $10\nsmb0 $10\nsmb7 flags\nflags = $FE\n")
+        self.assertEqual(asm.bytes, [0x07, 0x10, 0x77, 0x10, 0x87, 0x10, 0xF7, 0xFE])
+
+    def test_branch_on_bit(self):
+        asm = self.assemble("wait: bbr3 $10, wait\nbbs7 $20, done\nnop\ndone: rts\n")
+        # The offset counts from the end of the three-byte instruction
+        self.assertEqual(asm.bytes, [0x3F, 0x10, 0xFD, 0xFF, 0x20, 0x01, 0xEA, 0x60])
+
+    def test_branch_errors(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("bbr0 $1234, x1\nx1: rts\n")
+        with self.assertRaises(CompilerError):
+            self.assemble("bbr0 $10, far\n.fill 200\nfar: rts\n")
+
+    def test_wdc_only_instructions(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("wai\n")
+        self.assertEqual(self.assemble("wai\nstp\nsmb1 $00\n", cpu='w65c02').bytes, [0xCB, 0xDB, 0x97, 0x00])
+
+    def test_not_in_65c02(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("rmb0 $10\n", cpu='65c02')
+        self.assertNotIn('RMB0', opcode_table('65c02'))
+
+    def test_cycles(self):
+        t = cycle_table('w65c02')
+        self.assertEqual(t['BBR0']['ZPREL'], Cycles(5, branch=True))
+        self.assertEqual(t['SMB5']['ZP'], Cycles(5))
+        self.assertEqual(t['WAI']['IMP'].base, 3)
+        # Everything else times as on the 65C02
+        self.assertEqual(t['LSR']['ABSX'], Cycles(6, page=True))
+
+if __name__ == '__main__':
+    unittest.main()
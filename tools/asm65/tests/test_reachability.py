@@ -0,0 +1,76 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.reachability import split_routines
+
+class TestStripUnreferenced(unittest.TestCase):
+    def assemble(self, code, entries=None):
+        asm = Assembler(strip=True, entries=entries)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def removed(self, asm):
+        return [r.name for r in asm.stripped.removed]
+
+    def test_unused_routine_removed(self):
+        asm = self.assemble(".org $1000\nmain: jsr used\nrts\nused: rts\nunused: lda #1\nrts\nafter: rts\n")
+        self.assertEqual(self.removed(asm), ['unused', 'after'])
+        self.assertEqual(asm.stripped.bytes, 4)
+        self.assertEqual(asm.bytes, [0x20, 0x04, 0x10, 0x60, 0x60])
+
+    def test_fall_through_keeps_next_routine(self):
+        asm = self.assemble(".org $1000\nmain: ldx #1\nnext: dex\nbne next\nrts\ndead: rts\n")
+        self.assertEqual(self.removed(asm), ['dead'])
+        self.assertIsNotNone(asm.symbols.get('next'))
+
+    def test_word_tables_and_operands_are_references(self):
+        asm = self.assemble(
+            ".org $1000\n"
+            "main: ldx #0\n"
+            "jmp (table)\n"
+            "table: .word handler_a, handler_b\n"
+            "handler_a: rts\n"
+            "handler_b: lda msg\n"
+            "rts\n"
+            "msg: .asciiz \"HI\"\n"
+            "other: .asciiz \"NO\"\n")
+        self.assertEqual(self.removed(asm), ['other'])
+
+    def test_adjacent_data_kept_together(self):
+        # Fields of a parameter block are addressed from its first label
+        asm = self.assemble(".org $1000\nmain: lda block+1\nrts\nblock: .byte 1\nfield: .byte 2\nlast: .word 3\n")
+        self.assertEqual(self.removed(asm), [])
+        self.assertEqual(len(asm.bytes), 8)
+
+    def test_field_references_keep_instances(self):
+        asm = self.assemble(".struct S\n    a\n    b, 2\n.end\n.org $1000\nmain: lda used.b.hi,x\nrts\n"
+                            "used: .soa used, S, 4\nother: rts\nunused: .aos unused, S, 4\n")
+        self.assertEqual(self.removed(asm), ['other', 'unused'])
+
+    def test_entries_and_exports(self):
+        code = ".org $1000\nfirst: rts\nsecond: rts\nthird: rts\n.export third\n"
+        asm = self.assemble(code, entries=['second'])
+        self.assertEqual(self.removed(asm), ['first'])
+        self.assertEqual(asm.symbols.get('second'), 0x1000)
+
+    def test_symbols_and_layout_directives_survive(self):
+        asm = self.assemble(".org $1000\nmain: rts\ndead: lda #CONST\nCONST = 5\n.org $2000\nlater: rts\n.export later\n")
+        self.assertEqual(self.removed(asm), ['dead'])
+        self.assertEqual(asm.symbols.get('CONST'), 5)
+        self.assertEqual(asm.symbols.get('later'), 0x2000)
+
+    def test_conditional_routine_kept(self):
+        asm = self.assemble(".org $1000\nmain: rts\nmaybe:\n.ifdef DEBUG\nbrk\n.endif\nrts\n")
+        self.assertEqual(self.removed(asm), [])
+
+    def test_split_routines(self):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(".org $1000\na1: nop\n1: jmp 1b\nb1: .byte 1\n"))
+        routines = split_routines(asm.parse_program())
+        self.assertEqual([r.name for r in routines], ['', 'a1', 'b1'])
+        self.assertFalse(routines[1].falls_through)
+        self.assertEqual((routines[2].first, routines[2].last), ('data', 'data'))
+
+if __name__ == '__main__':
+    unittest.main()
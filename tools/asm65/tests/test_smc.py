@@ -0,0 +1,60 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.parser import ParserError
+from lib.peephole import RULES
+
+class TestOperandLabels(unittest.TestCase):
+    def assemble(self, code, **kwargs):
+        asm = Assembler(**kwargs)
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_absolute_operand(self):
+        asm = self.assemble(".org $1000\nldx #0\nlda src: $FFFF,x\nsta $400,x\ninc src.hi\n")
+        self.assertEqual([asm.symbols.get(n) for n in ('src', 'src.lo', 'src.hi')], [0x1003, 0x1003, 0x1004])
+        self.assertEqual(asm.bytes, [0xA2, 0x00, 0xBD, 0xFF, 0xFF, 0x9D, 0x00, 0x04, 0xEE, 0x04, 0x10])
+
+    def test_no_zero_page_promotion(self):
+        asm = self.assemble(".org $1000\nlda ptr: $12,x\nlda $12,x\n")
+        self.assertEqual(asm.bytes, [0xBD, 0x12, 0x00, 0xB5, 0x12])
+
+    def test_one_byte_operand_has_no_hi(self):
+        asm = self.assemble(".org $1000\nlda n: #5\nsta n\n")
+        self.assertEqual(asm.symbols.get('n'), 0x1001)
+        self.assertIsNone(asm.symbols.get('n.hi'))
+        with self.assertRaises(CompilerError):
+            self.assemble(".org $1000\nlda n: #5\nsta n.hi\n")
+
+    def test_width_errors(self):
+        # STX zp,Y has no absolute form to patch with a full address
+        with self.assertRaises(CompilerError):
+            self.assemble("stx p: $12,y\n")
+        with self.assertRaises(ParserError):
+            self.assemble("inx n:\n")
+
+    def test_forward_reference(self):
+        asm = self.assemble(".org $1000\nlda #$20\nsta dst.hi\nsta dst: $0400\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x20, 0x8D, 0x07, 0x10, 0x8D, 0x00, 0x04])
+
+    def test_local_in_macro(self):
+        code = (".macro copy page\n.local src\nlda #page\nsta src.hi\nlda src: $0000\n.endm\n"
+                ".org $1000\ncopy $20\ncopy $30\n")
+        asm = self.assemble(code)
+        self.assertEqual(asm.bytes[:8], [0xA9, 0x20, 0x8D, 0x07, 0x10, 0xAD, 0x00, 0x00])
+        self.assertEqual(asm.bytes[8:13], [0xA9, 0x30, 0x8D, 0x0F, 0x10])
+
+    def test_optimizer_leaves_patched_instructions(self):
+        asm = self.assemble(".org $1000\nclc\nadc n: #0\nsta $2000\nrts\n", optimize=list(RULES))
+        self.assertEqual(asm.bytes, [0x18, 0x69, 0x00, 0x8D, 0x00, 0x20, 0x60])
+
+    def test_optimizer_keeps_patched_jump_target(self):
+        # Jumps to a trampoline whose target is patched must not be shortcut
+        code = ".org $1000\njmp tramp\ntramp: jmp vec: handler1\nhandler1: rts\n"
+        asm = self.assemble(code, optimize=list(RULES))
+        self.assertEqual(asm.bytes[:3], [0x4C, 0x03, 0x10])
+
+if __name__ == '__main__':
+    unittest.main()
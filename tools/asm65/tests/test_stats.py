@@ -0,0 +1,68 @@
+import unittest
+import cProfile
+from io import StringIO
+from lib.asm import Assembler
+from lib.stats import BuildStats, PHASES, profile_summary
+
+class TestStats(unittest.TestCase):
+    def assemble(self, code, stats):
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return asm
+
+    def test_phase_times_and_counts(self):
+        stats = BuildStats()
+        code = """
+        .org $1000
+        start:
+            lda #$01
+            sta $0400
+        .ifdef DEBUG
+            nop
+        .endif
+            jmp start
+        """
+        asm = self.assemble(code, stats)
+        data = stats.as_dict()
+
+        self.assertEqual(set(data['phases']), set(PHASES))
+        for phase in ('tokenize', 'parse', 'pass1', 'pass2'):
+            self.assertGreater(data['phases'][phase], 0.0, phase)
+        # org, label, 3 instructions, ifdef and its nop
+        self.assertEqual(data['counts']['statements'], 7)
+        self.assertEqual(data['counts']['bytes'], len(asm.bytes))
+        self.assertEqual(data['counts']['symbols'], len(asm.symbols.symbols))
+        self.assertGreater(data['counts']['tokens'], 20)
+        self.assertGreater(data['rates']['tokens_per_sec'], 0)
+        self.assertIsNone(data['peak_memory'])
+        self.assertFalse(data['memory_traced'])
+
+    def test_peak_memory(self):
+        stats = BuildStats(trace_memory=True)
+        stats.start_memory()
+        self.assemble("nop\n", stats)
+        stats.stop_memory()
+        self.assertGreater(stats.as_dict()['peak_memory'], 0)
+        self.assertTrue(stats.as_dict()['memory_traced'])
+        self.assertIn("timed under tracemalloc", stats.format())
+
+    def test_stats_accumulate(self):
+        stats = BuildStats()
+        self.assemble("nop\n", stats)
+        first = stats.counts['tokens']
+        self.assemble("nop\n", stats)
+        self.assertEqual(stats.counts['tokens'], first * 2)
+
+    def test_profile_summary_only_lib(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        self.assemble("lda #1\nrts\n", None)
+        profiler.disable()
+        hotspots = profile_summary(profiler)
+        self.assertTrue(hotspots)
+        for entry in hotspots:
+            self.assertTrue(entry['file'].startswith("lib/"), entry['file'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.parser import ParserError
+from lib.stats import BuildStats
+from lib.string import build_pool, encode_text
+
+class TestStringDirectives(unittest.TestCase):
+    def assemble(self, code, stats=None):
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return asm
+
+    def test_ascii_hi(self):
+        asm = self.assemble('.ascii_hi "AB", 13\n')
+        self.assertEqual(asm.bytes, [0xC1, 0xC2, 0x8D])
+
+    def test_asciiz_hi(self):
+        asm = self.assemble('.asciiz_hi "OK"\n')
+        self.assertEqual(asm.bytes, [0xCF, 0xCB, 0x00])
+
+    def test_asciiz(self):
+        asm = self.assemble('.asciiz "OK"\n')
+        self.assertEqual(asm.bytes, [ord('O'), ord('K'), 0])
+
+    def test_pstring(self):
+        asm = self.assemble('.pstring "HELLO"\n')
+        self.assertEqual(asm.bytes, [5] + list(b"HELLO"))
+
+    def test_labels_after_strings(self):
+        asm = self.assemble('.org $800\nmsg: .asciiz_hi "HI"\nnext: rts\n')
+        self.assertEqual(asm.symbols.get('next'), 0x803)
+
+    def test_errors(self):
+        with self.assertRaises(ParserError):
+            self.assemble('.ascii_hi label\n')
+        with self.assertRaises(ParserError):
+            self.assemble('.pstring "%s"\n' % ("x" * 256))
+
+class TestStringPool(unittest.TestCase):
+    def assemble(self, code, stats=None):
+        asm = Assembler(stats=stats)
+        asm.assemble_stream(StringIO(code))
+        asm.parse()
+        return asm
+
+    def test_build_pool(self):
+        hello = encode_text('.asciiz', ["HELLO"])
+        lo = encode_text('.asciiz', ["LO"])
+        blob, offsets = build_pool([(hello, True), (lo, True), (hello, True), (b"LO", False)])
+        self.assertEqual(blob, b"HELLO\x00LO")
+        self.assertEqual(offsets, [0, 3, 0, 6])
+
+    def test_suffix_chain(self):
+        strings = [(encode_text('.asciiz', [s]), True) for s in ("D", "CD", "BCD", "ABCD", "XD")]
+        blob, offsets = build_pool(strings)
+        self.assertEqual(len(blob), len(b"ABCD\x00XD\x00"))
+        for (data, _), offset in zip(strings, offsets):
+            self.assertEqual(blob[offset:offset + len(data)], data)
+
+    def test_pool_labels_and_savings(self):
+        stats = BuildStats()
+        asm = self.assemble(
+            ".org $1000\n"
+            "lda #<msg_lo\n"
+            ".strpool\n"
+            "msg_hello: .asciiz_hi \"HELLO\"\n"
+            "msg_lo:\n"
+            "    .asciiz_hi \"LO\"\n"
+            "msg_again: .asciiz_hi \"HELLO\"\n"
+            ".endpool\n"
+            "end: rts\n", stats=stats)
+        self.assertEqual(asm.symbols.get('msg_hello'), 0x1002)
+        self.assertEqual(asm.symbols.get('msg_again'), 0x1002)
+        self.assertEqual(asm.symbols.get('msg_lo'), 0x1005)
+        self.assertEqual(asm.symbols.get('end'), 0x1008)
+        self.assertEqual(asm.bytes[:2], [0xA9, 0x05])
+        self.assertEqual(stats.counts['strpool_saved'], 9)
+
+    def test_pool_rejects_code(self):
+        with self.assertRaises(ParserError):
+            self.assemble(".strpool\nnop\n.endpool\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".strpool\ndangling:\n.endpool\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".strpool\nmsg: .asciiz \"X\"\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.parser import ParserError
+from lib.structs import StructError, StructLayout, aos_labels, soa_labels
+
+LINE = ".struct Line\n    len\n    ptr, 2\n    flags\n.end\n"
+
+class TestStructLayout(unittest.TestCase):
+    def layout(self):
+        layout = StructLayout('Line')
+        for name, size in (('len', 1), ('ptr', 2), ('flags', 1)):
+            layout.add(name, size)
+        return layout
+
+    def test_offsets(self):
+        self.assertEqual(self.layout().symbols(),
+                         [('Line.len', 0), ('Line.ptr', 1), ('Line.flags', 3), ('Line.size', 4)])
+
+    def test_aos(self):
+        labels, end = aos_labels('recs', self.layout(), 3, 0x2000)
+        self.assertEqual(dict(labels), {'recs': 0x2000, 'recs.len': 0x2000, 'recs.ptr': 0x2001, 'recs.flags': 0x2003})
+        self.assertEqual(end, 0x200C)
+
+    def test_soa_arrays_do_not_cross_pages(self):
+        labels, end = soa_labels('lines', self.layout(), 100, 0x20F0)
+        labels = dict(labels)
+        self.assertEqual(labels['lines'], 0x2100)
+        self.assertEqual((labels['lines.ptr.lo'], labels['lines.ptr.hi']), (0x2164, 0x2200))
+        self.assertEqual(labels['lines.flags'], 0x2264)
+        self.assertEqual(end, 0x22C8)
+
+    def test_soa_page_aligned(self):
+        labels, end = soa_labels('lines', self.layout(), 8, 0x2001, page=True)
+        labels = dict(labels)
+        self.assertEqual([labels[n] for n in ('lines.len', 'lines.ptr.lo', 'lines.ptr.hi', 'lines.flags')],
+                         [0x2100, 0x2200, 0x2300, 0x2400])
+        self.assertEqual(end, 0x2408)
+
+    def test_errors(self):
+        with self.assertRaises(StructError):
+            self.layout().add('len', 1)
+        with self.assertRaises(StructError):
+            self.layout().add('size', 1)
+        with self.assertRaises(StructError):
+            soa_labels('big', self.layout(), 257, 0)
+
+class TestStructDirectives(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_field_symbols(self):
+        asm = self.assemble(LINE + "lda #Line.size\nldy #Line.flags\n")
+        self.assertEqual(asm.bytes, [0xA9, 0x04, 0xA0, 0x03])
+
+    def test_soa_indexed_fields(self):
+        asm = self.assemble(".org $1000\n" + LINE +
+                            "lda lines.len,x\nlda lines.ptr.hi,x\n.soa lines, Line, 16\nend: rts\n")
+        self.assertEqual(asm.bytes[:6], [0xBD, 0x06, 0x10, 0xBD, 0x26, 0x10])
+        self.assertEqual(asm.symbols.get('end'), 0x1006 + 4 * 16)
+        self.assertEqual(asm.bytes[6:-1], [0] * 64)
+
+    def test_aos_fields(self):
+        asm = self.assemble(".org $1000\n" + LINE + ".aos recs, Line, 2\nlda recs.flags,y\n")
+        self.assertEqual(asm.symbols.get('recs.flags'), 0x1003)
+        self.assertEqual(asm.bytes[8:], [0xB9, 0x03, 0x10])
+
+    def test_size_from_expression(self):
+        asm = self.assemble("WIDTH = 40\n.struct Row\n    text, WIDTH\n    attr\n.end\n.aos rows, Row, 2\n")
+        self.assertEqual(asm.symbols.get('Row.size'), 41)
+        self.assertEqual(len(asm.bytes), 82)
+
+    def test_errors(self):
+        with self.assertRaises(CompilerError):
+            self.assemble(".aos x, Missing, 2\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(LINE + ".soa x, Line, 300\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".struct Empty\n.end\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".struct Open\n    a\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.parser import ParserError
+from lib.tables import TableError, TableExpression, crc16, encode_table, hgr_row, text_row
+
+class TestTableGenerators(unittest.TestCase):
+    def test_row_addresses(self):
+        self.assertEqual([text_row(r) for r in (0, 1, 8, 23)], [0x400, 0x480, 0x428, 0x7D0])
+        self.assertEqual([hgr_row(y) for y in (0, 1, 8, 64, 191)], [0x2000, 0x2400, 0x2080, 0x2028, 0x3FD0])
+
+    def test_crc16(self):
+        self.assertEqual([crc16(i) for i in (0, 1, 255)], [0x0000, 0x1021, 0x1EF0])
+
+    def test_expression(self):
+        expr = TableExpression("($10 + i) * 2 if i < 2 else -1")
+        self.assertEqual(expr.evaluate(3), [32, 34, -1])
+        self.assertEqual(TableExpression("i * SCALE + count").symbols, ['SCALE'])
+
+    def test_expression_whitelist(self):
+        for text in ("__import__('os')", "i.real", "[i]", "lambda: 1", "open(i)"):
+            with self.assertRaises(TableError, msg=text):
+                TableExpression(text)
+
+    def test_encode(self):
+        self.assertEqual(encode_table([1, -1, 255], 'byte'), bytes([1, 0xFF, 0xFF]))
+        self.assertEqual(encode_table([0x1234, 0x5678], 'word'), bytes([0x34, 0x12, 0x78, 0x56]))
+        self.assertEqual(encode_table([0x1234, 0x5678], 'split'), bytes([0x34, 0x78, 0x12, 0x56]))
+        with self.assertRaises(TableError):
+            encode_table([256], 'byte')
+
+class TestTableDirective(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_builtin_split(self):
+        asm = self.assemble(".org $1000\n.table rows, text_rows\nend: rts\n")
+        self.assertEqual(asm.symbols.get('rows.lo'), 0x1000)
+        self.assertEqual(asm.symbols.get('rows.hi'), 0x1018)
+        self.assertEqual(asm.symbols.get('end'), 0x1030)
+        self.assertEqual(asm.bytes[:3], [0x00, 0x80, 0x00])
+        self.assertEqual(asm.bytes[24:27], [0x04, 0x04, 0x05])
+
+    def test_builtin_sizes(self):
+        asm = self.assemble(".table h, hgr_rows\n.table s, squares\n.table c, crc16\n.table m, mul40\n")
+        self.assertEqual(len(asm.bytes), 2 * (192 + 512 + 256 + 24))
+        self.assertEqual(asm.symbols.get('s.hi') - asm.symbols.get('s.lo'), 512)
+
+    def test_expression_table_with_symbols(self):
+        asm = self.assemble(".org $1000\nlda tab,x\n.table tab, 4, \"i * STEP\"\nSTEP = 3\n")
+        self.assertEqual(asm.bytes[3:], [0, 3, 6, 9])
+
+    def test_word_table(self):
+        asm = self.assemble(".table addr, 2, \"$2000 + i * $100\", word\n")
+        self.assertEqual(asm.bytes, [0x00, 0x20, 0x00, 0x21])
+
+    def test_count_from_symbol(self):
+        asm = self.assemble("N = 3\n.table t, N, \"255 - i\"\n")
+        self.assertEqual(asm.bytes, [255, 254, 253])
+
+    def test_split_labels_in_operands(self):
+        asm = self.assemble(".org $1000\nlda t.lo,x\nldy t.hi,x\n.table t, 2, \"i + $100\", split\n")
+        self.assertEqual(asm.bytes[:6], [0xBD, 0x06, 0x10, 0xBC, 0x08, 0x10])
+
+    def test_errors(self):
+        with self.assertRaises(ParserError):
+            self.assemble(".table t, 4, \"i +\"\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".table t, 4, \"i\", dword\n")
+        with self.assertRaises(ParserError):
+            self.assemble(".table t, 4, \"i * 100\"\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".table t, 4, \"i * UNKNOWN\"\n")
+
+if __name__ == '__main__':
+    unittest.main()
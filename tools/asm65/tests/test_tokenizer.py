@@ -57,5 +57,22 @@ class TestTokenizer(unittest.TestCase):
         self.assertEqual(tokens[1].type, TokenType.NUM) # 'a' is parsed as NUM in our tokenizer logic
         self.assertEqual(tokens[1].value, 97) # ord('a')
 
+    def test_long_input_positions(self):
+        # Tokens are matched in place, so line numbers stay right deep into a file
+        text = "".join(f"l{i}: lda #${i & 0xFF:02X}\n" for i in range(2000))
+        tokens = self.tokenize(text)
+        self.assertEqual(len(tokens), 2000 * 6 + 1)
+        last_num = tokens[-3]
+        self.assertEqual(last_num.value, 1999 & 0xFF)
+        self.assertEqual(last_num.line, 2000)
+
+    def test_first_match_wins(self):
+        # 1f is a local label reference, 0x1f and $1f are numbers
+        tokens = self.tokenize("1f 0x1f $1f 12")
+        self.assertEqual([t.type for t in tokens[:4]], [
+            TokenType.LOCAL_LABEL_REF, TokenType.NUM, TokenType.NUM, TokenType.NUM
+        ])
+        self.assertEqual(tokens[1].value, 0x1F)
+
 if __name__ == '__main__':
     unittest.main()
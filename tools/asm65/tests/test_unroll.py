@@ -0,0 +1,92 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.parser import ParserError
+from lib.unroll import UnrollError, cycles, plan
+
+class TestUnrollPlan(unittest.TestCase):
+    def test_full_unroll_by_default(self):
+        p = plan('fill', 40)
+        self.assertEqual((p.iterations, p.remainder), (0, 40))
+        self.assertEqual(cycles(p, 0, 0x400), 160)
+        self.assertEqual(cycles(plan('copy', 40), 0x480, 0x400), 320)
+
+    def test_loop_with_remainder(self):
+        p = plan('fill', 42, 1, 8)
+        self.assertEqual((p.iterations, p.unroll, p.remainder), (5, 8, 2))
+        self.assertFalse(p.counts_up)
+        # LDX, 5 x (8 STA abs,X + DEX + BNE), last BNE not taken, 2 STA abs
+        self.assertEqual(cycles(p, 0, 0x2000), 2 + 5 * (8 * 5 + 2) + 4 * 3 + 2 + 2 * 4)
+
+    def test_full_page_counts_up(self):
+        p = plan('fill', 1024, 1, 4)
+        self.assertTrue(p.counts_up)
+        self.assertEqual(cycles(p, 0, 0x400), 6401)
+
+    def test_page_crossing_loads(self):
+        p = plan('copy', 16, 1, 4)
+        # Counting X down from 4 to 1, the body accesses base - 1 + 4t,X
+        aligned = cycles(p, 0x2001, 0x3001)
+        # The third load of the body is LDA $20FF,X, which crosses for every X from 4 down to 1
+        self.assertEqual(cycles(p, 0x20F8, 0x3001), aligned + 4)
+
+    def test_errors(self):
+        with self.assertRaises(UnrollError):
+            plan('fill', 1024, 1, 2)
+        with self.assertRaises(UnrollError):
+            plan('fill', 64, 8, 2)
+        with self.assertRaises(UnrollError):
+            plan('fill', 0)
+
+class TestUnrollDirectives(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_fill_straight_line(self):
+        asm = self.assemble(".org $1000\n.unroll_fill $400, 3\n")
+        self.assertEqual(asm.bytes, [0x8D, 0x00, 0x04, 0x8D, 0x01, 0x04, 0x8D, 0x02, 0x04])
+        self.assertEqual(asm.compiler.unrolled[0].cycles_per_byte, 4)
+
+    def test_fill_loop(self):
+        asm = self.assemble(".org $1000\n.unroll_fill $400, 1024, 1, 4\n")
+        self.assertEqual(asm.bytes, [0xA2, 0x00, 0x9D, 0x00, 0x04, 0x9D, 0x00, 0x05, 0x9D, 0x00, 0x06,
+                                     0x9D, 0x00, 0x07, 0xE8, 0xD0, 0xF1])
+
+    def test_copy_loop_with_stride(self):
+        asm = self.assemble(".org $1000\n.unroll_copy src, $2000, 4, 2, 2\nsrc: .byte 1\n")
+        # X = 4, 2; element k at base + 2k; the loop covers elements 0-1 and 2-3
+        self.assertEqual(asm.bytes[:2], [0xA2, 0x04])
+        src = asm.symbols.get('src')
+        self.assertEqual(asm.bytes[2:5], [0xBD, (src - 2) & 0xFF, (src - 2) >> 8])
+        self.assertEqual(asm.bytes[5:8], [0x9D, 0xFE, 0x1F])
+        self.assertEqual(asm.bytes[8:11], [0xBD, (src + 2) & 0xFF, (src + 2) >> 8])
+        self.assertEqual(asm.bytes[11:14], [0x9D, 0x02, 0x20])
+        self.assertEqual(asm.bytes[14:18], [0xCA, 0xCA, 0xD0, 0xF0])
+
+    def test_zero_page_area(self):
+        asm = self.assemble(".unroll_copy $80, $90, 2\n")
+        self.assertEqual(asm.bytes, [0xA5, 0x80, 0x85, 0x90, 0xA5, 0x81, 0x85, 0x91])
+        with self.assertRaises(CompilerError):
+            self.assemble(".unroll_fill $F0, 64, 1, 2\n")
+
+    def test_forward_reference(self):
+        asm = self.assemble(".org $1000\n.unroll_fill buf, 2\nafter: jmp after\nbuf = $400\n")
+        self.assertEqual(asm.bytes, [0x8D, 0x00, 0x04, 0x8D, 0x01, 0x04, 0x4C, 0x06, 0x10])
+        # A zero-page area would change the layout of pass 1
+        with self.assertRaises(CompilerError):
+            self.assemble(".org $1000\n.unroll_fill buf, 4\nafter: jmp after\nbuf = $10\n")
+
+    def test_errors(self):
+        with self.assertRaises(ParserError):
+            self.assemble(".unroll_fill $400\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".unroll_copy $400, $800, 256, 1, 32\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".unroll_fill $400, N\nN = 4\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from io import StringIO
+from lib.asm import Assembler
+from lib.compiler import CompilerError
+from lib.zpalloc import AllocationError, ZeroPageAllocator, ZpVar
+
+class TestZeroPageAllocator(unittest.TestCase):
+    def test_pointers_then_density(self):
+        zp = ZeroPageAllocator(ranges=[(0x06, 0x09)])
+        wide = ZpVar('wide', 2, None, accesses=10)
+        hot = ZpVar('hot', 1, None, accesses=6)
+        ptr = ZpVar('ptr', 2, None, accesses=1, pointer=True)
+        zp.allocate([wide, hot, ptr])
+        self.assertEqual((ptr.address, hot.address), (0x06, 0x08))
+        # wide does not fit in the one byte left
+        self.assertEqual(wide.address, 0x0300)
+        self.assertFalse(wide.in_zero_page)
+
+    def test_multi_byte_stays_in_one_range(self):
+        zp = ZeroPageAllocator(ranges=[(0x08, 0x09), (0xFA, 0xFF)])
+        small = ZpVar('small', 1, None, accesses=5)
+        big = ZpVar('big', 3, None)
+        zp.allocate([small, big])
+        self.assertEqual((small.address, big.address), (0x08, 0xFA))
+
+    def test_pointer_cannot_overflow(self):
+        zp = ZeroPageAllocator(ranges=[(0x06, 0x06)])
+        with self.assertRaises(AllocationError):
+            zp.allocate([ZpVar('ptr', 2, None, pointer=True)])
+
+    def test_overflow_full(self):
+        zp = ZeroPageAllocator(ranges=[(0x06, 0x06)], overflow=(0x300, 0x301))
+        with self.assertRaises(AllocationError):
+            zp.allocate([ZpVar('a', 1, None), ZpVar('b', 4, None)])
+
+class TestZpVarDirectives(unittest.TestCase):
+    def assemble(self, code):
+        asm = Assembler()
+        asm.assemble_stream(StringIO(code), "t.asm")
+        asm.parse()
+        return asm
+
+    def test_default_ranges_and_zp_encoding(self):
+        asm = self.assemble(".zpvar count\n.zpvar ptr, 2\n.org $1000\nlda (ptr),y\ninc count\n")
+        self.assertEqual(asm.symbols.get('ptr'), 0x06)
+        self.assertEqual(asm.symbols.get('count'), 0x08)
+        self.assertEqual(asm.bytes, [0xB1, 0x06, 0xE6, 0x08])
+
+    def test_use_before_declaration_is_zero_page(self):
+        # No forward-reference surprise: the address is known before pass 1
+        asm = self.assemble(".org $1000\nstart: lda flag\nbeq start\n.zpvar flag\n")
+        self.assertEqual(asm.bytes, [0xA5, 0x06, 0xF0, 0xFC])
+
+    def test_frequent_variables_win(self):
+        asm = self.assemble(
+            ".zprange $80, $80\n"
+            ".zpvar rare\n"
+            ".zpvar hot\n"
+            ".org $1000\n"
+            "lda rare\n"
+            "loop: inc hot\n"
+            "bne loop\n")
+        self.assertEqual(asm.symbols.get('hot'), 0x80)
+        self.assertEqual(asm.symbols.get('rare'), 0x0300)
+        self.assertEqual(asm.bytes[:3], [0xAD, 0x00, 0x03])
+        self.assertEqual(len(asm.compiler.warnings), 1)
+
+    def test_ranges_and_overflow_directives(self):
+        asm = self.assemble(".zprange $E0, $E0\n.zprange $F0, $F1\n.zpoverflow $9000, $90FF\n"
+                            ".zpvar a1\n.zpvar a2, 2\n.zpvar a3\n")
+        self.assertEqual([asm.symbols.get(n) for n in ('a1', 'a2', 'a3')], [0xE0, 0xF0, 0x9000])
+
+    def test_shared_across_files(self):
+        asm = Assembler()
+        for code in (".zpvar one\n", ".zpvar two\n"):
+            asm.assemble_stream(StringIO(code))
+            asm.parse()
+        self.assertEqual((asm.symbols.get('one'), asm.symbols.get('two')), (0x06, 0x07))
+        self.assertIn("one", asm.compiler.zero_page.format())
+
+    def test_conditional_declarations(self):
+        asm = Assembler()
+        asm.define('BIG')
+        asm.assemble_stream(StringIO(".ifdef BIG\n.zpvar x, 4\n.else\n.zpvar y\n.endif\n.zpvar z\n"))
+        asm.parse()
+        self.assertEqual(asm.symbols.get('x'), 0x06)
+        self.assertNotIn('y', asm.symbols)
+        self.assertEqual(asm.symbols.get('z'), 0xEB)
+
+    def test_errors(self):
+        with self.assertRaises(CompilerError):
+            self.assemble("count = 1\n.zpvar count\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".zpvar v, 0\n")
+        with self.assertRaises(CompilerError):
+            self.assemble(".zprange $F0, $100\n")
+
+if __name__ == '__main__':
+    unittest.main()